@@ -1,53 +1,31 @@
-import json
-import pandas as pd
-import uuid
-import psycopg2
-from psycopg2.extras import execute_batch
-
-# 📌 Corrected PostgreSQL Connection Details for psycopg2
-db_params = {
-    "dbname": "fetchRewards",
-    "user": "postgres",
-    "password": "<password>",
-    "host": "localhost",
-    "port": "5432"
-}
-
-# Function to load JSON safely
-def load_json_data(file_path):
-    data = []
-    with open(file_path, 'r') as file:
-        first_char = file.read(1)
-        file.seek(0)
-
-        if first_char == "[":  # JSON Array
-            data = json.load(file)
-        else:  # NDJSON (one JSON object per line)
-            for line in file:
-                try:
-                    data.append(json.loads(line.strip()))
-                except json.JSONDecodeError as e:
-                    print(f"Error decoding JSON: {e}")
-
-    return pd.DataFrame(data)
-
-# Function to validate and format UUID
-def validate_uuid(value):
-    try:
-        return str(uuid.UUID(value))  # Converts valid UUID to a standard format
-    except (ValueError, TypeError):
-        return str(uuid.uuid4())  # Generates a new UUID if invalid
-
-# Process and format brands data
-def process_brands_data(df):
-    brands_data = []
-
-    for _, row in df.iterrows():
+import argparse
+from bulkLoader import DEFAULT_COMMIT_ROWS, BulkWriter
+from dbPool import pooled_connection
+from fetchEtl.config import db_params, paths
+from checkpointStore import CheckpointStore
+from columnarExtract import is_extract_dir
+from jsonStream import DEFAULT_BATCH_SIZE, iter_batches, iter_positioned_records
+from loadDiagnostics import DIAGNOSTICS
+from loadMetrics import METRICS, add_metrics_arguments, run_instrumented, timed_iter
+from rowBatches import BrandBatch
+from idNormalizer import stable_record_id
+
+# Process and format brands data (accepts a DataFrame or any iterable of parsed brand dicts)
+def process_brands_data(records):
+    brands_data = BrandBatch()
+
+    if hasattr(records, "iterrows"):  # A DataFrame (checked without importing pandas)
+        records = (row for _, row in records.iterrows())
+
+    for row in records:
         try:
             # Validate and format brand_id
-            brand_id = validate_uuid(row["_id"]["$oid"]) if "_id" in row and "$oid" in row["_id"] else str(uuid.uuid4())
+            # Same UUID on every load: the `_id` (ObjectIds mapped into UUID space), else the record's content
+            brand_id = stable_record_id(row)
+            if not isinstance(row.get("_id"), dict) or not row["_id"].get("$oid"):
+                DIAGNOSTICS.defaulted("brands", "missing_brand_id", brand_id)
 
-            brand_record = (
+            brands_data.append(
                 brand_id,  # UUID
                 row.get("name", "Unknown Brand"),  # Brand title
                 row.get("category", None),  # Category
@@ -56,36 +34,81 @@ def process_brands_data(df):
                 bool(row.get("topBrand", False))  # Ensure boolean type
             )
 
-            brands_data.append(brand_record)
-
         except Exception as e:
-            print(f"Skipping row due to error: {e}")
+            DIAGNOSTICS.skipped("brands", "transform_error", str(e))
 
     return brands_data
 
-# Load and process brands.json
-brands_df = load_json_data("brands.json")
-brands_data = process_brands_data(brands_df)
-
-# Insert data into PostgreSQL table using psycopg2 execute_batch
-try:
-    # Connect to PostgreSQL using psycopg2 with corrected DSN format
-    conn = psycopg2.connect(**db_params)
-    cursor = conn.cursor()
-
-    insert_query = """
-        INSERT INTO dim_brands (brand_id, brand_title, brand_category, brand_category_code, brand_barcode, is_top_brand)
-        VALUES (%s, %s, %s, %s, %s, %s)
-        ON CONFLICT (brand_id) DO NOTHING;
-    """
-
-    execute_batch(cursor, insert_query, brands_data)  # Perform batch insert
+# Stream (checkpoint path, position, record count, rows) batches from brands.json or from an extract directory
+def brand_batches(file_path, batch_size, checkpoints, restart=False, validator=None):
+    if is_extract_dir(file_path):
+        from columnarExtract import brands_batch_rows, iter_extract_rows, validate_brands_extract
+        if validator is not None:
+            validate_brands_extract(file_path, validator)  # Counted from the stored rule failures
+        batches = iter_extract_rows(file_path, "brands", brands_batch_rows, checkpoints, batch_size, restart)
+        for part_path, position, rows in timed_iter(batches, "read_extract", source="brands"):
+            yield part_path, position, len(rows), rows
+        return
+
+    if restart:
+        checkpoints.reset(file_path)
+    batches = iter_batches(iter_positioned_records(file_path, checkpoints.resume_position(file_path)), batch_size)
+    for batch in timed_iter(batches, "parse", source="brands"):
+        records = [record for _, record in batch]
+        METRICS.inc("rows_parsed_total", len(records), source="brands")
+        if validator is not None:
+            with METRICS.timer("validate", source="brands"):
+                validator.observe_many(records)  # Validate the records already parsed for loading
+        with METRICS.timer("transform", source="brands"):
+            brands_data = process_brands_data(records)
+        yield file_path, batch[-1][0], len(batch), brands_data
+
+# Load brands.json batch by batch, resuming after the last committed batch (`delta` also updates changed brands).
+# Returns False when the load stopped on an error or any write failed (and was rolled back).
+def main(file_path="brands.json", batch_size=DEFAULT_BATCH_SIZE, restart=False, validate=False,
+         commit_rows=DEFAULT_COMMIT_ROWS, delta=False, checkpoints=None):
+    if checkpoints is None:
+        checkpoints = CheckpointStore()
+
+    validator = None
+    if validate:
+        from validationRules import brand_validator
+        validator = brand_validator()
 
-    conn.commit()
-    cursor.close()
-    conn.close()
-
-    print(f"{len(brands_data)} records attempted for insertion into dim_brands.")
-
-except Exception as e:
-    print(f"Error inserting data: {e}")
+    try:
+        total_records = 0
+        with pooled_connection(db_params) as conn:
+            writer = BulkWriter(conn, commit_rows, upsert=delta)
+            batches = brand_batches(file_path, batch_size, checkpoints, restart, validator)
+            for checkpoint_path, position, count, brands_data in batches:
+                writer.write("dim_brands", brands_data)
+                # The checkpoint only moves once the batch's transaction is committed
+                writer.end_batch(lambda succeeded, path=checkpoint_path, position=position, count=count:
+                                 checkpoints.commit_batch(path, position, count, succeeded))
+                total_records += len(brands_data)
+            writer.commit()
+
+        print(f"{total_records} records attempted for insertion into dim_brands.")
+        writer.report()
+        if validator is not None:
+            validator.report()
+        return writer.errors == 0
+
+    except Exception as e:
+        print(f"Error inserting data: {e}")
+        return False
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load brands.json into dim_brands.")
+    parser.add_argument("file_path", nargs="?", default=paths["brands"], help="brands.json or a columnarExtract.py output directory")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--restart", action="store_true", help="Ignore the saved checkpoint and start from the beginning")
+    parser.add_argument("--validate", action="store_true", help="Also print the data quality report for the loaded records")
+    parser.add_argument("--commit-rows", type=int, default=DEFAULT_COMMIT_ROWS,
+                        help="Commit after this many written rows (0 commits every write)")
+    parser.add_argument("--delta", action="store_true",
+                        help="Also update rows whose content changed (needs migrations/001_dimension_row_hash.sql)")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    run_instrumented(main, args, file_path=args.file_path, batch_size=args.batch_size, restart=args.restart,
+                     validate=args.validate, commit_rows=args.commit_rows, delta=args.delta)
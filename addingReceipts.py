@@ -1,90 +1,71 @@
-import json
-import pandas as pd
-import uuid
-import psycopg2
-from psycopg2.extras import execute_batch
-
-# 📌 PostgreSQL Connection Details
-db_params = {
-    "dbname": "fetchRewards",
-    "user": "postgres",
-    "password": "<password>",
-    "host": "localhost",
-    "port": "5432"
-}
+import argparse
+import time
+from bulkLoader import DEFAULT_COMMIT_ROWS, BulkWriter
+from dbPool import pooled_connection
+from dimensionCache import DimensionKeyCache
+from fetchEtl.config import db_params, paths
+from factPartitions import write_partitioned
+from checkpointStore import CheckpointStore
+from columnarExtract import date_ms, is_extract_dir
+from jsonStream import DEFAULT_BATCH_SIZE, is_json_array, iter_batches, iter_positioned_records
+from loadDiagnostics import DIAGNOSTICS
+from loadMetrics import METRICS, add_metrics_arguments, run_instrumented, timed_iter
+from receiptIds import RECEIPT_NAMESPACE, stable_item_id, stable_receipt_id
+from rowBatches import ReceiptBatch, ReceiptItemBatch
+from idNormalizer import BRAND_IDS, USER_IDS, normalize_id
 
 # Default UUIDs for missing values
 DEFAULT_USER_ID = "00000000-0000-0000-0000-000000000000"
 DEFAULT_BRAND_ID = "00000000-0000-0000-0000-000000000000"
 
-# Function to validate and format UUID
-def validate_uuid(value):
-    try:
-        return str(uuid.UUID(value))  # Convert to valid UUID
-    except (ValueError, TypeError):
-        return None  # Return None if invalid
-
-# Function to safely extract timestamps
-def extract_timestamp(value):
-    if isinstance(value, dict) and "$date" in value:
-        return pd.to_datetime(value["$date"], unit="ms")
-    return None  # Return None if the value is not valid
-
-# Load JSON data
-def load_json_data(file_path):
-    data = []
-    with open(file_path, 'r') as file:
-        for line in file:
-            try:
-                data.append(json.loads(line.strip()))
-            except json.JSONDecodeError as e:
-                print(f"Error decoding JSON: {e}")
-    return pd.DataFrame(data)
+# Key caches already loaded in this process, so later loads only fetch keys added since
+_dimension_caches = {}
+
+# Load (or incrementally refresh) the cached key set of a dimension table
+def get_dimension_keys(table_name, key_column, full_refresh=False):
+    cache = _dimension_caches.get(table_name)
+    if cache is None:
+        cache = _dimension_caches[table_name] = DimensionKeyCache(table_name, key_column)
+    with METRICS.timer("lookup", table=table_name), pooled_connection(db_params) as conn:
+        cache.refresh(conn, full=full_refresh)
+    return cache
 
 # Fetch valid user IDs from dim_users
-def get_valid_user_ids():
-    conn = psycopg2.connect(**db_params)
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_id FROM dim_users;")
-    valid_users = {row[0] for row in cursor.fetchall()}  # Set for quick lookup
-    cursor.close()
-    conn.close()
-    return valid_users
+def get_valid_user_ids(full_refresh=False):
+    return get_dimension_keys("dim_users", "user_id", full_refresh)
 
 # Fetch valid brand IDs from dim_brands
-def get_valid_brand_ids():
-    conn = psycopg2.connect(**db_params)
-    cursor = conn.cursor()
-    cursor.execute("SELECT brand_id FROM dim_brands;")
-    valid_brands = {row[0] for row in cursor.fetchall()}  # Set for quick lookup
-    cursor.close()
-    conn.close()
-    return valid_brands
-
-# Process receipts data
-def process_receipts_data(df, valid_user_ids, valid_brand_ids):
-    receipts_data = []
-    receipt_items_data = []
-
-    for _, row in df.iterrows():
+def get_valid_brand_ids(full_refresh=False):
+    return get_dimension_keys("dim_brands", "brand_id", full_refresh)
+
+# Process receipts data (accepts a DataFrame or any iterable of parsed receipt dicts) into compact batches
+def process_receipts_data(records, valid_user_ids, valid_brand_ids):
+    receipts_data = ReceiptBatch()
+    receipt_items_data = ReceiptItemBatch()
+
+    if hasattr(records, "iterrows"):  # A DataFrame (checked without importing pandas)
+        records = (row for _, row in records.iterrows())
+
+    for row in records:
         try:
-            # 🔹 Ensure `receipt_id` is never NULL
+            # 🔹 Ensure `receipt_id` is never NULL (and is the same on every reload)
             receipt_id = None
             if isinstance(row.get("_id"), dict) and "$oid" in row["_id"]:
-                receipt_id = validate_uuid(row["_id"]["$oid"])
+                receipt_id = normalize_id(row["_id"]["$oid"], RECEIPT_NAMESPACE)  # UUID, or ObjectId mapped into one
             if not receipt_id:
-                receipt_id = str(uuid.uuid4())  # Generate a new UUID if missing
-                print(f"⚠️ Missing or invalid `_id`. Generated new UUID: {receipt_id}")
+                receipt_id = stable_receipt_id(row)  # Derived from the raw `_id` or the record's content
+                DIAGNOSTICS.defaulted("receipts", "invalid_receipt_id", receipt_id)
 
-            receipt_user_id = validate_uuid(row.get("userId"))
+            receipt_user_id = USER_IDS(row.get("userId"))  # Memoized: most receipts share a handful of users
             if not receipt_user_id or receipt_user_id not in valid_user_ids:
-                print(f"⚠️ Receipt {receipt_id} has an unknown user {receipt_user_id}. Assigning to default user.")
+                DIAGNOSTICS.defaulted("receipts", "unknown_user", receipt_id)  # Assigned to the default user
                 receipt_user_id = DEFAULT_USER_ID
 
-            purchase_timestamp = extract_timestamp(row.get("purchaseDate"))
-            scanned_date = extract_timestamp(row.get("dateScanned"))
-            processing_finished_date = extract_timestamp(row.get("finishedDate"))
-            points_awarded_timestamp = extract_timestamp(row.get("pointsAwardedDate"))
+            # Timestamps stay integer milliseconds; the batch stores them as int64
+            purchase_timestamp = date_ms(row.get("purchaseDate"))
+            scanned_date = date_ms(row.get("dateScanned"))
+            processing_finished_date = date_ms(row.get("finishedDate"))
+            points_awarded_timestamp = date_ms(row.get("pointsAwardedDate"))
 
             total_amount_spent = float(row.get("totalSpent") or 0.0)
             items_purchased_count = int(float(row.get("purchasedItemCount") or 0))
@@ -92,83 +73,241 @@ def process_receipts_data(df, valid_user_ids, valid_brand_ids):
             extra_bonus_points = int(float(row.get("bonusPointsEarned") or 0))
             receipt_status = row.get("rewardsReceiptStatus", "UNKNOWN")
 
-            receipts_data.append((
+            receipts_data.append(
                 receipt_id, receipt_user_id, purchase_timestamp, scanned_date,
                 processing_finished_date, receipt_status, total_amount_spent,
                 items_purchased_count, reward_points_earned, extra_bonus_points,
                 points_awarded_timestamp
-            ))
+            )
 
             # Process receipt items
             if isinstance(row.get("rewardsReceiptItemList"), list):
-                for item in row["rewardsReceiptItemList"]:
+                for position, item in enumerate(row["rewardsReceiptItemList"]):
                     try:
-                        item_id = str(uuid.uuid4())
+                        item_id = stable_item_id(receipt_id, position, item.get("barcode"))
                         item_receipt_id = receipt_id
-                        item_brand_id = validate_uuid(item.get("partnerItemId"))
+                        item_brand_id = BRAND_IDS(item.get("partnerItemId"))
 
                         if not item_brand_id or item_brand_id not in valid_brand_ids:
-                            print(f"⚠️ Receipt item {item_id} has an unknown brand {item_brand_id}. Assigning default brand.")
-                            item_brand_id = DEFAULT_BRAND_ID  
+                            DIAGNOSTICS.defaulted("receipt_items", "unknown_brand", item_id)  # Default brand
+                            item_brand_id = DEFAULT_BRAND_ID
 
                         item_barcode = item.get("barcode", None)
                         item_quantity = int(float(item.get("quantityPurchased") or 1))
                         item_price = float(item.get("finalPrice") or 0.00)
 
-                        receipt_items_data.append((
-                            item_id, item_receipt_id, item_brand_id, item_barcode, item_quantity, item_price
-                        ))
+                        receipt_items_data.append(
+                            item_id, item_receipt_id, item_brand_id, item_barcode, item_quantity, item_price,
+                            scanned_date  # Items are partitioned by their receipt's scan month
+                        )
                     except Exception as e:
-                        print(f"Skipping receipt item due to error: {e}")
+                        DIAGNOSTICS.skipped("receipt_items", "transform_error", f"{receipt_id}: {e}")
 
         except Exception as e:
-            print(f"Skipping receipt due to error: {e}")
+            DIAGNOSTICS.skipped("receipts", "transform_error", str(e))
 
     return receipts_data, receipt_items_data
 
-# Insert data into PostgreSQL
-def insert_data(table_name, data, query):
-    if not data:
-        print(f"⚠️ No data to insert into {table_name}.")
-        return
-
-    conn = psycopg2.connect(**db_params)
-    cursor = conn.cursor()
-
-    try:
-        print(f"🔹 Attempting to insert {len(data)} records into {table_name}...")
-        execute_batch(cursor, query, data)
-        conn.commit()
-        print(f"✅ Successfully inserted {len(data)} records into {table_name}.")
-    except Exception as e:
-        conn.rollback()
-        print(f"❌ Error inserting into {table_name}: {e}")
-    
-    cursor.close()
-    conn.close()
-
-# Load and process receipts.json
-receipts_df = load_json_data("receipts.json")
-valid_user_ids = get_valid_user_ids()
-valid_brand_ids = get_valid_brand_ids()
-receipts_data, receipt_items_data = process_receipts_data(receipts_df, valid_user_ids, valid_brand_ids)
-
-# DEBUG: Check extracted receipts data
-print(f"🔍 Extracted {len(receipts_data)} receipts and {len(receipt_items_data)} receipt items before insertion.")
-
-# Insert receipts
-insert_data("fact_receipts", receipts_data, """
-    INSERT INTO fact_receipts (receipt_id, receipt_user_id, purchase_timestamp, scanned_date,
-        processing_finished_date, receipt_status, total_amount_spent, items_purchased_count,
-        reward_points_earned, extra_bonus_points, points_awarded_timestamp)
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-    ON CONFLICT (receipt_id) DO NOTHING;
-""")
-
-# Insert receipt items
-insert_data("fact_receipt_items", receipt_items_data, """
-    INSERT INTO fact_receipt_items (receipt_item_id, item_receipt_id, item_brand_id, item_barcode,
-        item_quantity, item_price)
-    VALUES (%s, %s, %s, %s, %s, %s)
-    ON CONFLICT (receipt_item_id) DO NOTHING;
-""")
+# Stream receipts as bounded (position, receipts, receipt items) batches: parse line -> transform -> batch
+def stream_receipts(file_path, valid_user_ids, valid_brand_ids, batch_size=DEFAULT_BATCH_SIZE,
+                    transform=process_receipts_data, start_position=0, validation=None):
+    batches = iter_batches(iter_positioned_records(file_path, start_position), batch_size)
+    for batch in timed_iter(batches, "parse", source="receipts"):
+        records = [record for _, record in batch]
+        METRICS.inc("rows_parsed_total", len(records), source="receipts")
+        if validation is not None:
+            with METRICS.timer("validate", source="receipts"):
+                validation.observe_many(records)  # Validate the records already parsed for loading
+        with METRICS.timer("transform", source="receipts"):
+            receipts_data, receipt_items_data = transform(records, valid_user_ids, valid_brand_ids)
+        yield batch[-1][0], receipts_data, receipt_items_data
+
+# Stream only the receipts with the given ids (`_id` or receipt_id), read through the file's line index;
+# positions are None since these batches do not move the checkpoint
+def stream_selected_receipts(file_path, receipt_ids, valid_user_ids, valid_brand_ids, batch_size=DEFAULT_BATCH_SIZE,
+                             transform=process_receipts_data):
+    from lineIndex import LineIndex
+
+    index = LineIndex.open(file_path)
+    line_numbers = set()
+    for receipt_id in receipt_ids:
+        lines = index.lines_of(receipt_id)
+        if not lines:
+            DIAGNOSTICS.skipped("receipts", "not_in_line_index", receipt_id)
+        line_numbers.update(lines)
+    print(f"🔹 Re-processing {len(line_numbers)} lines of {file_path}.")
+
+    records = (record for _, record in index.iter_records(line_numbers))
+    for records in iter_batches(records, batch_size):
+        with METRICS.timer("transform", source="receipts"):
+            receipts_data, receipt_items_data = transform(records, valid_user_ids, valid_brand_ids)
+        yield None, receipts_data, receipt_items_data
+
+# Load fact_receipts then fact_receipt_items from a columnarExtract.py directory (FKs resolved here)
+def load_receipts_extract(extract_dir, valid_user_ids, valid_brand_ids, checkpoints, batch_size=DEFAULT_BATCH_SIZE,
+                          restart=False, validation=None, commit_rows=DEFAULT_COMMIT_ROWS, after_merge=None):
+    from columnarExtract import (iter_extract_rows, receipt_items_batch_rows, receipts_batch_rows,
+                                 validate_receipts_extract)
+
+    if validation is not None:
+        validate_receipts_extract(extract_dir, validation, valid_user_ids, valid_brand_ids)
+
+    # Every receipt is written before any item, so the items' FK to fact_receipts is satisfied
+    tables = [
+        ("fact_receipts", "receipts", lambda batch: receipts_batch_rows(batch, valid_user_ids, DEFAULT_USER_ID)),
+        ("fact_receipt_items", "receipt_items",
+         lambda batch: receipt_items_batch_rows(batch, valid_brand_ids, DEFAULT_BRAND_ID)),
+    ]
+    totals = {}
+    with pooled_connection(db_params) as conn:
+        writer = BulkWriter(conn, commit_rows, after_merge=after_merge)
+        for table_name, table, to_rows in tables:
+            batches = iter_extract_rows(extract_dir, table, to_rows, checkpoints, batch_size, restart)
+            for part_path, position, rows in timed_iter(batches, "read_extract", source=table):
+                write_partitioned(writer, table_name, rows)
+                writer.end_batch(lambda succeeded, path=part_path, position=position, count=len(rows):
+                                 checkpoints.commit_batch(path, position, count, succeeded))
+                totals[table] = totals.get(table, 0) + len(rows)
+        writer.commit()
+
+    print(f"🔍 Processed {totals.get('receipts', 0)} receipts and {totals.get('receipt_items', 0)} receipt items.")
+    writer.report()
+    if validation is not None:
+        validation.report()
+    valid_user_ids.report()
+    valid_brand_ids.report()
+    USER_IDS.report()
+    BRAND_IDS.report()
+    return writer.errors == 0
+
+# Load receipts.json batch by batch so memory stays flat regardless of file size.
+# Returns False when any write failed (and was rolled back).
+def main(file_path="receipts.json", batch_size=DEFAULT_BATCH_SIZE, workers=1, vectorized=False,
+         full_key_refresh=False, restart=False, validate=False, commit_rows=DEFAULT_COMMIT_ROWS,
+         async_pipeline=False, rollups=False, checkpoints=None, valid_keys=None, wait_for_dimensions=None,
+         prefetch_batches=None, receipt_ids=None):
+    if checkpoints is None:
+        checkpoints = CheckpointStore()
+    if restart:
+        checkpoints.reset(file_path)
+    start_position = checkpoints.resume_position(file_path)
+
+    if valid_keys is not None:
+        valid_user_ids, valid_brand_ids = valid_keys  # loadScheduler.DeferredKeys while the dimensions load
+    else:
+        valid_user_ids = get_valid_user_ids(full_key_refresh)
+        valid_brand_ids = get_valid_brand_ids(full_key_refresh)
+
+    validation = None
+    if validate:
+        from validationRules import ReceiptValidation
+        if valid_keys is not None:
+            from loadScheduler import DeferredKeys
+            # References resolved after the dimension loads are reported as defaulted rows, not as rule failures
+            validation = ReceiptValidation(*[None if isinstance(keys, DeferredKeys) else keys for keys in valid_keys])
+        else:
+            validation = ReceiptValidation(valid_user_ids, valid_brand_ids)
+
+    transform = process_receipts_data
+    if vectorized:
+        from vectorizedReceipts import transform_receipts_frame
+        transform = transform_receipts_frame
+
+    # Rollup updates run in each write's savepoint, so they commit (or roll back) with the facts they count
+    after_merge = None
+    if rollups:
+        from rollups import incremental_rollup_sql
+        after_merge = incremental_rollup_sql()
+
+    if is_extract_dir(file_path):
+        return load_receipts_extract(file_path, valid_user_ids, valid_brand_ids, checkpoints, batch_size, restart,
+                                     validation, commit_rows, after_merge)
+
+    if async_pipeline:
+        if rollups:
+            raise ValueError("--rollups is not supported with --async-pipeline; run rollups.py --rebuild afterwards.")
+        import asyncio
+        from asyncPipeline import run_async_pipeline
+        succeeded = asyncio.run(run_async_pipeline(file_path, valid_user_ids, valid_brand_ids, checkpoints,
+                                                   start_position, batch_size, transform, workers, validation,
+                                                   commit_rows=commit_rows))
+        if validation is not None:
+            validation.report()
+        return succeeded
+
+    if receipt_ids:
+        if is_json_array(file_path):
+            raise ValueError("Selecting receipts by id needs NDJSON input (it reads through the line index).")
+        batches = stream_selected_receipts(file_path, receipt_ids, valid_user_ids, valid_brand_ids, batch_size,
+                                           transform)
+    elif workers > 1:
+        if validation is not None:
+            raise ValueError("--validate runs inline in the single-process loader; drop --workers to use it.")
+        from parallelReceipts import stream_receipts_parallel
+        batches = stream_receipts_parallel(file_path, valid_user_ids, valid_brand_ids, workers,
+                                           transform=transform, start_position=start_position)
+        # Parse and transform counters stay in the worker processes; only the wait for each range is timed here
+        batches = timed_iter(batches, "parse_transform_wait", source="receipts")
+    else:
+        batches = stream_receipts(file_path, valid_user_ids, valid_brand_ids, batch_size, transform, start_position,
+                                  validation)
+
+    if wait_for_dimensions is not None:
+        from loadScheduler import DEFAULT_PREFETCH_BATCHES, GatedReadAhead
+        # Parse and transform start now; the writes below wait until the dimension loads have committed
+        batches = GatedReadAhead(batches, wait_for_dimensions, prefetch_batches or DEFAULT_PREFETCH_BATCHES)
+
+    total_receipts = 0
+    total_items = 0
+    with pooled_connection(db_params) as conn:
+        writer = BulkWriter(conn, commit_rows, after_merge=after_merge)
+        for position, receipts_data, receipt_items_data in batches:
+            batch_start = time.perf_counter()
+            # Receipts go first so the items' FK to fact_receipts is satisfied
+            write_partitioned(writer, "fact_receipts", receipts_data)
+            write_partitioned(writer, "fact_receipt_items", receipt_items_data)
+            # The checkpoint only moves once the batch's transaction is committed
+            writer.end_batch(None if position is None else
+                             lambda succeeded, position=position, count=len(receipts_data):
+                             checkpoints.commit_batch(file_path, position, count, succeeded))
+            METRICS.observe("batch_write_seconds", time.perf_counter() - batch_start, source="receipts")
+            total_receipts += len(receipts_data)
+            total_items += len(receipt_items_data)
+        writer.commit()
+
+    print(f"🔍 Processed {total_receipts} receipts and {total_items} receipt items.")
+    writer.report()
+    if validation is not None:
+        validation.report()
+    valid_user_ids.report()
+    valid_brand_ids.report()
+    USER_IDS.report()
+    BRAND_IDS.report()
+    return writer.errors == 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load receipts into fact_receipts and fact_receipt_items.")
+    parser.add_argument("file_path", nargs="?", default=paths["receipts"],
+                        help="receipts.json or a columnarExtract.py output directory")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=1, help="Transform in N processes (NDJSON input only)")
+    parser.add_argument("--vectorized", action="store_true", help="Use the column-wise pandas transform (needs pandas; about 2.7x faster)")
+    parser.add_argument("--full-key-refresh", action="store_true",
+                        help="Re-pull all dimension keys instead of refreshing the cached snapshot")
+    parser.add_argument("--restart", action="store_true", help="Ignore the saved checkpoint and start from byte zero")
+    parser.add_argument("--validate", action="store_true", help="Also print the data quality report for the loaded records")
+    parser.add_argument("--commit-rows", type=int, default=DEFAULT_COMMIT_ROWS,
+                        help="Commit after this many written rows (0 commits every write)")
+    parser.add_argument("--async-pipeline", action="store_true",
+                        help="Overlap parsing, transformation and writes as concurrent stages (needs psycopg 3)")
+    parser.add_argument("--rollups", action="store_true",
+                        help="Update the monthly rollup tables with every write (needs migrations/003_monthly_rollups.sql)")
+    parser.add_argument("--id", dest="receipt_ids", action="append",
+                        help="Only (re-)process this receipt (`_id` or receipt_id), found through the line index; "
+                             "repeatable. Rows already loaded are left as they are")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    run_instrumented(main, args, file_path=args.file_path, batch_size=args.batch_size, workers=args.workers,
+                     vectorized=args.vectorized, full_key_refresh=args.full_key_refresh, restart=args.restart,
+                     validate=args.validate, commit_rows=args.commit_rows, async_pipeline=args.async_pipeline,
+                     rollups=args.rollups, receipt_ids=args.receipt_ids)
@@ -1,95 +1,117 @@
-import json
-import pandas as pd
-import uuid
-import psycopg2
-from psycopg2.extras import execute_batch
-
-# 📌 PostgreSQL Connection Details (Corrected DSN Format for psycopg2)
-db_params = {
-    "dbname": "fetchRewards",
-    "user": "postgres",
-    "password": "<password>",
-    "host": "localhost",
-    "port": "5432"
-}
-
-# Function to load JSON safely
-def load_json_data(file_path):
-    data = []
-    with open(file_path, 'r') as file:
-        first_char = file.read(1)
-        file.seek(0)
-
-        if first_char == "[":  # JSON Array
-            data = json.load(file)
-        else:  # NDJSON (one JSON object per line)
-            for line in file:
-                try:
-                    data.append(json.loads(line.strip()))
-                except json.JSONDecodeError as e:
-                    print(f"Error decoding JSON: {e}")
-
-    return pd.DataFrame(data)
-
-# Function to validate and format UUID
-def validate_uuid(value):
-    try:
-        return str(uuid.UUID(value))  # Converts valid UUID to a standard format
-    except (ValueError, TypeError):
-        return str(uuid.uuid4())  # Generates a new UUID if invalid
-
-# Function to clean and process users data
-def process_users_data(df):
-    users_data = []
-
-    for _, row in df.iterrows():
+import argparse
+from bulkLoader import DEFAULT_COMMIT_ROWS, BulkWriter
+from dbPool import pooled_connection
+from fetchEtl.config import db_params, paths
+from checkpointStore import CheckpointStore
+from columnarExtract import date_ms, is_extract_dir
+from jsonStream import DEFAULT_BATCH_SIZE, iter_batches, iter_positioned_records
+from loadDiagnostics import DIAGNOSTICS
+from loadMetrics import METRICS, add_metrics_arguments, run_instrumented, timed_iter
+from rowBatches import UserBatch
+from idNormalizer import stable_record_id
+
+# Function to clean and process users data (accepts a DataFrame or any iterable of parsed user dicts)
+def process_users_data(records):
+    users_data = UserBatch()
+
+    if hasattr(records, "iterrows"):  # A DataFrame (checked without importing pandas)
+        records = (row for _, row in records.iterrows())
+
+    for row in records:
         try:
-            # Ensure "_id" exists and is iterable
-            row["_id"] = row.get("_id", {})
-            user_id = validate_uuid(row["_id"].get("$oid", str(uuid.uuid4())))
+            # Same UUID on every load: the `_id` (ObjectIds mapped into UUID space), else the record's content
+            user_id = stable_record_id(row)
+            if not isinstance(row.get("_id"), dict) or not row["_id"].get("$oid"):
+                DIAGNOSTICS.defaulted("users", "missing_user_id", user_id)
 
             # Ensure "state" is a string and only 2 characters long
             user_state = str(row.get("state", "")).strip()[:2] if isinstance(row.get("state"), str) else None
 
-            # Convert timestamps correctly
-            account_created_date = pd.to_datetime(row["createdDate"]["$date"], unit="ms") if "createdDate" in row and isinstance(row["createdDate"], dict) else None
-            last_login_date = pd.to_datetime(row["lastLogin"]["$date"], unit="ms") if "lastLogin" in row and isinstance(row["lastLogin"], dict) else None
+            # Timestamps stay integer milliseconds; the batch stores them as int64
+            account_created_date = date_ms(row.get("createdDate"))
+            last_login_date = date_ms(row.get("lastLogin"))
 
             # Assign role and active status with default values
             user_role = row.get("role", "consumer")
             is_active = bool(row.get("active", True))  # Convert to boolean
 
-            user_record = (user_id, user_state, account_created_date, last_login_date, user_role, is_active)
-            users_data.append(user_record)
+            users_data.append(user_id, user_state, account_created_date, last_login_date, user_role, is_active)
 
         except Exception as e:
-            print(f"Skipping row due to error: {e}")
+            DIAGNOSTICS.skipped("users", "transform_error", str(e))
 
     return users_data
 
-# Load and process users.json
-users_df = load_json_data("users.json")
-users_data = process_users_data(users_df)
-
-# Insert data into PostgreSQL table using psycopg2 execute_batch
-try:
-    # Connect to PostgreSQL using psycopg2
-    conn = psycopg2.connect(**db_params)
-    cursor = conn.cursor()
-
-    insert_query = """
-        INSERT INTO dim_users (user_id, user_state, account_created_date, last_login_date, user_role, is_active)
-        VALUES (%s, %s, %s, %s, %s, %s)
-        ON CONFLICT (user_id) DO NOTHING;
-    """
+# Stream (checkpoint path, position, record count, rows) batches from users.json or from an extract directory
+def user_batches(file_path, batch_size, checkpoints, restart=False, validator=None):
+    if is_extract_dir(file_path):
+        from columnarExtract import iter_extract_rows, users_batch_rows, validate_users_extract
+        if validator is not None:
+            validate_users_extract(file_path, validator)  # Counted from the stored rule failures
+        batches = iter_extract_rows(file_path, "users", users_batch_rows, checkpoints, batch_size, restart)
+        for part_path, position, rows in timed_iter(batches, "read_extract", source="users"):
+            yield part_path, position, len(rows), rows
+        return
+
+    if restart:
+        checkpoints.reset(file_path)
+    batches = iter_batches(iter_positioned_records(file_path, checkpoints.resume_position(file_path)), batch_size)
+    for batch in timed_iter(batches, "parse", source="users"):
+        records = [record for _, record in batch]
+        METRICS.inc("rows_parsed_total", len(records), source="users")
+        if validator is not None:
+            with METRICS.timer("validate", source="users"):
+                validator.observe_many(records)  # Validate the records already parsed for loading
+        with METRICS.timer("transform", source="users"):
+            users_data = process_users_data(records)
+        yield file_path, batch[-1][0], len(batch), users_data
+
+# Load users.json batch by batch, resuming after the last committed batch (`delta` also updates changed users).
+# Returns False when the load stopped on an error or any write failed (and was rolled back).
+def main(file_path="users.json", batch_size=DEFAULT_BATCH_SIZE, restart=False, validate=False,
+         commit_rows=DEFAULT_COMMIT_ROWS, delta=False, checkpoints=None):
+    if checkpoints is None:
+        checkpoints = CheckpointStore()
+
+    validator = None
+    if validate:
+        from validationRules import user_validator
+        validator = user_validator()
 
-    execute_batch(cursor, insert_query, users_data)  # Perform batch insert
-
-    conn.commit()
-    cursor.close()
-    conn.close()
-
-    print(f"{len(users_data)} records attempted for insertion into dim_users.")
-
-except Exception as e:
-    print(f"Error inserting data: {e}")
+    try:
+        total_records = 0
+        with pooled_connection(db_params) as conn:
+            writer = BulkWriter(conn, commit_rows, upsert=delta)
+            batches = user_batches(file_path, batch_size, checkpoints, restart, validator)
+            for checkpoint_path, position, count, users_data in batches:
+                writer.write("dim_users", users_data)
+                # The checkpoint only moves once the batch's transaction is committed
+                writer.end_batch(lambda succeeded, path=checkpoint_path, position=position, count=count:
+                                 checkpoints.commit_batch(path, position, count, succeeded))
+                total_records += len(users_data)
+            writer.commit()
+
+        print(f"{total_records} records attempted for insertion into dim_users.")
+        writer.report()
+        if validator is not None:
+            validator.report()
+        return writer.errors == 0
+
+    except Exception as e:
+        print(f"Error inserting data: {e}")
+        return False
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load users.json into dim_users.")
+    parser.add_argument("file_path", nargs="?", default=paths["users"], help="users.json or a columnarExtract.py output directory")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--restart", action="store_true", help="Ignore the saved checkpoint and start from the beginning")
+    parser.add_argument("--validate", action="store_true", help="Also print the data quality report for the loaded records")
+    parser.add_argument("--commit-rows", type=int, default=DEFAULT_COMMIT_ROWS,
+                        help="Commit after this many written rows (0 commits every write)")
+    parser.add_argument("--delta", action="store_true",
+                        help="Also update rows whose content changed (needs migrations/001_dimension_row_hash.sql)")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    run_instrumented(main, args, file_path=args.file_path, batch_size=args.batch_size, restart=args.restart,
+                     validate=args.validate, commit_rows=args.commit_rows, delta=args.delta)
@@ -0,0 +1,192 @@
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from addingReceipts import process_receipts_data
+from bulkLoader import (DEFAULT_COMMIT_ROWS, copy_sql, create_staging_sql, merge_sql, record_write_stats,
+                        report_write_stats, rows_to_csv)
+from fetchEtl.config import conninfo_params
+from factPartitions import ensure_partitions, group_by_month, partition_name
+from jsonStream import DEFAULT_BATCH_SIZE, iter_batches, iter_positioned_records
+from loadDiagnostics import DIAGNOSTICS
+from loadMetrics import METRICS
+
+# Batches allowed to wait between two stages before the upstream stage blocks (backpressure)
+DEFAULT_QUEUE_SIZE = 4
+
+# Marks the end of the stream on a queue
+_END = object()
+
+# Lookup sets are shipped to each transform process once, not with every batch
+_worker_state = {}
+
+def _init_transform_worker(transform, valid_user_ids, valid_brand_ids, diagnostics_settings):
+    DIAGNOSTICS.for_worker(**diagnostics_settings)
+    _worker_state["transform"] = transform
+    _worker_state["valid_user_ids"] = valid_user_ids
+    _worker_state["valid_brand_ids"] = valid_brand_ids
+
+# Transform one batch; its diagnostics travel back with its rows and are merged by the parent
+def _transform_batch(records):
+    receipts_data, receipt_items_data = _worker_state["transform"](records, _worker_state["valid_user_ids"],
+                                                                   _worker_state["valid_brand_ids"])
+    return receipts_data, receipt_items_data, DIAGNOSTICS.drain()
+
+# Busy time per stage, to compare the wall time with the sum of the stages
+class StageTimer:
+    def __init__(self):
+        self.seconds = {}
+
+    def add(self, stage, seconds):
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+        METRICS.observe(f"{stage}_seconds", seconds, source="receipts")
+
+    def report(self, wall_seconds):
+        for stage, seconds in self.seconds.items():
+            print(f"⏱️ {stage}: {seconds:.2f}s busy")
+        print(f"⏱️ wall time {wall_seconds:.2f}s vs {sum(self.seconds.values()):.2f}s if run back to back")
+
+# Stage 1: read + decode NDJSON into (position, records) batches
+async def parse_stage(file_path, start_position, batch_size, parsed_queue, timer, validation=None):
+    batches = iter_batches(iter_positioned_records(file_path, start_position), batch_size)
+    while True:
+        start = time.perf_counter()
+        batch = await asyncio.to_thread(next, batches, None)  # File I/O and decoding off the event loop
+        if batch is None:
+            break
+        records = [record for _, record in batch]
+        if validation is not None:
+            validation.observe_many(records)
+        timer.add("parse", time.perf_counter() - start)
+        await parsed_queue.put((batch[-1][0], records))
+    await parsed_queue.put(_END)
+
+# Stage 2: transform batches in worker processes so it overlaps with parsing and writing.
+# Up to `workers` batches are in flight; results are passed on in file order.
+async def transform_stage(parsed_queue, transformed_queue, executor, workers, timer):
+    loop = asyncio.get_running_loop()
+    in_flight = deque()
+
+    async def pass_on_oldest():
+        position, started, future = in_flight.popleft()
+        receipts_data, receipt_items_data, diagnostics = await future
+        DIAGNOSTICS.merge(diagnostics)
+        timer.add("transform", time.perf_counter() - started)
+        await transformed_queue.put((position, receipts_data, receipt_items_data))
+
+    while (item := await parsed_queue.get()) is not _END:
+        position, records = item
+        in_flight.append((position, time.perf_counter(), loop.run_in_executor(executor, _transform_batch, records)))
+        if len(in_flight) >= workers:
+            await pass_on_oldest()
+    while in_flight:
+        await pass_on_oldest()
+    await transformed_queue.put(_END)
+
+# Function to COPY one table's rows into staging and merge them into their monthly partitions
+# (inside the caller's transaction)
+async def write_table(conn, table_name, rows, stats):
+    if not rows:
+        return
+    start = time.perf_counter()
+    inserted = 0
+    groups = group_by_month(table_name, rows)
+    await asyncio.to_thread(ensure_partitions, groups)  # Own autocommit connection, outside this transaction
+    async with conn.cursor() as cursor:
+        for month, month_rows in groups.items():
+            await cursor.execute(create_staging_sql(table_name))
+            async with cursor.copy(copy_sql(table_name)) as copy:
+                await copy.write(rows_to_csv(month_rows).getvalue())
+            await cursor.execute(merge_sql(table_name, partition_name(table_name, month) if month else None))
+            inserted += cursor.rowcount
+    record_write_stats(stats, table_name, len(rows), inserted, time.perf_counter() - start)
+
+# Stage 3: write receipts then items like BulkWriter does: one savepoint per batch (a failed batch rolls back on
+# its own), a commit every `commit_rows` written rows, and checkpoints moved only once their batch is committed
+async def write_stage(transformed_queue, file_path, checkpoints, timer, stats, commit_rows=DEFAULT_COMMIT_ROWS):
+    import psycopg
+
+    totals = {"receipts": 0, "items": 0, "failed_batches": 0}
+    conninfo, params = conninfo_params()
+    async with await psycopg.AsyncConnection.connect(conninfo, **params) as conn:
+        pending = []  # (position, receipts, batch succeeded) waiting for the next commit
+        uncommitted_rows = 0
+
+        async def commit():
+            transaction_lost = False
+            try:
+                await conn.commit()
+            except Exception as e:
+                await conn.rollback()
+                transaction_lost = True
+                totals["failed_batches"] += sum(succeeded for _, _, succeeded in pending)
+                print(f"❌ Error committing batches up to position {pending[-1][0]}: {e}")
+            for position, count, succeeded in pending:
+                checkpoints.commit_batch(file_path, position, count, succeeded and not transaction_lost)
+            pending.clear()
+
+        while (item := await transformed_queue.get()) is not _END:
+            position, receipts_data, receipt_items_data = item
+            start = time.perf_counter()
+            succeeded = True
+            try:
+                await conn.execute("SAVEPOINT bulk_write;")  # Opens the transaction after a commit
+                # Receipts go first so the items' FK to fact_receipts is satisfied
+                await write_table(conn, "fact_receipts", receipts_data, stats)
+                await write_table(conn, "fact_receipt_items", receipt_items_data, stats)
+                await conn.execute("RELEASE SAVEPOINT bulk_write;")
+                uncommitted_rows += len(receipts_data) + len(receipt_items_data)
+            except Exception as e:
+                succeeded = False
+                totals["failed_batches"] += 1
+                print(f"❌ Error inserting batch ending at position {position}: {e}")
+                try:
+                    await conn.execute("ROLLBACK TO SAVEPOINT bulk_write;")
+                except Exception:
+                    # Not even the savepoint can be restored: the batches since the last commit are lost too
+                    await conn.rollback()
+                    totals["failed_batches"] += sum(ok for _, _, ok in pending)
+                    pending[:] = [(pending_position, count, False) for pending_position, count, _ in pending]
+                    uncommitted_rows = 0
+            pending.append((position, len(receipts_data), succeeded))
+            if uncommitted_rows >= commit_rows:
+                await commit()
+                uncommitted_rows = 0
+            timer.add("write", time.perf_counter() - start)
+            totals["receipts"] += len(receipts_data)
+            totals["items"] += len(receipt_items_data)
+        await commit()
+    return totals
+
+# Run parse -> transform -> write as concurrent stages joined by bounded queues.
+# Returns False when any batch failed to write (and was rolled back).
+async def run_async_pipeline(file_path, valid_user_ids, valid_brand_ids, checkpoints, start_position=0,
+                             batch_size=DEFAULT_BATCH_SIZE, transform=process_receipts_data, workers=1,
+                             validation=None, queue_size=DEFAULT_QUEUE_SIZE, commit_rows=DEFAULT_COMMIT_ROWS):
+    parsed_queue = asyncio.Queue(maxsize=queue_size)
+    transformed_queue = asyncio.Queue(maxsize=queue_size)
+    timer = StageTimer()
+    stats = {}
+    wall_start = time.perf_counter()
+
+    workers = max(1, workers)
+    with ProcessPoolExecutor(workers, initializer=_init_transform_worker,
+                             initargs=(transform, valid_user_ids, valid_brand_ids,
+                                       DIAGNOSTICS.worker_settings())) as executor:
+        tasks = [
+            asyncio.create_task(parse_stage(file_path, start_position, batch_size, parsed_queue, timer, validation)),
+            asyncio.create_task(transform_stage(parsed_queue, transformed_queue, executor, workers, timer)),
+            asyncio.create_task(write_stage(transformed_queue, file_path, checkpoints, timer, stats, commit_rows)),
+        ]
+        try:
+            _, _, totals = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()  # One failed stage stops the others instead of leaving them blocked on a queue
+            raise
+
+    print(f"🔍 Processed {totals['receipts']} receipts and {totals['items']} receipt items.")
+    report_write_stats(stats)
+    timer.report(time.perf_counter() - wall_start)
+    return totals["failed_batches"] == 0
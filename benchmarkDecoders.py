@@ -0,0 +1,50 @@
+import argparse
+import os
+import time
+
+from jsonDecoder import _load_backend, available_backends
+
+# Function to read a file's NDJSON lines (or the whole document for JSON arrays) as bytes
+def read_payloads(file_path):
+    with open(file_path, 'rb') as file:
+        data = file.read()
+    if data.lstrip()[:1] == b"[":
+        return [data]
+    return [line for line in data.splitlines() if line.strip()]
+
+# Function to time one backend over a list of payloads (best of `repeats`)
+def time_backend(loads, payloads, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for payload in payloads:
+            loads(payload)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+# Compare every installed backend on the given files
+def main(file_paths, repeats):
+    backends = available_backends()
+    print(f"🔍 Installed JSON backends: {', '.join(backends)}")
+
+    for file_path in file_paths:
+        if not os.path.exists(file_path):
+            print(f"⚠️ {file_path} not found, skipping.")
+            continue
+
+        payloads = read_payloads(file_path)
+        megabytes = sum(len(payload) for payload in payloads) / (1024 * 1024)
+        print(f"\n📄 {file_path}: {len(payloads)} documents, {megabytes:.1f} MB")
+
+        timings = {name: time_backend(_load_backend(name), payloads, repeats) for name in backends}
+        for name, seconds in timings.items():
+            # Speed-up is relative to the stdlib json module
+            print(f"  {name:<9} {seconds:8.3f}s  {megabytes / seconds:8.1f} MB/s  "
+                  f"{len(payloads) / seconds:12,.0f} docs/s  {timings['json'] / seconds:5.2f}x vs json")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the JSON decoding backends used by the loaders.")
+    parser.add_argument("file_paths", nargs="*", default=["receipts.json", "users.json", "brands.json"])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    main(args.file_paths, args.repeats)
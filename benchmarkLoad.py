@@ -0,0 +1,194 @@
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import ExitStack
+
+from bulkLoader import rows_to_csv
+from factPartitions import PARTITION_COLUMNS, write_partitioned
+from idNormalizer import stable_record_id
+from jsonStream import DEFAULT_BATCH_SIZE, iter_batches, iter_json_records
+from syntheticData import add_config_arguments, config_from_args, generate_dataset
+
+# Stand-in for BulkWriter: renders the COPY payload (so encoding cost is measured) and drops it
+class NullSinkWriter:
+    def __init__(self):
+        self.rows = {}
+
+    def write(self, table_name, rows, target=None):
+        rows_to_csv(rows)
+        self.rows[table_name] = self.rows.get(table_name, 0) + len(rows)
+        return len(rows)
+
+    def execute(self, sql, params=None):
+        return True
+
+    def end_batch(self, on_commit=None):
+        if on_commit is not None:
+            on_commit(True)
+
+    def commit(self):
+        pass
+
+    def report(self):
+        pass
+
+# Wall time and row count per stage
+class StageStats:
+    def __init__(self):
+        self.seconds = {}
+        self.rows = {}
+
+    def add(self, stage, seconds, rows=0):
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+        self.rows[stage] = self.rows.get(stage, 0) + rows
+
+# Function to read this process's peak resident set size in MB
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KB on Linux
+
+# Function to time parse -> transform -> write for one file
+def run_stage_pipeline(label, file_path, transform, writer, stats, batch_size, validator=None):
+    records_iter = iter_batches(iter_json_records(file_path), batch_size)
+    while True:
+        start = time.perf_counter()
+        records = next(records_iter, None)
+        if records is None:
+            break
+        stats.add(f"{label}.parse", time.perf_counter() - start, len(records))
+
+        if validator is not None:
+            start = time.perf_counter()
+            validator.observe_many(records)
+            stats.add(f"{label}.validate", time.perf_counter() - start, len(records))
+
+        start = time.perf_counter()
+        tables = transform(records)
+        stats.add(f"{label}.transform", time.perf_counter() - start, len(records))
+
+        start = time.perf_counter()
+        written = 0
+        for table_name, rows in tables:
+            if table_name in PARTITION_COLUMNS:
+                write_partitioned(writer, table_name, rows, create_partitions=not isinstance(writer, NullSinkWriter))
+            else:
+                writer.write(table_name, rows)
+            written += len(rows)
+        writer.end_batch()
+        stats.add(f"{label}.write", time.perf_counter() - start, written)
+    writer.commit()
+
+# Function to collect the keys a dimension file loads under (FK lookups for the null sink)
+def collect_dimension_ids(records):
+    return {stable_record_id(record) for record in records if isinstance(record, dict)}
+
+# Run the users, brands and receipts loads (and optionally validation) and return the measurements
+def run_benchmark(paths, sink="null", vectorized=False, validate=False, batch_size=DEFAULT_BATCH_SIZE):
+    import addingBrandsData
+    import addingReceipts
+    import addingUsers
+    from validationRules import ReceiptValidation, brand_validator, user_validator
+
+    stats = StageStats()
+    wall_start = time.perf_counter()
+
+    with ExitStack() as stack:
+        if sink == "postgres":
+            from bulkLoader import BulkWriter
+            from dbPool import pooled_connection
+            from fetchEtl.config import db_params
+            writer = BulkWriter(stack.enter_context(pooled_connection(db_params)))
+        else:
+            writer = NullSinkWriter()
+
+        run_stage_pipeline("users", paths["users"], lambda records: [("dim_users", addingUsers.process_users_data(records))],
+                           writer, stats, batch_size, user_validator() if validate else None)
+        run_stage_pipeline("brands", paths["brands"], lambda records: [("dim_brands", addingBrandsData.process_brands_data(records))],
+                           writer, stats, batch_size, brand_validator() if validate else None)
+
+        start = time.perf_counter()
+        if sink == "postgres":
+            valid_user_ids = addingReceipts.get_valid_user_ids(full_refresh=True)
+            valid_brand_ids = addingReceipts.get_valid_brand_ids(full_refresh=True)
+        else:
+            valid_user_ids = collect_dimension_ids(iter_json_records(paths["users"]))
+            valid_brand_ids = collect_dimension_ids(iter_json_records(paths["brands"]))
+        stats.add("receipts.lookup", time.perf_counter() - start)
+
+        transform = addingReceipts.process_receipts_data
+        if vectorized:
+            from vectorizedReceipts import transform_receipts_frame
+            transform = transform_receipts_frame
+
+        def transform_receipts(records):
+            receipts_data, receipt_items_data = transform(records, valid_user_ids, valid_brand_ids)
+            return [("fact_receipts", receipts_data), ("fact_receipt_items", receipt_items_data)]
+
+        validation = ReceiptValidation(valid_user_ids, valid_brand_ids) if validate else None
+        run_stage_pipeline("receipts", paths["receipts"], transform_receipts, writer, stats, batch_size, validation)
+
+    return {
+        "wall_seconds": time.perf_counter() - wall_start,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": {
+            stage: {
+                "seconds": seconds,
+                "rows": stats.rows[stage],
+                "rows_per_sec": stats.rows[stage] / seconds if seconds else 0.0,
+            }
+            for stage, seconds in stats.seconds.items()
+        },
+    }
+
+def print_results(results):
+    print(f"\n📊 Wall time {results['wall_seconds']:.2f}s, peak RSS {results['peak_rss_mb']:.0f} MB")
+    for stage, stage_stats in results["stages"].items():
+        print(f"  {stage:<20} {stage_stats['seconds']:8.2f}s {stage_stats['rows']:>12,} rows "
+              f"{stage_stats['rows_per_sec']:>12,.0f} rows/sec")
+
+# Function to flag stages that got slower than the baseline by more than `tolerance`
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+    for stage, stage_stats in results["stages"].items():
+        before = baseline["stages"].get(stage)
+        if before and before["rows_per_sec"] and stage_stats["rows_per_sec"] < before["rows_per_sec"] * (1 - tolerance):
+            regressions.append((stage, before["rows_per_sec"], stage_stats["rows_per_sec"]))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the load and validation paths on synthetic data.")
+    parser.add_argument("--data-dir", default="bench_data")
+    parser.add_argument("--reuse-data", action="store_true", help="Use the files already in --data-dir")
+    parser.add_argument("--sink", choices=["null", "postgres"], default="null",
+                        help="'null' measures everything up to the COPY payload; 'postgres' writes to db_params")
+    parser.add_argument("--vectorized", action="store_true")
+    parser.add_argument("--validate", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--save", help="Write the results as JSON to this path")
+    parser.add_argument("--compare", help="Baseline results JSON; exit 1 if a stage regressed")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed rows/sec drop before flagging")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    if args.reuse_data:
+        paths = {name: os.path.join(args.data_dir, f"{name}.json") for name in ("users", "brands", "receipts")}
+    else:
+        paths = generate_dataset(args.data_dir, config_from_args(args))
+
+    results = run_benchmark(paths, args.sink, args.vectorized, args.validate, args.batch_size)
+    print_results(results)
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            regressions = find_regressions(results, json.load(file), args.tolerance)
+        for stage, before, after in regressions:
+            print(f"❌ {stage} regressed: {before:,.0f} -> {after:,.0f} rows/sec")
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,258 @@
+import csv
+import io
+import time
+
+from loadMetrics import METRICS
+
+# Column layout and conflict key of every table the loaders write to
+TABLE_SPECS = {
+    "dim_users": {
+        "columns": ["user_id", "user_state", "account_created_date", "last_login_date", "user_role", "is_active"],
+        "conflict_key": "user_id",
+        "row_hash_column": "row_hash",  # Added by migrations/001_dimension_row_hash.sql
+    },
+    "dim_brands": {
+        "columns": ["brand_id", "brand_title", "brand_category", "brand_category_code", "brand_barcode", "is_top_brand"],
+        "conflict_key": "brand_id",
+        "row_hash_column": "row_hash",
+    },
+    "fact_receipts": {
+        "columns": ["receipt_id", "receipt_user_id", "purchase_timestamp", "scanned_date",
+                    "processing_finished_date", "receipt_status", "total_amount_spent", "items_purchased_count",
+                    "reward_points_earned", "extra_bonus_points", "points_awarded_timestamp"],
+        "conflict_key": "receipt_id, scanned_date",  # Partitioned by scanned_date month
+    },
+    "fact_receipt_items": {
+        "columns": ["receipt_item_id", "item_receipt_id", "item_brand_id", "item_barcode",
+                    "item_quantity", "item_price", "item_scanned_date"],
+        "conflict_key": "receipt_item_id, item_scanned_date",
+    },
+}
+
+# Marker COPY reads as NULL (unquoted, so it never collides with an empty string)
+COPY_NULL = "\\N"
+
+# SQL for the staging table, the COPY into it and the set-based merge of one table
+def staging_table_name(table_name):
+    return f"staging_{table_name}"
+
+def inserted_table_name(table_name):
+    return f"inserted_{table_name}"
+
+def create_staging_sql(table_name):
+    # Temp tables are never WAL-logged and are private to this connection
+    staging_table = staging_table_name(table_name)
+    return (f"CREATE TEMP TABLE IF NOT EXISTS {staging_table} (LIKE {table_name} INCLUDING DEFAULTS); "
+            f"TRUNCATE {staging_table};")
+
+def copy_sql(table_name):
+    columns = ", ".join(TABLE_SPECS[table_name]["columns"])
+    return f"COPY {staging_table_name(table_name)} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')"
+
+def merge_sql(table_name, target=None):
+    # Set-based merge keeps the old skip-on-duplicate behaviour; `target` can name one partition of the table
+    spec = TABLE_SPECS[table_name]
+    columns = ", ".join(spec["columns"])
+    return f"""
+        INSERT INTO {target or table_name} ({columns})
+        SELECT {columns} FROM {staging_table_name(table_name)}
+        ON CONFLICT ({spec["conflict_key"]}) DO NOTHING;
+    """
+
+# Same merge, but the rows it actually inserted are also kept in a temp table (inserted_<table>)
+# for follow-up statements such as the rollup updates
+def merge_capturing_sql(table_name, target=None):
+    spec = TABLE_SPECS[table_name]
+    columns = ", ".join(spec["columns"])
+    inserted_table = inserted_table_name(table_name)
+    return f"""
+        CREATE TEMP TABLE IF NOT EXISTS {inserted_table} (LIKE {table_name}); TRUNCATE {inserted_table};
+        WITH inserted AS (
+            INSERT INTO {target or table_name} ({columns})
+            SELECT {columns} FROM {staging_table_name(table_name)}
+            ON CONFLICT ({spec["conflict_key"]}) DO NOTHING
+            RETURNING {columns}
+        )
+        INSERT INTO {inserted_table} ({columns}) SELECT {columns} FROM inserted;
+    """
+
+# Delta merge for tables with a stored row hash: new keys are inserted, existing keys are updated
+# only when the hash of the incoming row differs, everything else is left alone. Returns one row of
+# (inserted, updated) counts; xmax = 0 marks a freshly inserted tuple.
+def upsert_sql(table_name):
+    spec = TABLE_SPECS[table_name]
+    if "row_hash_column" not in spec:
+        raise ValueError(f"{table_name} has no row hash column to upsert against.")
+    key = spec["conflict_key"]
+    hash_column = spec["row_hash_column"]
+    columns = ", ".join(spec["columns"])
+    staged_columns = ", ".join(f"staged.{column}" for column in spec["columns"])
+    updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in spec["columns"] + [hash_column] if column != key)
+    # A key repeated within one batch keeps its last copy (ctid follows COPY order in the fresh staging table)
+    return f"""
+        WITH merged AS (
+            INSERT INTO {table_name} ({columns}, {hash_column})
+            SELECT DISTINCT ON (staged.{key}) {staged_columns},
+                   decode(md5(ROW({staged_columns})::text), 'hex')
+            FROM {staging_table_name(table_name)} AS staged
+            ORDER BY staged.{key}, staged.ctid DESC
+            ON CONFLICT ({key}) DO UPDATE SET {updates}
+            WHERE {table_name}.{hash_column} IS DISTINCT FROM EXCLUDED.{hash_column}
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted) FROM merged;
+    """
+
+# Function to render row tuples as an in-memory CSV stream for COPY ... FROM STDIN
+def rows_to_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        # None, NaN and NaT all become NULL (NaN/NaT are the only values not equal to themselves)
+        writer.writerow([COPY_NULL if value is None or value != value else value for value in row])
+    buffer.seek(0)
+    return buffer
+
+# Rows written between commits (0 commits after every write)
+DEFAULT_COMMIT_ROWS = 50000
+
+# Bulk writer: COPY rows into a session-private staging table, then merge with one INSERT ... SELECT.
+# Writes share one transaction that is committed every `commit_rows` rows; each write has its own
+# savepoint so a bad batch is rolled back on its own. With `upsert`, changed rows are updated too.
+# `after_merge` maps a table to statements run after each of its merges, in the same savepoint; they
+# can read the rows that merge inserted from inserted_<table>.
+class BulkWriter:
+    def __init__(self, conn, commit_rows=DEFAULT_COMMIT_ROWS, upsert=False, after_merge=None):
+        self.conn = conn
+        self.commit_rows = commit_rows
+        self.upsert = upsert
+        self.after_merge = after_merge or {}
+        self.stats = {}  # table_name -> {"staged", "inserted", "updated", "seconds"}
+        self.errors = 0  # Failed (rolled back) writes, so callers can tell a failure from "0 new rows"
+        self.uncommitted_rows = 0
+        self.pending_batches = []  # (on_commit, batch_failed) waiting for the next commit
+        self._batch_failed = False
+        self._transaction_lost = False  # The open transaction was aborted; its pending batches are gone
+
+    # Stage and merge rows of `table_name`; `target` sends them to one partition instead of the parent
+    def write(self, table_name, rows, target=None):
+        if not rows:
+            print(f"⚠️ No data to insert into {table_name}.")
+            return 0
+
+        cursor = self.conn.cursor()
+        start = time.perf_counter()
+
+        try:
+            cursor.execute("SAVEPOINT bulk_write;")
+            cursor.execute(create_staging_sql(table_name))
+            cursor.copy_expert(copy_sql(table_name), rows_to_csv(rows))
+            if self.upsert:
+                cursor.execute(upsert_sql(table_name))
+                inserted, updated = cursor.fetchone()
+            elif table_name in self.after_merge:
+                cursor.execute(merge_capturing_sql(table_name, target))
+                inserted, updated = cursor.rowcount, 0
+                for sql in self.after_merge[table_name]:
+                    cursor.execute(sql)
+            else:
+                cursor.execute(merge_sql(table_name, target))
+                inserted, updated = cursor.rowcount, 0
+            cursor.execute("RELEASE SAVEPOINT bulk_write;")
+        except Exception as e:
+            self._rollback_write()
+            self.errors += 1
+            self._batch_failed = True
+            METRICS.inc("write_errors_total", table=table_name)
+            print(f"❌ Error inserting into {table_name}: {e}")
+            return 0
+        finally:
+            cursor.close()
+
+        self.uncommitted_rows += len(rows)
+        if not self.commit_rows:
+            self.commit()
+
+        record_write_stats(self.stats, table_name, len(rows), inserted, time.perf_counter() - start, updated)
+        return inserted + updated
+
+    # Run one statement in the writer's transaction (e.g. DDL a write depends on), with the same
+    # savepoint handling as a write
+    def execute(self, sql, params=None):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("SAVEPOINT bulk_write;")
+            cursor.execute(sql, params)
+            cursor.execute("RELEASE SAVEPOINT bulk_write;")
+            return True
+        except Exception as e:
+            self._rollback_write()
+            self.errors += 1
+            self._batch_failed = True
+            print(f"❌ Error running {sql.split()[0]} statement: {e}")
+            return False
+        finally:
+            cursor.close()
+
+    def _rollback_write(self):
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("ROLLBACK TO SAVEPOINT bulk_write;")
+            cursor.close()
+        except Exception:
+            # The connection cannot even roll back to the savepoint: drop the whole transaction
+            self.conn.rollback()
+            self._transaction_lost = True
+
+    # Mark the end of a source batch; on_commit(succeeded) runs once its rows are committed
+    def end_batch(self, on_commit=None):
+        self.pending_batches.append((on_commit, self._batch_failed))
+        self._batch_failed = False
+        if self.uncommitted_rows >= self.commit_rows:
+            self.commit()
+
+    def commit(self):
+        try:
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            self.errors += 1
+            self._transaction_lost = True
+            print(f"❌ Error committing batch: {e}")
+
+        for on_commit, batch_failed in self.pending_batches:
+            if on_commit is not None:
+                on_commit(not batch_failed and not self._transaction_lost)
+        self.pending_batches = []
+        self.uncommitted_rows = 0
+        self._transaction_lost = False
+
+    # Print rows/sec per table for everything written through this writer
+    def report(self):
+        report_write_stats(self.stats)
+
+# Function to add one write to a writer's per-table stats (and to the process-wide metrics)
+def record_write_stats(stats, table_name, staged, inserted, seconds, updated=0):
+    table_stats = stats.setdefault(table_name, {"staged": 0, "inserted": 0, "updated": 0, "seconds": 0.0})
+    table_stats["staged"] += staged
+    table_stats["inserted"] += inserted
+    table_stats["updated"] += updated
+    table_stats["seconds"] += seconds
+    METRICS.observe("write_seconds", seconds, table=table_name)
+    METRICS.inc("rows_staged_total", staged, table=table_name)
+    METRICS.inc("rows_inserted_total", inserted, table=table_name)
+    if updated:
+        METRICS.inc("rows_updated_total", updated, table=table_name)
+
+# Function to print rows/sec per table
+def report_write_stats(stats):
+    for table_name, table_stats in stats.items():
+        seconds = table_stats["seconds"]
+        rate = table_stats["staged"] / seconds if seconds else 0.0
+        if table_stats["updated"]:
+            unchanged = table_stats["staged"] - table_stats["inserted"] - table_stats["updated"]
+            print(f"📊 {table_name}: {table_stats['inserted']} inserted, {table_stats['updated']} updated, "
+                  f"{unchanged} unchanged of {table_stats['staged']} rows in {seconds:.2f}s ({rate:,.0f} rows/sec)")
+        else:
+            print(f"📊 {table_name}: {table_stats['inserted']} of {table_stats['staged']} rows inserted "
+                  f"in {seconds:.2f}s ({rate:,.0f} rows/sec)")
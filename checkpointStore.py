@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from jsonStream import is_json_array
+
+# Where load progress is kept between runs
+DEFAULT_CHECKPOINT_PATH = ".load_checkpoints.json"
+
+# Only the head of the file is hashed, so appending to NDJSON keeps the checkpoint valid
+HASH_BYTES = 1024 * 1024
+
+# Function to hash the first `length` bytes of a file
+def prefix_hash(file_path, length):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        digest.update(file.read(length))
+    return digest.hexdigest()
+
+# Persisted per-file load progress: position after the last committed batch, keyed by path + content hash
+class CheckpointStore:
+    def __init__(self, checkpoint_path=DEFAULT_CHECKPOINT_PATH):
+        self.checkpoint_path = checkpoint_path
+        self.checkpoints = {}
+        self.blocked = set()  # Files whose checkpoint must not move past a failed batch
+        self._lock = threading.Lock()  # One store can be shared by loads running in threads (loadScheduler.py)
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path, 'r') as file:
+                self.checkpoints = json.load(file)
+
+    # Position to resume from (0 when the file is new or its head no longer matches)
+    def resume_position(self, file_path):
+        key = os.path.abspath(file_path)
+        with self._lock:  # Loads in other threads commit to (and iterate over) the same dict
+            checkpoint = self.checkpoints.get(key)
+            if not checkpoint:
+                return 0
+
+            hashed_bytes = checkpoint["hashed_bytes"]
+            if (os.path.getsize(file_path) < hashed_bytes
+                    or prefix_hash(file_path, hashed_bytes) != checkpoint["content_hash"]):
+                print(f"⚠️ {file_path} changed since the last run. Starting from the beginning.")
+                del self.checkpoints[key]
+                return 0
+
+            print(f"🔹 Resuming {file_path} after batch {checkpoint['batches']} "
+                  f"({checkpoint['records']} records already committed).")
+            return checkpoint["position"]
+
+    # Forget a file's progress so the next load starts from byte zero
+    def reset(self, file_path):
+        with self._lock:
+            self.checkpoints.pop(os.path.abspath(file_path), None)
+            self._save()
+
+    # Record a batch outcome; once a batch fails the checkpoint stays put for the rest of the run
+    def commit_batch(self, file_path, position, record_count, succeeded=True):
+        with self._lock:
+            self._commit_batch(os.path.abspath(file_path), file_path, position, record_count, succeeded)
+
+    def _commit_batch(self, key, file_path, position, record_count, succeeded):
+        if not succeeded and key not in self.blocked:
+            self.blocked.add(key)
+            print(f"⚠️ Batch ending at position {position} of {file_path} failed. Checkpoint not advanced.")
+        if key in self.blocked:
+            return
+
+        checkpoint = self.checkpoints.get(key, {"records": 0, "batches": 0})
+        # NDJSON positions are byte offsets; JSON arrays can only be checked against their whole head
+        is_byte_offset = not is_json_array(file_path)
+        hashed_bytes = min(HASH_BYTES, position if is_byte_offset else os.path.getsize(file_path))
+        if checkpoint.get("hashed_bytes") != hashed_bytes:
+            checkpoint["content_hash"] = prefix_hash(file_path, hashed_bytes)
+            checkpoint["hashed_bytes"] = hashed_bytes
+
+        checkpoint["position"] = position
+        checkpoint["records"] += record_count
+        checkpoint["batches"] += 1
+        checkpoint["updated_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.checkpoints[key] = checkpoint
+        self._save()
+
+    def _save(self):
+        temp_path = self.checkpoint_path + ".tmp"
+        with open(temp_path, 'w') as file:
+            json.dump(self.checkpoints, file, indent=2)
+        os.replace(temp_path, self.checkpoint_path)  # A crash never leaves a torn checkpoint file
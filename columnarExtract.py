@@ -0,0 +1,435 @@
+import argparse
+import json
+import os
+from checkpointStore import HASH_BYTES, prefix_hash
+from idNormalizer import BRAND_IDS, USER_IDS, normalize_id, stable_record_id
+from jsonStream import DEFAULT_BATCH_SIZE, iter_batches, iter_json_records
+from loadDiagnostics import DIAGNOSTICS
+from loadMetrics import METRICS
+from receiptIds import RECEIPT_NAMESPACE, stable_item_id, stable_receipt_id
+from validationRules import ReceiptValidation, brand_validator, get_path, user_validator
+
+# Where extracted tables are written (one sub-directory per table)
+DEFAULT_EXTRACT_DIR = "extract"
+
+# Rows per part file; parts are the unit of resume and of parallel reads
+DEFAULT_PART_ROWS = 1000000
+
+MANIFEST_NAME = "_manifest.json"
+
+# File extension per format: Arrow IPC files can be memory-mapped without a copy, Parquet is smaller on disk
+FORMAT_EXTENSIONS = {"arrow": ".arrow", "parquet": ".parquet"}
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("The columnar extract needs pyarrow (pip install pyarrow).") from None
+    return pyarrow
+
+# Column types of every extracted table. Ids are canonical UUID strings; timestamps are UTC milliseconds.
+# `loadable` is False where the loader's row transform would skip the record; `rule_failures` holds the
+# validation rules the raw record failed (bit i = rule i of the manifest's rule list).
+def table_schemas():
+    pa = _pyarrow()
+    timestamp = pa.timestamp("ms")
+    return {
+        "users": pa.schema([
+            ("source_id", pa.string()), ("user_id", pa.string()), ("user_state", pa.string()),
+            ("account_created_date", timestamp), ("last_login_date", timestamp), ("user_role", pa.string()),
+            ("is_active", pa.bool_()), ("loadable", pa.bool_()), ("rule_failures", pa.uint64()),
+        ]),
+        "brands": pa.schema([
+            ("source_id", pa.string()), ("brand_id", pa.string()), ("brand_title", pa.string()),
+            ("brand_category", pa.string()), ("brand_category_code", pa.string()), ("brand_barcode", pa.string()),
+            ("is_top_brand", pa.bool_()), ("loadable", pa.bool_()), ("rule_failures", pa.uint64()),
+        ]),
+        "receipts": pa.schema([
+            ("source_id", pa.string()), ("receipt_id", pa.string()), ("receipt_id_generated", pa.bool_()),
+            ("receipt_user_id", pa.string()), ("purchase_timestamp", timestamp), ("scanned_date", timestamp),
+            ("processing_finished_date", timestamp), ("receipt_status", pa.string()),
+            ("total_amount_spent", pa.float64()), ("items_purchased_count", pa.int64()),
+            ("reward_points_earned", pa.int64()), ("extra_bonus_points", pa.int64()),
+            ("points_awarded_timestamp", timestamp), ("loadable", pa.bool_()), ("rule_failures", pa.uint64()),
+        ]),
+        "receipt_items": pa.schema([
+            ("receipt_item_id", pa.string()), ("item_receipt_id", pa.string()), ("item_brand_id", pa.string()),
+            ("item_barcode", pa.string()), ("item_quantity", pa.int64()), ("item_price", pa.float64()),
+            ("item_scanned_date", timestamp), ("loadable", pa.bool_()), ("rule_failures", pa.uint64()),
+        ]),
+    }
+
+# Function to read a Mongo {"$date": ms} value as integer milliseconds (None when missing or malformed)
+def date_ms(value):
+    value = get_path(value, "$date")
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return int(value)
+
+# Function to convert a value the way the loaders do (None when the loader's conversion would raise)
+def _convert(value, default, convert):
+    try:
+        return convert(value or default), True
+    except (ValueError, TypeError):
+        return None, False
+
+def _to_int(value):
+    return int(float(value))
+
+# Row builders: one dict of column -> value per raw record, mirroring process_*_data in the loaders
+def user_row(record, validator):
+    source_id = get_path(record, "_id", "$oid")
+    state = record.get("state")
+    return {
+        "source_id": source_id,
+        "user_id": stable_record_id(record),
+        "user_state": state.strip()[:2] if isinstance(state, str) else None,
+        "account_created_date": date_ms(record.get("createdDate")),
+        "last_login_date": date_ms(record.get("lastLogin")),
+        "user_role": record.get("role", "consumer"),
+        "is_active": bool(record.get("active", True)),
+        "loadable": True,
+        "rule_failures": validator.failure_mask(record),
+    }
+
+def brand_row(record, validator):
+    source_id = get_path(record, "_id", "$oid")
+    return {
+        "source_id": source_id,
+        "brand_id": stable_record_id(record),
+        "brand_title": record.get("name", "Unknown Brand"),
+        "brand_category": record.get("category"),
+        "brand_category_code": record.get("categoryCode"),
+        "brand_barcode": record.get("barcode"),
+        "is_top_brand": bool(record.get("topBrand", False)),
+        "loadable": True,
+        "rule_failures": validator.failure_mask(record),
+    }
+
+# Receipts keep their FK columns as normalized ids; unknown users/brands are resolved at load time
+def receipt_rows(record, validation):
+    source_id = get_path(record, "_id", "$oid")
+    receipt_id = normalize_id(source_id, RECEIPT_NAMESPACE)
+    stable_id = receipt_id or stable_receipt_id(record)
+    total_spent, total_ok = _convert(record.get("totalSpent"), 0.0, float)
+    item_count, count_ok = _convert(record.get("purchasedItemCount"), 0, _to_int)
+    points, points_ok = _convert(record.get("pointsEarned"), 0, _to_int)
+    bonus_points, bonus_ok = _convert(record.get("bonusPointsEarned"), 0, _to_int)
+    loadable = total_ok and count_ok and points_ok and bonus_ok
+
+    receipt = {
+        "source_id": source_id,
+        "receipt_id": stable_id,
+        "receipt_id_generated": receipt_id is None,
+        "receipt_user_id": USER_IDS(record.get("userId")),
+        "purchase_timestamp": date_ms(record.get("purchaseDate")),
+        "scanned_date": date_ms(record.get("dateScanned")),
+        "processing_finished_date": date_ms(record.get("finishedDate")),
+        "receipt_status": record.get("rewardsReceiptStatus", "UNKNOWN"),
+        "total_amount_spent": total_spent,
+        "items_purchased_count": item_count,
+        "reward_points_earned": points,
+        "extra_bonus_points": bonus_points,
+        "points_awarded_timestamp": date_ms(record.get("pointsAwardedDate")),
+        "loadable": loadable,
+        "rule_failures": validation.receipts.failure_mask(record),
+    }
+
+    items = []
+    item_list = record.get("rewardsReceiptItemList")
+    if isinstance(item_list, list):
+        for position, item in enumerate(item_list):
+            if not isinstance(item, dict):
+                continue
+            quantity, quantity_ok = _convert(item.get("quantityPurchased"), 1, _to_int)
+            price, price_ok = _convert(item.get("finalPrice"), 0.00, float)
+            items.append({
+                "receipt_item_id": stable_item_id(stable_id, position, item.get("barcode")),
+                "item_receipt_id": stable_id,
+                "item_brand_id": BRAND_IDS(item.get("partnerItemId")),
+                "item_barcode": item.get("barcode"),
+                "item_quantity": quantity,
+                "item_price": price,
+                "item_scanned_date": receipt["scanned_date"],
+                "loadable": loadable and quantity_ok and price_ok,
+                "rule_failures": validation.receipt_items.failure_mask(item),
+            })
+    return receipt, items
+
+# Writes one table as a sequence of part files of at most `part_rows` rows
+class PartWriter:
+    def __init__(self, table_dir, schema, file_format="arrow", part_rows=DEFAULT_PART_ROWS):
+        self.table_dir = table_dir
+        self.schema = schema
+        self.file_format = file_format
+        self.part_rows = part_rows
+        self.parts = []
+        self.rows = 0
+        self._writer = None
+        self._part_rows_written = 0
+        os.makedirs(table_dir, exist_ok=True)
+        for name in os.listdir(table_dir):
+            if name.startswith("part-"):
+                os.remove(os.path.join(table_dir, name))  # Parts of an earlier extract would mix with these
+
+    def _open_part(self):
+        pa = _pyarrow()
+        path = os.path.join(self.table_dir, f"part-{len(self.parts):05d}{FORMAT_EXTENSIONS[self.file_format]}")
+        if self.file_format == "parquet":
+            self._writer = pa.parquet.ParquetWriter(path, self.schema, compression="zstd")
+        else:
+            self._writer = pa.ipc.new_file(path, self.schema)
+        self.parts.append(path)
+        self._part_rows_written = 0
+
+    def write_rows(self, rows):
+        pa = _pyarrow()
+        while rows:
+            if self._writer is None or self._part_rows_written >= self.part_rows:
+                self.close_part()
+                self._open_part()
+            chunk = rows[:self.part_rows - self._part_rows_written]
+            rows = rows[len(chunk):]
+            self._writer.write_table(pa.Table.from_pylist(chunk, schema=self.schema))
+            self._part_rows_written += len(chunk)
+            self.rows += len(chunk)
+
+    def close_part(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+# Function to describe a source file so a later run can tell whether its extract is still current
+def source_fingerprint(file_path):
+    return {
+        "path": os.path.abspath(file_path),
+        "size": os.path.getsize(file_path),
+        "content_hash": prefix_hash(file_path, HASH_BYTES),
+    }
+
+def read_manifest(extract_dir):
+    path = os.path.join(extract_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as file:
+        return json.load(file)
+
+def _save_manifest(extract_dir, manifest):
+    path = os.path.join(extract_dir, MANIFEST_NAME)
+    with open(path + ".tmp", 'w') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(path + ".tmp", path)
+
+def _rule_keys(validator):
+    return [[group, issue] for group, issue, _ in validator.rules]
+
+# Function to extract one source file into its table(s); returns {table: row count}
+def extract_source(source, file_path, extract_dir=DEFAULT_EXTRACT_DIR, file_format="arrow",
+                   part_rows=DEFAULT_PART_ROWS, batch_size=DEFAULT_BATCH_SIZE):
+    schemas = table_schemas()
+    if source == "receipts":
+        validation = ReceiptValidation()
+        validators = {"receipts": validation.receipts, "receipt_items": validation.receipt_items}
+    else:
+        validator = user_validator() if source == "users" else brand_validator()
+        validators = {source: validator}
+    writers = {table: PartWriter(os.path.join(extract_dir, table), schemas[table], file_format, part_rows)
+               for table in validators}
+
+    for records in iter_batches(iter_json_records(file_path), batch_size):
+        with METRICS.timer("extract", source=source):
+            if source == "receipts":
+                receipts, items = [], []
+                for record in records:
+                    receipt, receipt_items = receipt_rows(record, validation)
+                    receipts.append(receipt)
+                    items.extend(receipt_items)
+                writers["receipts"].write_rows(receipts)
+                writers["receipt_items"].write_rows(items)
+            else:
+                row = user_row if source == "users" else brand_row
+                writers[source].write_rows([row(record, validator) for record in records])
+    for writer in writers.values():
+        writer.close_part()
+
+    manifest = read_manifest(extract_dir)
+    manifest.setdefault("sources", {})[source] = source_fingerprint(file_path)
+    for table, writer in writers.items():
+        manifest.setdefault("tables", {})[table] = {
+            "source": source,
+            "format": file_format,
+            "parts": [os.path.basename(path) for path in writer.parts],
+            "rows": writer.rows,
+            "rules": _rule_keys(validators[table]),
+        }
+    _save_manifest(extract_dir, manifest)
+    return {table: writer.rows for table, writer in writers.items()}
+
+# Function to check whether the extract of `source` still matches the file it came from
+def is_extract_current(extract_dir, source, file_path):
+    recorded = read_manifest(extract_dir).get("sources", {}).get(source)
+    return recorded is not None and recorded == source_fingerprint(file_path)
+
+# Function to check whether a path is an extract directory rather than a JSON file
+def is_extract_dir(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, MANIFEST_NAME))
+
+# Function to list the part files of a table
+def table_parts(extract_dir, table):
+    table_info = read_manifest(extract_dir).get("tables", {}).get(table)
+    if table_info is None:
+        raise ValueError(f"{extract_dir} has no extracted {table} table. Run columnarExtract.py first.")
+    return [os.path.join(extract_dir, table, name) for name in table_info["parts"]]
+
+# Function to stream (row position, record batch) pairs of one part file, memory-mapped, from `start_row`
+def iter_part_batches(part_path, batch_size=DEFAULT_BATCH_SIZE, start_row=0, columns=None):
+    pa = _pyarrow()
+    if part_path.endswith(FORMAT_EXTENSIONS["parquet"]):
+        parquet_file = pa.parquet.ParquetFile(part_path, memory_map=True)
+        record_batches = parquet_file.iter_batches(batch_size=batch_size, columns=columns)
+    else:
+        reader = pa.ipc.open_file(pa.memory_map(part_path, 'r'))
+        record_batches = (reader.get_batch(index) for index in range(reader.num_record_batches))
+        if columns is not None:
+            record_batches = (batch.select(columns) for batch in record_batches)
+
+    position = 0
+    for record_batch in record_batches:
+        for offset in range(0, record_batch.num_rows, batch_size):
+            chunk = record_batch.slice(offset, batch_size)
+            chunk_start, position = position, position + chunk.num_rows
+            if position <= start_row:
+                continue
+            if chunk_start < start_row:
+                chunk = chunk.slice(start_row - chunk_start)
+            yield position, chunk
+
+# Function to read the first `count` rows of a table as dicts (for printing a sample)
+def head_rows(extract_dir, table, count=5):
+    rows = []
+    for part_path in table_parts(extract_dir, table):
+        for _, batch in iter_part_batches(part_path, count - len(rows)):
+            rows.extend(batch.to_pylist())
+            if len(rows) >= count:
+                return rows
+    return rows
+
+# Function to check a list of normalized ids against a key set or DimensionKeyCache
+def known_keys(ids, valid_ids):
+    if hasattr(valid_ids, "contains_many"):
+        return list(valid_ids.contains_many(ids))
+    return [value in valid_ids for value in ids]
+
+# Batch -> row tuples in the column order of bulkLoader.TABLE_SPECS, skipping rows the loaders would skip
+def users_batch_rows(batch):
+    columns = ["user_id", "user_state", "account_created_date", "last_login_date", "user_role", "is_active"]
+    return _loadable_rows(batch, columns)
+
+def brands_batch_rows(batch):
+    columns = ["brand_id", "brand_title", "brand_category", "brand_category_code", "brand_barcode", "is_top_brand"]
+    return _loadable_rows(batch, columns)
+
+def receipts_batch_rows(batch, valid_user_ids, default_user_id):
+    columns = ["receipt_id", "receipt_user_id", "purchase_timestamp", "scanned_date", "processing_finished_date",
+               "receipt_status", "total_amount_spent", "items_purchased_count", "reward_points_earned",
+               "extra_bonus_points", "points_awarded_timestamp"]
+    rows = _loadable_rows(batch, columns)
+    known = known_keys([row[1] for row in rows], valid_user_ids)
+    unknown = [row[0] for row, is_known in zip(rows, known) if not is_known]
+    if unknown:
+        DIAGNOSTICS.defaulted("receipts", "unknown_user", *unknown[:DIAGNOSTICS.exemplar_limit], count=len(unknown))
+    return [row if is_known else (row[0], default_user_id) + row[2:] for row, is_known in zip(rows, known)]
+
+def receipt_items_batch_rows(batch, valid_brand_ids, default_brand_id):
+    columns = ["receipt_item_id", "item_receipt_id", "item_brand_id", "item_barcode", "item_quantity", "item_price",
+               "item_scanned_date"]
+    rows = _loadable_rows(batch, columns)
+    known = known_keys([row[2] for row in rows], valid_brand_ids)
+    unknown = [row[0] for row, is_known in zip(rows, known) if not is_known]
+    if unknown:
+        DIAGNOSTICS.defaulted("receipt_items", "unknown_brand", *unknown[:DIAGNOSTICS.exemplar_limit],
+                              count=len(unknown))
+    return [row if is_known else row[:2] + (default_brand_id,) + row[3:] for row, is_known in zip(rows, known)]
+
+def _loadable_rows(batch, columns):
+    loadable = batch.column("loadable").to_pylist()
+    values = zip(*(batch.column(name).to_pylist() for name in columns))
+    return [row for row, keep in zip(values, loadable) if keep]
+
+# Function to stream loader rows from an extract: yields (part path, row position, rows) per batch,
+# resuming each part from its checkpoint (`restart` forgets the checkpoints first)
+def iter_extract_rows(extract_dir, table, to_rows, checkpoints, batch_size=DEFAULT_BATCH_SIZE, restart=False):
+    for part_path in table_parts(extract_dir, table):
+        if restart:
+            checkpoints.reset(part_path)
+        start_row = checkpoints.resume_position(part_path)
+        for position, batch in iter_part_batches(part_path, batch_size, start_row):
+            yield part_path, position, to_rows(batch)
+
+# Fill a RecordValidator from the stored failure masks of a table instead of re-reading the JSON
+def validate_table(extract_dir, table, validator, id_column=None, foreign_key=None):
+    pa = _pyarrow()
+    import pyarrow.compute as pc
+
+    table_info = read_manifest(extract_dir)["tables"][table]
+    stored_rules = [tuple(rule) for rule in table_info["rules"]]
+    bits = {}
+    for group, issue, _ in validator.rules:
+        if (group, issue) in stored_rules:
+            bits[(group, issue)] = stored_rules.index((group, issue))
+        elif foreign_key is None or (group, issue) != foreign_key[0]:
+            raise ValueError(f"{table} was extracted without the rule {issue!r}. Re-run columnarExtract.py.")
+
+    columns = ["rule_failures"] + [column for column in (id_column, foreign_key and foreign_key[1]) if column]
+    for part_path in table_parts(extract_dir, table):
+        for _, batch in iter_part_batches(part_path, DEFAULT_PART_ROWS, columns=columns):
+            masks = batch.column("rule_failures")
+            counts = {key: pc.sum(pc.not_equal(pc.bit_wise_and(masks, pa.scalar(1 << bit, pa.uint64())),
+                                               pa.scalar(0, pa.uint64()))).as_py() or 0
+                      for key, bit in bits.items()}
+            if foreign_key is not None:
+                rule_key, column, valid_ids = foreign_key
+                counts[rule_key] = known_keys(batch.column(column).to_pylist(), valid_ids).count(False)
+            validator.add_counts(batch.num_rows, counts)
+            if id_column and validator.duplicates is not None:
+                for key in batch.column(id_column).to_pylist():
+                    if key is not None:
+                        validator.duplicates.add(key)
+
+def validate_users_extract(extract_dir, validator):
+    validate_table(extract_dir, "users", validator, id_column="source_id")
+
+def validate_brands_extract(extract_dir, validator):
+    validate_table(extract_dir, "brands", validator, id_column="source_id")
+
+def validate_receipts_extract(extract_dir, validation, valid_user_ids=None, valid_brand_ids=None):
+    user_key = (("unknown_foreign_keys", "user_id"), "receipt_user_id", valid_user_ids) if valid_user_ids is not None else None
+    brand_key = (("unknown_foreign_keys", "brand_id"), "item_brand_id", valid_brand_ids) if valid_brand_ids is not None else None
+    validate_table(extract_dir, "receipts", validation.receipts, id_column="source_id", foreign_key=user_key)
+    validate_table(extract_dir, "receipt_items", validation.receipt_items, foreign_key=brand_key)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the JSON exports once into typed Arrow/Parquet tables.")
+    parser.add_argument("--users", default="users.json")
+    parser.add_argument("--brands", default="brands.json")
+    parser.add_argument("--receipts", default="receipts.json")
+    parser.add_argument("--out-dir", default=DEFAULT_EXTRACT_DIR)
+    parser.add_argument("--format", choices=sorted(FORMAT_EXTENSIONS), default="arrow",
+                        help="'arrow' for memory-mapped reads, 'parquet' for smaller files")
+    parser.add_argument("--part-rows", type=int, default=DEFAULT_PART_ROWS)
+    parser.add_argument("--force", action="store_true", help="Re-extract sources whose extract is still current")
+    args = parser.parse_args()
+
+    for source in ("users", "brands", "receipts"):
+        file_path = getattr(args, source)
+        if not os.path.exists(file_path):
+            print(f"⚠️ {file_path} not found. Skipping {source}.")
+            continue
+        if not args.force and is_extract_current(args.out_dir, source, file_path):
+            print(f"🔹 {source} extract is up to date.")
+            continue
+        counts = extract_source(source, file_path, args.out_dir, args.format, args.part_rows)
+        print(f"✅ Extracted {file_path}: " + ", ".join(f"{rows} {table} rows" for table, rows in counts.items()))
+    DIAGNOSTICS.report()
@@ -11,6 +11,7 @@ CREATE TABLE IF NOT EXISTS public.dim_brands
     brand_category_code character varying(50) COLLATE pg_catalog."default",
     brand_barcode character varying(50) COLLATE pg_catalog."default",
     is_top_brand boolean DEFAULT false,
+    row_hash bytea,
     CONSTRAINT dim_brands_pkey PRIMARY KEY (brand_id)
 );
 
@@ -22,19 +23,29 @@ CREATE TABLE IF NOT EXISTS public.dim_users
     last_login_date timestamp without time zone,
     user_role character varying(20) COLLATE pg_catalog."default" DEFAULT 'consumer'::character varying,
     is_active boolean DEFAULT true,
+    row_hash bytea,
     CONSTRAINT dim_users_pkey PRIMARY KEY (user_id)
 );
 
-CREATE TABLE IF NOT EXISTS public.fact_receipt_items
-(
-    receipt_item_id uuid NOT NULL,
-    item_receipt_id uuid,
-    item_brand_id uuid,
-    item_barcode character varying(50) COLLATE pg_catalog."default",
-    item_quantity integer DEFAULT 1,
-    item_price numeric(10, 2) DEFAULT 0.00,
-    CONSTRAINT fact_receipt_items_pkey PRIMARY KEY (receipt_item_id)
-);
+-- The fact tables are range-partitioned by scanned_date month (as migrations/002_partition_facts.sql does to
+-- an existing database). Keys include the partition column, and every item carries its receipt's scanned date.
+CREATE OR REPLACE FUNCTION public.ensure_fact_partitions(month date) RETURNS void
+LANGUAGE plpgsql AS $$
+DECLARE
+    month_start date := date_trunc('month', month)::date;
+    month_end date := (date_trunc('month', month) + INTERVAL '1 month')::date;
+    suffix text := to_char(month_start, '"y"YYYY"m"MM');
+BEGIN
+    IF to_regclass('public.fact_receipts_' || suffix) IS NULL THEN
+        EXECUTE format('CREATE TABLE public.%I PARTITION OF public.fact_receipts FOR VALUES FROM (%L) TO (%L)',
+                       'fact_receipts_' || suffix, month_start, month_end);
+    END IF;
+    IF to_regclass('public.fact_receipt_items_' || suffix) IS NULL THEN
+        EXECUTE format('CREATE TABLE public.%I PARTITION OF public.fact_receipt_items FOR VALUES FROM (%L) TO (%L)',
+                       'fact_receipt_items_' || suffix, month_start, month_end);
+    END IF;
+END;
+$$;
 
 CREATE TABLE IF NOT EXISTS public.fact_receipts
 (
@@ -49,8 +60,20 @@ CREATE TABLE IF NOT EXISTS public.fact_receipts
     reward_points_earned integer DEFAULT 0,
     extra_bonus_points integer DEFAULT 0,
     points_awarded_timestamp timestamp without time zone,
-    CONSTRAINT fact_receipts_pkey PRIMARY KEY (receipt_id)
-);
+    CONSTRAINT fact_receipts_pkey PRIMARY KEY (receipt_id, scanned_date)
+) PARTITION BY RANGE (scanned_date);
+
+CREATE TABLE IF NOT EXISTS public.fact_receipt_items
+(
+    receipt_item_id uuid NOT NULL,
+    item_receipt_id uuid,
+    item_brand_id uuid,
+    item_barcode character varying(50) COLLATE pg_catalog."default",
+    item_quantity integer DEFAULT 1,
+    item_price numeric(10, 2) DEFAULT 0.00,
+    item_scanned_date timestamp without time zone NOT NULL,
+    CONSTRAINT fact_receipt_items_pkey PRIMARY KEY (receipt_item_id, item_scanned_date)
+) PARTITION BY RANGE (item_scanned_date);
 
 ALTER TABLE IF EXISTS public.fact_receipt_items
     ADD CONSTRAINT fact_receipt_items_item_brand_id_fkey FOREIGN KEY (item_brand_id)
@@ -60,8 +83,8 @@ ALTER TABLE IF EXISTS public.fact_receipt_items
 
 
 ALTER TABLE IF EXISTS public.fact_receipt_items
-    ADD CONSTRAINT fact_receipt_items_item_receipt_id_fkey FOREIGN KEY (item_receipt_id)
-    REFERENCES public.fact_receipts (receipt_id) MATCH SIMPLE
+    ADD CONSTRAINT fact_receipt_items_item_receipt_id_fkey FOREIGN KEY (item_receipt_id, item_scanned_date)
+    REFERENCES public.fact_receipts (receipt_id, scanned_date) MATCH SIMPLE
     ON UPDATE NO ACTION
     ON DELETE CASCADE;
 
@@ -72,4 +95,17 @@ ALTER TABLE IF EXISTS public.fact_receipts
     ON UPDATE NO ACTION
     ON DELETE CASCADE;
 
+-- Indexes for the Analysis-ReadMe.md queries (created on every partition, current and future)
+CREATE INDEX IF NOT EXISTS fact_receipts_scanned_date_idx ON public.fact_receipts (scanned_date);
+CREATE INDEX IF NOT EXISTS fact_receipts_user_idx ON public.fact_receipts (receipt_user_id);
+CREATE INDEX IF NOT EXISTS fact_receipts_status_idx ON public.fact_receipts (receipt_status) INCLUDE (total_amount_spent);
+CREATE INDEX IF NOT EXISTS fact_receipt_items_receipt_idx ON public.fact_receipt_items (item_receipt_id, item_scanned_date);
+CREATE INDEX IF NOT EXISTS fact_receipt_items_brand_idx ON public.fact_receipt_items (item_brand_id);
+CREATE INDEX IF NOT EXISTS dim_users_created_date_idx ON public.dim_users (account_created_date);
+
+-- Partitions for the current month and the next twelve; loads create any other month on demand
+SELECT public.ensure_fact_partitions(month::date)
+FROM generate_series(date_trunc('month', now()), date_trunc('month', now()) + INTERVAL '12 months',
+                     INTERVAL '1 month') AS month;
+
 END;
@@ -0,0 +1,37 @@
+import threading
+from contextlib import contextmanager
+
+# Upper bound of open connections per database
+DEFAULT_MAX_CONNECTIONS = 4
+
+# One pool per set of connection parameters, shared by every loader in the process
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Function to get (or lazily open) the pool for a database. psycopg2 is imported here, so the modules
+# importing this one still load without it (e.g. benchmarkLoad --sink null)
+def get_pool(db_params, max_connections=DEFAULT_MAX_CONNECTIONS):
+    from psycopg2.pool import ThreadedConnectionPool
+
+    key = tuple(sorted(db_params.items()))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ThreadedConnectionPool(1, max_connections, **db_params)
+        return _pools[key]
+
+# Borrow a connection for the duration of a `with` block; it goes back to the pool afterwards
+@contextmanager
+def pooled_connection(db_params):
+    pool = get_pool(db_params)
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)  # Rolls back anything left uncommitted before the next borrower gets it
+
+# Function to close every pooled connection (end of process)
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.closeall()
+        _pools.clear()
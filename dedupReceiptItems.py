@@ -0,0 +1,153 @@
+import argparse
+
+from addingReceipts import get_valid_brand_ids, get_valid_user_ids, process_receipts_data
+from bulkLoader import TABLE_SPECS, copy_sql, create_staging_sql, rows_to_csv, staging_table_name
+from dbPool import pooled_connection
+from fetchEtl.config import db_params, paths
+from jsonStream import DEFAULT_BATCH_SIZE, iter_batches, iter_json_records
+
+# Loads before content-derived ids gave a receipt a new random id on every run (ObjectId `_id`s never parsed as
+# UUIDs), so the duplicates are whole receipts under different ids. Two receipts are the same when their user,
+# dates, total and items (brand, barcode, quantity, price; in any order) are.
+
+# Function to select (receipt_id, scanned_date, signature) of the receipts in `receipts`, with their items in `items`
+def signature_sql(receipts, items, where=""):
+    return f"""
+        SELECT r.receipt_id, r.scanned_date,
+               md5(format('%L|%L|%L|%L|', r.receipt_user_id, r.scanned_date, r.purchase_timestamp,
+                          r.total_amount_spent)
+                   || COALESCE((SELECT string_agg(format('%L,%L,%L,%L', i.item_brand_id, i.item_barcode,
+                                                         i.item_quantity, i.item_price), ';'
+                                                  ORDER BY i.item_brand_id, i.item_barcode, i.item_quantity,
+                                                           i.item_price)
+                                FROM {items} AS i
+                                WHERE i.item_receipt_id = r.receipt_id AND i.item_scanned_date = r.scanned_date),
+                               '')) AS signature
+        FROM {receipts} AS r
+        {where}"""
+
+# Receipts and items in total, and the receipts (with their items) repeating the content of another receipt
+DUPLICATE_STATS_SQL = f"""
+    WITH signatures AS ({signature_sql("fact_receipts", "fact_receipt_items")}),
+    duplicates AS (
+        SELECT receipt_id, scanned_date
+        FROM (SELECT receipt_id, scanned_date,
+                     ROW_NUMBER() OVER (PARTITION BY signature ORDER BY receipt_id) AS copy
+              FROM signatures) AS numbered
+        WHERE copy > 1
+    )
+    SELECT (SELECT COUNT(*) FROM fact_receipts),
+           (SELECT COUNT(*) FROM fact_receipt_items),
+           (SELECT COUNT(*) FROM duplicates),
+           (SELECT COUNT(*) FROM fact_receipt_items AS i
+            JOIN duplicates AS d ON d.receipt_id = i.item_receipt_id AND d.scanned_date = i.item_scanned_date);
+"""
+
+STAGED_RECEIPTS = staging_table_name("fact_receipts")
+STAGED_ITEMS = staging_table_name("fact_receipt_items")
+
+# Loaded receipts with the content of a receipt of this batch (staged under its stable id), and the one kept
+# per stable id: the row already under the stable id, else the lowest id
+MATCH_DUPLICATES_SQL = f"""
+    CREATE TEMP TABLE IF NOT EXISTS dedup_matches (receipt_id uuid, scanned_date timestamp, stable_id uuid,
+                                                   survivor boolean);
+    TRUNCATE dedup_matches;
+    WITH staged AS (
+        SELECT DISTINCT ON (signature) *  -- Source receipts with equal content collapse into the first one too
+        FROM ({signature_sql(STAGED_RECEIPTS, STAGED_ITEMS)}) AS staged_signatures
+        ORDER BY signature, receipt_id
+    ),
+    loaded AS ({signature_sql("fact_receipts", "fact_receipt_items",
+                              f"WHERE r.scanned_date IN (SELECT scanned_date FROM {STAGED_RECEIPTS})")}),
+    matches AS (
+        SELECT loaded.receipt_id, loaded.scanned_date, staged.receipt_id AS stable_id
+        FROM loaded JOIN staged ON staged.signature = loaded.signature AND staged.scanned_date = loaded.scanned_date
+    )
+    INSERT INTO dedup_matches
+    SELECT receipt_id, scanned_date, stable_id,
+           ROW_NUMBER() OVER (PARTITION BY stable_id ORDER BY receipt_id <> stable_id, receipt_id) = 1
+    FROM matches;
+"""
+
+# Drop the items of every match and the receipts that are not kept, then re-key the kept receipt to its
+# stable id (its items are gone, so no FK points at the old id) and insert its content-keyed items
+DEDUP_STATEMENTS = [
+    """DELETE FROM fact_receipt_items AS i USING dedup_matches AS m
+       WHERE i.item_receipt_id = m.receipt_id AND i.item_scanned_date = m.scanned_date;""",
+    """DELETE FROM fact_receipts AS r USING dedup_matches AS m
+       WHERE r.receipt_id = m.receipt_id AND r.scanned_date = m.scanned_date AND NOT m.survivor;""",
+    """UPDATE fact_receipts AS r SET receipt_id = m.stable_id FROM dedup_matches AS m
+       WHERE r.receipt_id = m.receipt_id AND r.scanned_date = m.scanned_date AND m.survivor
+         AND m.receipt_id <> m.stable_id;""",
+]
+
+def reinsert_items_sql():
+    columns = ", ".join(TABLE_SPECS["fact_receipt_items"]["columns"])
+    return f"""
+        INSERT INTO fact_receipt_items ({columns})
+        SELECT {columns} FROM {STAGED_ITEMS}
+        WHERE item_receipt_id IN (SELECT stable_id FROM dedup_matches)
+        ON CONFLICT ({TABLE_SPECS["fact_receipt_items"]["conflict_key"]}) DO NOTHING;
+    """
+
+def print_duplicate_stats(conn, label):
+    cursor = conn.cursor()
+    cursor.execute(DUPLICATE_STATS_SQL)
+    receipts, items, duplicate_receipts, duplicate_items = cursor.fetchone()
+    cursor.close()
+    print(f"📊 {label}: {receipts} receipts ({duplicate_receipts} repeating another receipt's content), "
+          f"{items} receipt item rows ({duplicate_items} on those repeats).")
+
+# One-off cleanup of the receipts loaded more than once under random ids: for each receipt of the source file,
+# the loaded receipts with its content are collapsed into one row under its stable id, with content-keyed items
+# (one transaction per batch, so an interrupted run leaves every receipt either untouched or deduplicated).
+# Receipts that are not loaded yet are left to addingReceipts.py.
+def rekey_receipt_items(file_path="receipts.json", batch_size=DEFAULT_BATCH_SIZE, dry_run=False):
+    valid_user_ids = get_valid_user_ids()
+    valid_brand_ids = get_valid_brand_ids()
+
+    with pooled_connection(db_params) as conn:
+        print_duplicate_stats(conn, "Before")
+        if dry_run:
+            return
+
+        removed = 0
+        rekeyed = 0
+        inserted = 0
+        for records in iter_batches(iter_json_records(file_path), batch_size):
+            receipts_data, receipt_items_data = process_receipts_data(records, valid_user_ids, valid_brand_ids)
+            cursor = conn.cursor()
+            try:
+                for table_name, rows in (("fact_receipts", receipts_data),
+                                         ("fact_receipt_items", receipt_items_data)):
+                    cursor.execute(create_staging_sql(table_name))
+                    cursor.copy_expert(copy_sql(table_name), rows_to_csv(rows))
+                cursor.execute(MATCH_DUPLICATES_SQL)
+                counts = []
+                for statement in DEDUP_STATEMENTS:
+                    cursor.execute(statement)
+                    counts.append(cursor.rowcount)
+                cursor.execute(reinsert_items_sql())
+                counts.append(cursor.rowcount)
+                conn.commit()
+                removed += counts[1]
+                rekeyed += counts[2]
+                inserted += counts[3]
+            except Exception as e:
+                conn.rollback()
+                print(f"❌ Error deduplicating receipts: {e}")
+            finally:
+                cursor.close()
+
+        print(f"✅ Removed {removed} duplicate receipts, re-keyed {rekeyed} receipts to their stable id and "
+              f"inserted {inserted} content-keyed item rows.")
+        print_duplicate_stats(conn, "After")
+        print("🔹 If the rollup tables are in use, run `python rollups.py --rebuild`.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collapse receipts loaded more than once under random ids.")
+    parser.add_argument("file_path", nargs="?", default=paths["receipts"])
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="Only report the current duplicate counts")
+    args = parser.parse_args()
+    rekey_receipt_items(args.file_path, args.batch_size, args.dry_run)
@@ -0,0 +1,129 @@
+import hashlib
+import os
+import uuid
+import numpy as np
+
+from idNormalizer import format_uuid
+
+# Where key snapshots are kept between runs
+DEFAULT_SNAPSHOT_DIR = ".dimension_cache"
+
+# Function to turn a UUID string into its 16-byte form (None if it is not a UUID)
+def uuid_to_bytes(value):
+    formatted = format_uuid(value)
+    return None if formatted is None else bytes.fromhex(formatted.replace("-", ""))
+
+# Sorted array of 16-byte UUID keys for one dimension table, with an incremental on-disk snapshot
+class DimensionKeyCache:
+    def __init__(self, table_name, key_column, snapshot_dir=DEFAULT_SNAPSHOT_DIR):
+        self.table_name = table_name
+        self.key_column = key_column
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_path = os.path.join(snapshot_dir, f"{table_name}.npz")  # Per database once refreshed
+        self.keys = np.empty(0, dtype="S16")
+        self.watermark = None  # Oldest transaction id that may not be in the snapshot yet
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    # Membership test so the cache can stand in for the old `set` of key strings
+    def __contains__(self, value):
+        key = uuid_to_bytes(value)
+        found = key is not None and self._find(key)
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return found
+
+    def _find(self, key):
+        position = np.searchsorted(self.keys, key)
+        # Elements of an "S16" array come back without trailing NUL bytes
+        return position < len(self.keys) and self.keys[position] == key.rstrip(b"\x00")
+
+    # Vectorized membership test for a sequence of UUID strings (None counts as a miss)
+    def contains_many(self, values):
+        keys = [uuid_to_bytes(value) for value in values]
+        present = np.array([key is not None for key in keys], dtype=bool)
+        found = np.zeros(len(keys), dtype=bool)
+        found[present] = self.contains_keys(np.array([key for key in keys if key is not None], dtype="S16"))
+        self.misses += len(keys) - int(present.sum())
+        return found
+
+    # Vectorized membership test for an "S16" array of 16-byte keys
+    def contains_keys(self, lookup):
+        found = np.zeros(len(lookup), dtype=bool)
+        if len(lookup) and len(self.keys):
+            positions = np.minimum(np.searchsorted(self.keys, lookup), len(self.keys) - 1)
+            found = self.keys[positions] == lookup
+        hit_count = int(found.sum())
+        self.hits += hit_count
+        self.misses += len(lookup) - hit_count
+        return found
+
+    def load_snapshot(self):
+        if not os.path.exists(self.snapshot_path):
+            return False
+        with np.load(self.snapshot_path) as snapshot:
+            self.keys = snapshot["keys"]
+            self.watermark = int(snapshot["watermark"])
+        return True
+
+    def save_snapshot(self):
+        os.makedirs(os.path.dirname(self.snapshot_path) or ".", exist_ok=True)
+        temp_path = self.snapshot_path + ".tmp.npz"
+        np.savez(temp_path, keys=self.keys, watermark=np.int64(self.watermark))
+        os.replace(temp_path, self.snapshot_path)  # Never leave a half-written snapshot behind
+
+    # Snapshots are kept per server and database, so loads into different databases never share keys
+    def _snapshot_path_for(self, database):
+        digest = hashlib.sha1("|".join(map(str, database)).encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.snapshot_dir, f"{self.table_name}.{digest}.npz")
+
+    def _pull_keys(self, cursor, since=None):
+        if since is None:
+            cursor.execute(f"SELECT {self.key_column} FROM {self.table_name};")
+        else:
+            cursor.execute(f"SELECT {self.key_column} FROM {self.table_name} WHERE xmin::text::bigint >= %s;",
+                           (since & 0xFFFFFFFF,))
+        return np.array([uuid.UUID(str(row[0])).bytes for row in cursor.fetchall()], dtype="S16")
+
+    # Bring the cache up to date: reuse the snapshot and only pull rows written since its watermark
+    def refresh(self, conn, full=False):
+        cursor = conn.cursor()
+        cursor.execute("SELECT txid_snapshot_xmin(txid_current_snapshot()), current_database(), "
+                       "inet_server_addr()::text, inet_server_port();")
+        new_watermark, *database = cursor.fetchone()
+        self.snapshot_path = self._snapshot_path_for(database)
+
+        # xmin is 32 bits; if the txid epoch moved since the snapshot, fall back to a full pull
+        incremental = (not full and self.load_snapshot()
+                       and self.watermark is not None and self.watermark >> 32 == new_watermark >> 32)
+
+        if incremental:
+            new_keys = self._pull_keys(cursor, self.watermark)
+            keys = np.union1d(self.keys, new_keys)
+            # The xmin pull only sees new rows: keys are unique, so more cached keys than rows means some were
+            # deleted (or the table truncated) since the snapshot, and only a full pull drops them
+            cursor.execute(f"SELECT count(*) FROM {self.table_name};")
+            if cursor.fetchone()[0] != len(keys):
+                print(f"🔹 {self.table_name} changed beyond new rows since the key snapshot; reloading all keys.")
+                incremental = False
+        if not incremental:
+            new_keys = self._pull_keys(cursor)
+            keys = np.unique(new_keys)
+        cursor.close()
+
+        self.keys = keys
+        self.watermark = new_watermark
+        self.save_snapshot()
+
+        mode = "incremental" if incremental else "full"
+        print(f"🔹 {self.table_name} key cache: {len(new_keys)} keys pulled ({mode}), {len(self.keys)} cached.")
+
+    def report(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        print(f"📊 {self.table_name} key cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1%} hit rate)")
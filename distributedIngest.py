@@ -0,0 +1,442 @@
+import argparse
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from bulkLoader import BulkWriter
+from dbPool import pooled_connection
+from factPartitions import write_partitioned
+from fetchEtl.config import db_params
+from jsonStream import DEFAULT_BATCH_SIZE, is_json_array, iter_batches, iter_json_records
+from loadMetrics import METRICS, add_metrics_arguments, run_instrumented
+from parallelReceipts import iter_range_records, split_byte_ranges
+
+# Receipts ingest spread over several processes or machines:
+#   python distributedIngest.py enqueue receipts.json ...   coordinator: split the input into work units
+#   python distributedIngest.py work                        any number of workers, on any node
+#   python distributedIngest.py status
+# A unit is a byte range of an NDJSON file (a JSON-array file is one unit); paths must be the same on every
+# node. Workers claim units from ingest_work_units (migrations/004_ingest_work_queue.sql) with
+# FOR UPDATE SKIP LOCKED, or from a shared directory with --queue-dir. A unit's rows and its "done" mark
+# are committed in one transaction, so a retried or taken-over unit never commits twice (which keeps
+# --rollups counts exact).
+
+# Bytes of NDJSON per work unit (one transaction per unit)
+DEFAULT_UNIT_BYTES = 64 * 1024 * 1024
+
+# Claims of a unit before it is left as failed
+DEFAULT_MAX_ATTEMPTS = 3
+
+# A running unit whose lease was not renewed within this time is handed to another worker
+DEFAULT_LEASE_SECONDS = 15 * 60
+# Renewals per lease period while a worker is still processing its unit
+LEASE_RENEWALS_PER_PERIOD = 3
+
+# Function to split input files into work units, skipping the bytes already covered by earlier units
+# (so an appended NDJSON file only gets units for its new tail)
+def split_work_units(file_paths, queue, unit_bytes=DEFAULT_UNIT_BYTES):
+    units = []
+    for file_path in file_paths:
+        file_path = os.path.abspath(file_path)
+        covered = queue.covered_end(file_path)
+        if is_json_array(file_path):
+            ranges = [] if covered else [(0, os.path.getsize(file_path))]  # Cannot be split by byte range
+        else:
+            ranges = split_byte_ranges(file_path, unit_bytes, covered)
+        units.extend({"unit_id": f"{file_path}:{start}-{end}", "file_path": file_path, "start": start, "end": end}
+                     for start, end in ranges)
+    return units
+
+# Function to parse the records of one unit
+def iter_unit_records(unit):
+    if is_json_array(unit["file_path"]):
+        return iter_json_records(unit["file_path"])
+    return iter_range_records(unit["file_path"], unit["start"], unit["end"])
+
+# Queue backed by ingest_work_units; claims skip rows other workers have locked
+class PostgresWorkQueue:
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+
+    def _execute(self, sql, params=(), fetch=False):
+        with pooled_connection(db_params) as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(sql, params)
+                rows = cursor.fetchall() if fetch else cursor.rowcount
+                conn.commit()
+                return rows
+            finally:
+                cursor.close()
+
+    def covered_end(self, file_path):
+        rows = self._execute("SELECT MAX(end_offset) FROM ingest_work_units WHERE file_path = %s;", (file_path,),
+                             fetch=True)
+        return rows[0][0] or 0
+
+    def enqueue(self, units):
+        added = 0
+        for unit in units:
+            added += self._execute(
+                """INSERT INTO ingest_work_units (unit_id, file_path, start_offset, end_offset)
+                   VALUES (%s, %s, %s, %s) ON CONFLICT (unit_id) DO NOTHING;""",
+                (unit["unit_id"], unit["file_path"], unit["start"], unit["end"]))
+        return added
+
+    # Claim the next pending unit, or one whose lease expired (its worker died or stalled)
+    def claim(self, worker_id):
+        rows = self._execute(
+            """UPDATE ingest_work_units
+               SET status = 'failed', last_error = 'lease expired on the last attempt'
+               WHERE status = 'running' AND claimed_at < now() - make_interval(secs => %s) AND attempts >= %s;
+
+               UPDATE ingest_work_units AS unit
+               SET status = 'running', claimed_by = %s, claimed_at = now(), attempts = unit.attempts + 1
+               FROM (
+                   SELECT unit_id FROM ingest_work_units
+                   WHERE (status = 'pending' OR (status = 'running' AND claimed_at < now() - make_interval(secs => %s)))
+                     AND attempts < %s
+                   ORDER BY file_path, start_offset
+                   LIMIT 1
+                   FOR UPDATE SKIP LOCKED
+               ) AS next_unit
+               WHERE unit.unit_id = next_unit.unit_id
+               RETURNING unit.unit_id, unit.file_path, unit.start_offset, unit.end_offset, unit.attempts;""",
+            (self.lease_seconds, self.max_attempts, worker_id, self.lease_seconds, self.max_attempts), fetch=True)
+        if not rows:
+            return None
+        unit_id, file_path, start, end, attempts = rows[0]
+        return {"unit_id": unit_id, "file_path": file_path, "start": start, "end": end, "attempts": attempts}
+
+    # Restart the lease of a unit this worker is still processing; False when another worker has taken it over
+    def renew(self, unit, worker_id):
+        return self._execute(
+            """UPDATE ingest_work_units SET claimed_at = now()
+               WHERE unit_id = %s AND claimed_by = %s AND status = 'running';""",
+            (unit["unit_id"], worker_id)) == 1
+
+    # Mark the unit done inside the transaction of its writes; False when another worker has taken it over
+    def record_commit(self, conn, unit, worker_id, counts):
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                """UPDATE ingest_work_units
+                   SET status = 'done', finished_at = now(), receipt_rows = %s, item_rows = %s, last_error = NULL
+                   WHERE unit_id = %s AND claimed_by = %s AND status = 'running';""",
+                (counts[0], counts[1], unit["unit_id"], worker_id))
+            return cursor.rowcount == 1
+        finally:
+            cursor.close()
+
+    def finish(self, unit, counts):
+        pass  # Already marked by record_commit
+
+    # The worker that took the unit over finishes it
+    def lost(self, unit):
+        pass
+
+    def fail(self, unit, worker_id, error):
+        self._execute(
+            """UPDATE ingest_work_units
+               SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END, last_error = %s, claimed_by = NULL
+               WHERE unit_id = %s AND claimed_by = %s;""",
+            (self.max_attempts, str(error), unit["unit_id"], worker_id))
+
+    def status(self):
+        rows = self._execute(
+            "SELECT status, COUNT(*), COALESCE(SUM(receipt_rows), 0) FROM ingest_work_units GROUP BY status;",
+            fetch=True)
+        return {status: (units, receipts) for status, units, receipts in rows}
+
+# Local stand-in for the Postgres queue: one JSON file per unit, moved between state directories with
+# atomic renames (only one worker wins a rename). Commits are recorded in ingest_unit_commits, in the
+# transaction of the unit's writes, so a unit whose file move was lost in a crash is not committed twice.
+class FileWorkQueue:
+    STATES = ("pending", "running", "done", "failed")
+
+    def __init__(self, directory, max_attempts=DEFAULT_MAX_ATTEMPTS, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.directory = directory
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        for state in self.STATES:
+            os.makedirs(os.path.join(directory, state), exist_ok=True)
+
+    def _path(self, state, unit_id):
+        return os.path.join(self.directory, state, hashlib.sha1(unit_id.encode()).hexdigest() + ".json")
+
+    def _read(self, path):
+        with open(path, 'r') as file:
+            return json.load(file)
+
+    def _write(self, path, unit):
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as file:
+            json.dump(unit, file)
+        os.replace(temp_path, path)
+
+    def _units(self, state):
+        folder = os.path.join(self.directory, state)
+        return sorted(os.path.join(folder, name) for name in os.listdir(folder) if name.endswith(".json"))
+
+    def covered_end(self, file_path):
+        ends = [unit["end"] for state in self.STATES for unit in map(self._read, self._units(state))
+                if unit["file_path"] == file_path]
+        return max(ends, default=0)
+
+    def enqueue(self, units):
+        added = 0
+        for unit in units:
+            if any(os.path.exists(self._path(state, unit["unit_id"])) for state in self.STATES):
+                continue
+            self._write(self._path("pending", unit["unit_id"]), dict(unit, attempts=0))
+            added += 1
+        return added
+
+    # Put units whose lease expired back in pending (or in failed once out of attempts)
+    def _reclaim_expired(self):
+        now = time.time()
+        for path in self._units("running"):
+            try:
+                if now - os.path.getmtime(path) < self.lease_seconds:
+                    continue
+                unit = self._read(path)
+                state = "failed" if unit["attempts"] >= self.max_attempts else "pending"
+                os.rename(path, self._path(state, unit["unit_id"]))
+            except FileNotFoundError:
+                continue  # Finished or reclaimed by another worker meanwhile
+
+    def claim(self, worker_id):
+        self._reclaim_expired()
+        for path in self._units("pending"):
+            running_path = os.path.join(self.directory, "running", os.path.basename(path))
+            try:
+                os.rename(path, running_path)
+            except FileNotFoundError:
+                continue  # Another worker claimed it first
+            unit = self._read(running_path)
+            unit["attempts"] += 1
+            unit["claimed_by"] = worker_id
+            self._write(running_path, unit)  # Also restarts the lease (mtime)
+            return unit
+        return None
+
+    # Restart the lease (the running file's mtime) of a unit this worker is still processing
+    def renew(self, unit, worker_id):
+        path = self._path("running", unit["unit_id"])
+        try:
+            if self._read(path).get("claimed_by") != worker_id:
+                return False
+            os.utime(path)
+            return True
+        except (FileNotFoundError, ValueError):
+            return False  # Reclaimed (or being rewritten by the worker that took it over)
+
+    # Record the commit inside the transaction of the unit's writes; False when it was already committed
+    def record_commit(self, conn, unit, worker_id, counts):
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "INSERT INTO ingest_unit_commits (unit_id, committed_by) VALUES (%s, %s) ON CONFLICT (unit_id) DO NOTHING;",
+                (unit["unit_id"], worker_id))
+            return cursor.rowcount == 1
+        finally:
+            cursor.close()
+
+    def finish(self, unit, counts=None):
+        self._write(self._path("done", unit["unit_id"]), dict(unit, receipts=counts and counts[0],
+                                                               items=counts and counts[1]))
+        try:
+            os.remove(self._path("running", unit["unit_id"]))
+        except FileNotFoundError:
+            pass
+
+    # Already committed by another worker: only the file move is missing
+    def lost(self, unit):
+        self.finish(unit)
+
+    def fail(self, unit, worker_id, error):
+        state = "failed" if unit["attempts"] >= self.max_attempts else "pending"
+        self._write(self._path(state, unit["unit_id"]), dict(unit, claimed_by=None, last_error=str(error)))
+        try:
+            os.remove(self._path("running", unit["unit_id"]))
+        except FileNotFoundError:
+            pass
+
+    def status(self):
+        counts = {}
+        for state in self.STATES:
+            units = [self._read(path) for path in self._units(state)]
+            if units:
+                counts[state] = (len(units), sum(unit.get("receipts") or 0 for unit in units))
+        return counts
+
+# Keep renewing the lease of `unit` in a background thread while the `with` block processes it, so a unit that
+# takes longer than the lease is not handed to a second worker as long as its worker is alive
+@contextmanager
+def lease_heartbeat(queue, unit, worker_id):
+    stop = threading.Event()
+
+    def renew():
+        while not stop.wait(queue.lease_seconds / LEASE_RENEWALS_PER_PERIOD):
+            try:
+                if not queue.renew(unit, worker_id):
+                    print(f"⚠️ Lost the lease of {unit['unit_id']}; another worker may be processing it.")
+                    return
+            except Exception as e:
+                print(f"⚠️ Could not renew the lease of {unit['unit_id']}: {e}")  # Retried at the next beat
+
+    thread = threading.Thread(target=renew, name="lease-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+# Function to transform and write one unit and commit it with its done mark. Returns the
+# (receipts, items) written, or None when another worker committed (or took over) the unit.
+# Partitions are created outside the unit's transaction (write_partitioned), and with `rollup_deltas`
+# (rollups.apply_deltas_sql) the rollups only take the unit's summed deltas just before the commit.
+def ingest_unit(writer, queue, unit, worker_id, valid_user_ids, valid_brand_ids, transform, batch_size,
+                rollup_deltas=()):
+    errors_before = writer.errors
+    counts = [0, 0]
+    for records in iter_batches(iter_unit_records(unit), batch_size):
+        METRICS.inc("rows_parsed_total", len(records), source="receipts")
+        with METRICS.timer("transform", source="receipts"):
+            receipts_data, receipt_items_data = transform(records, valid_user_ids, valid_brand_ids)
+        # Receipts go first so the items' FK to fact_receipts is satisfied; nothing is committed until the end
+        write_partitioned(writer, "fact_receipts", receipts_data)
+        write_partitioned(writer, "fact_receipt_items", receipt_items_data)
+        counts[0] += len(receipts_data)
+        counts[1] += len(receipt_items_data)
+
+    for sql in rollup_deltas:
+        writer.execute(sql)
+    if writer.errors > errors_before:
+        raise RuntimeError(f"{writer.errors - errors_before} writes failed")  # The caller rolls the unit back
+    if not queue.record_commit(writer.conn, unit, worker_id, counts):
+        writer.conn.rollback()
+        return None
+    writer.commit()
+    if writer.errors > errors_before:
+        raise RuntimeError("commit failed")
+    return counts
+
+# Claim and ingest units until none is left (or `max_units` are done); with `poll`, wait for new units instead
+def run_worker(queue, worker_id=None, batch_size=DEFAULT_BATCH_SIZE, max_units=None, poll=None, vectorized=False,
+               rollups=False):
+    from addingReceipts import get_valid_brand_ids, get_valid_user_ids, process_receipts_data
+
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    valid_user_ids = get_valid_user_ids()
+    valid_brand_ids = get_valid_brand_ids()
+
+    transform = process_receipts_data
+    if vectorized:
+        from vectorizedReceipts import transform_receipts_frame
+        transform = transform_receipts_frame
+
+    # Each write appends to session delta tables; the rollups are updated once per unit (see rollups.py)
+    after_merge, rollup_deltas = None, ()
+    if rollups:
+        from rollups import apply_deltas_sql, create_delta_tables_sql, delta_rollup_sql
+        after_merge, rollup_deltas = delta_rollup_sql(), apply_deltas_sql()
+
+    completed = 0
+    with pooled_connection(db_params) as conn:
+        # end_batch is never called, so the writer only commits when a unit is complete
+        writer = BulkWriter(conn, after_merge=after_merge)
+        if rollups:
+            for sql in create_delta_tables_sql():
+                writer.execute(sql)
+            writer.commit()
+        while max_units is None or completed < max_units:
+            unit = queue.claim(worker_id)
+            if unit is None:
+                if poll is None:
+                    break
+                time.sleep(poll)
+                continue
+
+            start = time.perf_counter()
+            try:
+                with lease_heartbeat(queue, unit, worker_id):
+                    counts = ingest_unit(writer, queue, unit, worker_id, valid_user_ids, valid_brand_ids, transform,
+                                         batch_size, rollup_deltas)
+            except Exception as e:
+                conn.rollback()
+                queue.fail(unit, worker_id, e)
+                METRICS.inc("work_units_total", outcome="failed")
+                print(f"❌ {unit['unit_id']} failed on attempt {unit['attempts']}: {e}")
+                continue
+
+            if counts is None:
+                queue.lost(unit)
+                METRICS.inc("work_units_total", outcome="lost")
+                print(f"⚠️ {unit['unit_id']} was committed by another worker; this attempt was rolled back.")
+                continue
+
+            queue.finish(unit, counts)
+            completed += 1
+            METRICS.inc("work_units_total", outcome="done")
+            METRICS.observe("work_unit_seconds", time.perf_counter() - start)
+            print(f"✅ {unit['unit_id']}: {counts[0]} receipts, {counts[1]} items "
+                  f"in {time.perf_counter() - start:.1f}s.")
+
+    print(f"🔍 Worker {worker_id} completed {completed} units.")
+    writer.report()
+    valid_user_ids.report()
+    valid_brand_ids.report()
+
+def open_queue(args):
+    if args.queue_dir:
+        return FileWorkQueue(args.queue_dir, args.max_attempts, args.lease_seconds)
+    return PostgresWorkQueue(args.max_attempts, args.lease_seconds)
+
+def print_status(queue):
+    counts = queue.status()
+    for state, (units, receipts) in sorted(counts.items()):
+        print(f"  {state:<8} {units:>8} units" + (f" {receipts:>12,} receipts" if receipts else ""))
+    if not counts:
+        print("  No work units.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest receipts with several workers sharing a work queue.")
+    parser.add_argument("--queue-dir", help="Use a shared directory as the queue instead of ingest_work_units")
+    parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+    parser.add_argument("--lease-seconds", type=int, default=DEFAULT_LEASE_SECONDS,
+                        help="Hand a running unit to another worker once its lease was not renewed for this long "
+                             "(workers renew it while they process the unit)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="Split receipts files into work units")
+    enqueue.add_argument("file_paths", nargs="+")
+    enqueue.add_argument("--unit-bytes", type=int, default=DEFAULT_UNIT_BYTES)
+
+    work = commands.add_parser("work", help="Claim and ingest units until the queue is empty")
+    work.add_argument("--worker-id", help="Default: <hostname>-<pid>")
+    work.add_argument("--max-units", type=int)
+    work.add_argument("--poll", type=float, help="Wait this many seconds for new units instead of exiting")
+    work.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    work.add_argument("--vectorized", action="store_true", help="Use the column-wise pandas transform (needs pandas; about 2.7x faster)")
+    work.add_argument("--rollups", action="store_true", help="Update the monthly rollup tables with every unit")
+    add_metrics_arguments(work)
+
+    commands.add_parser("status", help="Count the units per state")
+    args = parser.parse_args()
+
+    queue = open_queue(args)
+    if args.command == "enqueue":
+        units = split_work_units(args.file_paths, queue, args.unit_bytes)
+        print(f"🔹 {queue.enqueue(units)} work units queued.")
+    elif args.command == "work":
+        run_instrumented(run_worker, args, queue=queue, worker_id=args.worker_id, batch_size=args.batch_size,
+                         max_units=args.max_units, poll=args.poll, vectorized=args.vectorized, rollups=args.rollups)
+    else:
+        print_status(queue)
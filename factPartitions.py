@@ -0,0 +1,88 @@
+# Monthly partitions of the fact tables (see migrations/002_partition_facts.sql)
+import threading
+
+from bulkLoader import TABLE_SPECS
+from rowBatches import ColumnBatch
+
+# Date column each fact table is partitioned on
+PARTITION_COLUMNS = {
+    "fact_receipts": "scanned_date",
+    "fact_receipt_items": "item_scanned_date",
+}
+
+ENSURE_PARTITIONS_SQL = "SELECT ensure_fact_partitions(%s::date);"
+
+# SQLSTATEs raised when a concurrent loader created the same partition first: duplicate_table, or
+# unique_violation on the catalog when both CREATE TABLEs run at once
+ALREADY_EXISTS_STATES = ("42P07", "23505")
+PARTITION_ATTEMPTS = 3
+
+# Months whose partitions this process created or found (the loaders never drop partitions)
+_ensured_months = set()
+_ensured_lock = threading.Lock()
+
+# Function to name the partition of `table_name` holding (year, month)
+def partition_name(table_name, month):
+    year, month_number = month
+    return f"{table_name}_y{year:04d}m{month_number:02d}"
+
+# Function to format (year, month) as the first day of the month, for ENSURE_PARTITIONS_SQL
+def month_start(month):
+    return f"{month[0]:04d}-{month[1]:02d}-01"
+
+# Function to group fact rows by the (year, month) of their partition column.
+# Rows without a date are grouped under None and go through the parent table (which rejects them).
+def group_by_month(table_name, rows):
+    if isinstance(rows, ColumnBatch):
+        return rows.group_by_month(PARTITION_COLUMNS[table_name])  # Split on the int64 column, no row tuples
+    date_index = TABLE_SPECS[table_name]["columns"].index(PARTITION_COLUMNS[table_name])
+    groups = {}
+    for row in rows:
+        value = row[date_index]
+        month = (value.year, value.month) if value is not None and value == value else None  # NaT != NaT
+        groups.setdefault(month, []).append(row)
+    return groups
+
+def is_already_exists(error):
+    return (getattr(error, "pgcode", None) or getattr(error, "sqlstate", None)) in ALREADY_EXISTS_STATES
+
+# Function to create the partitions of `months` ((year, month) tuples) not known to exist yet. Each month is
+# created in its own short autocommit transaction on a separate pooled connection, never in a write
+# transaction: DDL there would hold an ACCESS EXCLUSIVE lock on the parent table until the write commits.
+# A loader racing to create the same month makes ours fail with "already exists", which counts as done
+# (the call is retried, so the month's other table is still checked).
+def ensure_partitions(months):
+    with _ensured_lock:
+        missing = sorted(month for month in months if month is not None and month not in _ensured_months)
+    if not missing:
+        return
+    from dbPool import pooled_connection
+    from fetchEtl.config import db_params
+
+    with pooled_connection(db_params) as conn:
+        previous, conn.autocommit = conn.autocommit, True
+        try:
+            cursor = conn.cursor()
+            for month in missing:
+                for attempt in range(PARTITION_ATTEMPTS):
+                    try:
+                        cursor.execute(ENSURE_PARTITIONS_SQL, (month_start(month),))
+                        break
+                    except Exception as e:
+                        if not is_already_exists(e) or attempt == PARTITION_ATTEMPTS - 1:
+                            raise
+            cursor.close()
+        finally:
+            conn.autocommit = previous
+    with _ensured_lock:
+        _ensured_months.update(missing)
+
+# Write fact rows straight into their monthly partitions, creating missing partitions first (outside the
+# writer's transaction; create_partitions=False for writers without a database).
+# COPY and merge then skip the parent's tuple routing, and each merge only probes one partition's key index.
+def write_partitioned(writer, table_name, rows, create_partitions=True):
+    groups = group_by_month(table_name, rows)
+    if create_partitions:
+        ensure_partitions(groups)
+    for month, month_rows in groups.items():
+        writer.write(table_name, month_rows, partition_name(table_name, month) if month else None)
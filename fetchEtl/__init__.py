@@ -0,0 +1,2 @@
+# fetchRewards ETL: `python -m fetchEtl load|validate ...` (see fetchEtl/cli.py).
+# Nothing heavy is imported here; each subcommand imports the loaders it runs.
@@ -0,0 +1,3 @@
+from fetchEtl.cli import main
+
+main()
@@ -0,0 +1,102 @@
+import argparse
+
+from bulkLoader import DEFAULT_COMMIT_ROWS
+from fetchEtl import config
+from jsonStream import DEFAULT_BATCH_SIZE
+from loadMetrics import add_metrics_arguments, run_instrumented
+
+# Single entry point for the loaders and validators:
+#   python -m fetchEtl load users|brands|receipts|all [options]
+#   python -m fetchEtl validate users|brands|receipts|all [path]
+# Modules are imported by the subcommand that needs them, so `validate` never loads psycopg2 and
+# no subcommand loads pandas unless asked to (--vectorized, or printing a validation sample).
+
+TABLES = ["users", "brands", "receipts"]
+
+# Function to load the dimensions, then the facts, in one process. The loaders share the pooled
+# connections of config.db_params, and the receipts' FK caches are refreshed once the dimensions are in.
+def run_load(options):
+    receipts_options = {"workers": options.workers, "vectorized": options.vectorized,
+                        "full_key_refresh": options.full_key_refresh, "async_pipeline": options.async_pipeline,
+                        "rollups": options.rollups, "receipt_ids": options.receipt_ids}
+    if options.parallel:
+        if options.table != "all":
+            raise SystemExit("❌ --parallel schedules the whole load; use it with `load all`.")
+        from loadScheduler import load_all
+        if not load_all({table: config.paths[table] for table in TABLES}, options.batch_size, options.restart,
+                        options.validate, options.commit_rows, options.delta, receipts_options,
+                        options.prefetch_batches):
+            raise SystemExit("❌ Loading receipts had failed writes.")
+        return
+
+    targets = TABLES if options.table == "all" else [options.table]
+    common = {"batch_size": options.batch_size, "restart": options.restart, "validate": options.validate,
+              "commit_rows": options.commit_rows}
+    for table in targets:
+        file_path = options.path if options.path and options.table != "all" else config.paths[table]
+        if table == "users":
+            import addingUsers
+            succeeded = addingUsers.main(file_path, delta=options.delta, **common)
+        elif table == "brands":
+            import addingBrandsData
+            succeeded = addingBrandsData.main(file_path, delta=options.delta, **common)
+        else:
+            import addingReceipts
+            succeeded = addingReceipts.main(file_path, **receipts_options, **common)
+        if not succeeded:
+            raise SystemExit(f"❌ Loading {table} failed; later loads were not started.")
+
+def run_validate(options):
+    from fetchEtl.validate import validate_brands, validate_receipts, validate_users
+
+    validators = {"users": validate_users, "brands": validate_brands, "receipts": validate_receipts}
+    targets = TABLES if options.table == "all" else [options.table]
+    for table in targets:
+        validators[table](options.path if options.path and options.table != "all" else config.paths[table])
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m fetchEtl", description="Load and validate the fetchRewards exports.")
+    parser.add_argument("--config", help=f"JSON config file (default ${config.CONFIG_ENV} or {config.DEFAULT_CONFIG_PATH})")
+    parser.add_argument("--dsn", help=f"PostgreSQL connection string (default ${config.DSN_ENV} or the config file)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    load = commands.add_parser("load", help="Load users/brands into the dimensions and receipts into the facts")
+    load.add_argument("table", choices=TABLES + ["all"])
+    load.add_argument("path", nargs="?", help="Source file or extract directory (single table; default from config)")
+    load.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    load.add_argument("--restart", action="store_true", help="Ignore the saved checkpoints")
+    load.add_argument("--validate", action="store_true", help="Also print the data quality report for the loaded records")
+    load.add_argument("--commit-rows", type=int, default=DEFAULT_COMMIT_ROWS,
+                      help="Commit after this many written rows (0 commits every write)")
+    load.add_argument("--delta", action="store_true", help="users/brands: also update changed rows")
+    load.add_argument("--workers", type=int, default=1, help="receipts: transform in N processes")
+    load.add_argument("--vectorized", action="store_true", help="receipts: column-wise pandas transform (about 2.7x faster)")
+    load.add_argument("--full-key-refresh", action="store_true", help="receipts: re-pull all dimension keys")
+    load.add_argument("--async-pipeline", action="store_true", help="receipts: concurrent parse/transform/write stages")
+    load.add_argument("--rollups", action="store_true", help="receipts: update the monthly rollup tables")
+    load.add_argument("--id", dest="receipt_ids", action="append",
+                      help="receipts: only (re-)process this receipt, found through the line index; repeatable")
+    load.add_argument("--parallel", action="store_true",
+                      help="all: load users and brands concurrently and transform receipts meanwhile; only the fact "
+                           "writes wait for the dimensions")
+    load.add_argument("--prefetch-batches", type=int,
+                      help="--parallel: transformed receipt batches held while the dimensions load (default 20)")
+    add_metrics_arguments(load)
+    load.set_defaults(run=run_load)
+
+    validate = commands.add_parser("validate", help="Print the data quality report of the exports")
+    validate.add_argument("table", choices=TABLES + ["all"])
+    validate.add_argument("path", nargs="?", help="Source file or extract directory (single table; default from config)")
+    add_metrics_arguments(validate)
+    validate.set_defaults(run=run_validate)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    config.load_config(args.config, args.dsn)
+    try:
+        run_instrumented(args.run, args, options=args)
+    finally:
+        if args.command == "load":
+            from dbPool import close_pools
+            close_pools()
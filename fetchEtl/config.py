@@ -0,0 +1,60 @@
+import json
+import os
+
+# Config file read when present (override with FETCH_ETL_CONFIG or --config), e.g.
+# {"dsn": "postgresql://etl@db/fetchRewards", "paths": {"receipts": "/data/receipts.json"}}
+DEFAULT_CONFIG_PATH = "fetch_etl.json"
+CONFIG_ENV = "FETCH_ETL_CONFIG"
+DSN_ENV = "FETCH_ETL_DSN"  # A libpq connection string; wins over the file
+
+# 📌 PostgreSQL Connection Details used when neither the file nor the environment sets any
+DEFAULT_DB_PARAMS = {
+    "dbname": "fetchRewards",
+    "user": "postgres",
+    "password": "<password>",
+    "host": "localhost",
+    "port": "5432"
+}
+
+# Source file of each load
+DEFAULT_PATHS = {
+    "users": "users.json",
+    "brands": "brands.json",
+    "receipts": "receipts.json",
+}
+
+# Connection parameters and paths shared by every module; updated in place by load_config so that
+# modules holding a reference (`from fetchEtl.config import db_params`) see the configured values
+db_params = dict(DEFAULT_DB_PARAMS)
+paths = dict(DEFAULT_PATHS)
+
+# Function to (re)load the configuration: defaults < config file < FETCH_ETL_DSN < `dsn` argument
+def load_config(config_path=None, dsn=None):
+    config_path = config_path or os.environ.get(CONFIG_ENV)
+    config = {}
+    if config_path:
+        with open(config_path, 'r') as file:  # An explicitly named file must exist
+            config = json.load(file)
+    elif os.path.exists(DEFAULT_CONFIG_PATH):
+        with open(DEFAULT_CONFIG_PATH, 'r') as file:
+            config = json.load(file)
+
+    dsn = dsn or os.environ.get(DSN_ENV) or config.get("dsn")
+    db_params.clear()
+    if dsn:
+        db_params["dsn"] = dsn
+    else:
+        db_params.update(DEFAULT_DB_PARAMS)
+        db_params.update(config.get("db", {}))
+
+    paths.clear()
+    paths.update(DEFAULT_PATHS)
+    paths.update(config.get("paths", {}))
+    return db_params, paths
+
+# Function to split db_params into (conninfo, keyword arguments) for psycopg 3's connect()
+def conninfo_params():
+    params = dict(db_params)
+    return params.pop("dsn", ""), params
+
+load_config()
@@ -0,0 +1,95 @@
+from columnarExtract import (date_ms, head_rows, is_extract_dir, validate_brands_extract, validate_receipts_extract,
+                             validate_users_extract)
+from idNormalizer import stable_record_id
+from jsonStream import is_json_array, iter_json_records
+from loadDiagnostics import DIAGNOSTICS
+from rowBatches import from_ms
+from validationRules import ReceiptValidation, brand_validator, get_path, user_validator
+
+# Data quality checks of the JSON exports (or of a columnarExtract.py directory), shared by the
+# validate*.py scripts and `python -m fetchEtl validate ...`
+
+# Rows kept to print as a sample
+SAMPLE_ROWS = 5
+
+# Function to parse MongoDB-style timestamps
+def parse_mongo_date(date_field):
+    milliseconds = date_ms(date_field)
+    return None if milliseconds is None else from_ms(milliseconds)
+
+# Function to build the extracted user record shown in the sample
+def build_user_record(row):
+    return {
+        "user_id": stable_record_id(row),  # The key the row loads under
+        "state": row.get("state", None),
+        "created_date": parse_mongo_date(row.get("createdDate")),
+        "last_login": parse_mongo_date(row.get("lastLogin")),
+        "role": row.get("role", None),
+        "active": row.get("active", None),
+        "sign_up_source": row.get("signUpSource", None),
+    }
+
+# Function to build the extracted brand record shown in the sample
+def build_brand_record(row):
+    return {
+        "brand_id": stable_record_id(row),
+        "name": row.get("name", None),
+        "category": row.get("category", None),
+        "category_code": row.get("categoryCode", None),
+        "barcode": row.get("barcode", None),
+        "brand_code": row.get("brandCode", None),
+        "top_brand": row.get("topBrand", False),  # Default to False if missing
+        "cpg_id": get_path(row, "cpg", "$id", "$oid"),
+    }
+
+# Run a validator over a dimension export, keeping only a small sample, and print the report and sample
+def _validate_dimension(source, table, validator, validate_extract, build_record, title):
+    if is_extract_dir(source):
+        # Rule failures were evaluated once at extract time; only the stored bitmasks are read here
+        validate_extract(source, validator)
+        sample_records = head_rows(source, table, SAMPLE_ROWS)
+    else:
+        sample_records = []
+        for record in iter_json_records(source):
+            validator.observe(record)
+            if len(sample_records) < SAMPLE_ROWS:
+                sample_records.append(build_record(record))
+
+    # Print validation issues
+    validator.report()
+    DIAGNOSTICS.report()  # Lines that could not be decoded
+
+    print(f"\nExtracted {title} Data:")
+    try:
+        import pandas as pd  # Only for printing the sample as a table
+    except ImportError:
+        for record in sample_records:
+            print(record)
+    else:
+        print(pd.DataFrame(sample_records))
+    return validator
+
+def validate_users(source="users.json"):
+    return _validate_dimension(source, "users", user_validator(), validate_users_extract, build_user_record, "Users")
+
+def validate_brands(source="brands.json"):
+    return _validate_dimension(source, "brands", brand_validator(), validate_brands_extract, build_brand_record,
+                               "Brands")
+
+# Validate receipts and their items in a single pass
+def validate_receipts(source="receipts.json"):
+    receipt_validation = ReceiptValidation()
+    if is_extract_dir(source):
+        validate_receipts_extract(source, receipt_validation)  # Reads the stored rule failures, not the JSON
+    elif is_json_array(source):
+        receipt_validation.observe_many(iter_json_records(source))
+    else:
+        from lineIndex import iter_indexed_records
+        # NDJSON: issues are reported with source lines, and the line index is rebuilt on the same pass
+        for line, record in iter_indexed_records(source):
+            receipt_validation.observe(record, line)
+
+    # Print data quality issues
+    receipt_validation.report()
+    DIAGNOSTICS.report()
+    return receipt_validation
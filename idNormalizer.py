@@ -0,0 +1,90 @@
+import json
+import re
+import uuid
+from functools import lru_cache
+
+from loadMetrics import METRICS
+
+# Id normalization shared by the loaders, the validators and the extract: UUIDs are formatted without
+# raising on bad input, and Mongo ObjectIds (24 hex digits, most of the source ids) are mapped into UUID
+# space deterministically, so the same source id always becomes the same key.
+
+# Namespace of the UUIDs derived from ObjectIds and other non-UUID source ids (users, brands and the
+# receipts' userId / partnerItemId references). Changing it re-keys every such row on the next load.
+OBJECT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "fetchRewards/object_ids")
+
+# Referenced ids remembered per normalizer; userId / partnerItemId repeat across most receipts
+DEFAULT_CACHE_SIZE = 2 ** 16
+
+_CANONICAL_UUID = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+_UUID_HEX = re.compile(r"[0-9a-fA-F]{32}")
+_OBJECT_ID = re.compile(r"[0-9a-fA-F]{24}")
+
+# Function to format a value as a canonical UUID string (None when it is not one), accepting what
+# uuid.UUID() accepts (braces, "urn:uuid:", any hyphens, upper case) without raising on anything else
+def format_uuid(value):
+    if not isinstance(value, str):
+        return None
+    if len(value) == 36 and _CANONICAL_UUID.fullmatch(value):
+        return value
+    digits = value.replace("urn:", "").replace("uuid:", "").strip("{}").replace("-", "")
+    if not _UUID_HEX.fullmatch(digits):
+        return None
+    digits = digits.lower()
+    return f"{digits[:8]}-{digits[8:12]}-{digits[12:16]}-{digits[16:20]}-{digits[20:]}"
+
+# Function to map a source id string into UUID space: a UUID as is, anything else as UUIDv5("oid:<id>")
+def source_id_to_uuid(value, namespace=OBJECT_ID_NAMESPACE):
+    return format_uuid(value) or str(uuid.uuid5(namespace, f"oid:{value}"))
+
+# Function to check for a Mongo ObjectId (24 hex digits)
+def is_object_id(value):
+    return isinstance(value, str) and len(value) == 24 and _OBJECT_ID.fullmatch(value) is not None
+
+# Function to normalize a referenced id: a UUID, or an ObjectId mapped as its record's own id was
+# (None for anything else, which the loaders treat as an unknown key)
+def normalize_id(value, namespace=OBJECT_ID_NAMESPACE):
+    formatted = format_uuid(value)
+    if formatted is not None or not is_object_id(value):
+        return formatted
+    return str(uuid.uuid5(namespace, f"oid:{value}"))
+
+# Function to derive a record's id that is the same on every run: from its `_id.$oid` when present,
+# else a UUIDv5 of the whole record's content
+def stable_record_id(record, namespace=OBJECT_ID_NAMESPACE):
+    source_id = record.get("_id")
+    source_id = source_id.get("$oid") if isinstance(source_id, dict) else None
+    if isinstance(source_id, str) and source_id:
+        return source_id_to_uuid(source_id, namespace)
+    content = json.dumps(dict(record), sort_keys=True, default=str)
+    return str(uuid.uuid5(namespace, f"content:{content}"))
+
+# normalize_id behind a bounded LRU, for ids that repeat (one instance per kind of reference)
+class IdNormalizer:
+    def __init__(self, name, cache_size=DEFAULT_CACHE_SIZE, namespace=OBJECT_ID_NAMESPACE):
+        self.name = name
+        self._normalize = lru_cache(maxsize=cache_size)(lambda value: normalize_id(value, namespace))
+        self._reported = (0, 0)  # Hits and misses already added to METRICS
+
+    def __call__(self, value):
+        if not isinstance(value, str):
+            return None  # Keeps unhashable junk (dicts, lists) out of the cache
+        return self._normalize(value)
+
+    def hit_rate(self):
+        info = self._normalize.cache_info()
+        lookups = info.hits + info.misses
+        return info.hits / lookups if lookups else 0.0
+
+    def report(self):
+        info = self._normalize.cache_info()
+        METRICS.inc("id_cache_hits_total", info.hits - self._reported[0], ids=self.name)
+        METRICS.inc("id_cache_misses_total", info.misses - self._reported[1], ids=self.name)
+        self._reported = (info.hits, info.misses)
+        if info.hits + info.misses:
+            print(f"🔹 {self.name} id cache: {self.hit_rate():.1%} hit rate over {info.hits + info.misses} lookups "
+                  f"({info.currsize}/{info.maxsize} ids cached).")
+
+# Process-wide normalizers of the receipts' references
+USER_IDS = IdNormalizer("userId")
+BRAND_IDS = IdNormalizer("partnerItemId")
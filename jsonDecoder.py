@@ -0,0 +1,136 @@
+import io
+import json
+import os
+import re
+
+# Every backend raises a ValueError subclass on malformed input
+DecodeError = ValueError
+
+# Environment variable to force a backend (e.g. FETCH_JSON_BACKEND=json)
+BACKEND_ENV_VAR = "FETCH_JSON_BACKEND"
+
+# Backends in order of preference, fastest first
+BACKEND_ORDER = ["orjson", "simdjson", "ujson", "json"]
+
+# Function to build the `loads` of one backend (None if the library is not installed)
+def _load_backend(name):
+    try:
+        if name == "orjson":
+            import orjson
+            return orjson.loads  # Accepts bytes and str directly
+        if name == "simdjson":
+            import simdjson
+            return simdjson.loads
+        if name == "ujson":
+            import ujson
+            return ujson.loads
+    except ImportError:
+        return None
+    if name == "json":
+        return json.loads
+    raise ValueError(f"Unknown JSON backend: {name}")
+
+# Function to list the backends importable in this environment
+def available_backends():
+    return [name for name in BACKEND_ORDER if _load_backend(name) is not None]
+
+# Function to pick a backend: the forced one if set, otherwise the fastest available
+def select_backend(name=None):
+    name = name or os.environ.get(BACKEND_ENV_VAR)
+    if name:
+        loads = _load_backend(name)
+        if loads is None:
+            raise ImportError(f"JSON backend '{name}' is not installed.")
+        return name, loads
+    for name in BACKEND_ORDER:
+        loads = _load_backend(name)
+        if loads is not None:
+            return name, loads
+
+BACKEND, loads = select_backend()
+
+# Size of each read when walking a top-level JSON array
+ARRAY_CHUNK_SIZE = 1024 * 1024
+# Largest single array element (in characters) the pure-stdlib walker buffers before giving up
+MAX_ARRAY_ELEMENT_CHARS = 256 * 1024 * 1024
+
+# Rest of a scalar token that runs up to the end of the buffer (so the next chunk may continue it)
+_OPEN_TOKEN_TAIL = re.compile(r"[^\s,\]]*\Z")
+
+# Function to yield the elements of a top-level JSON array (from a binary file) one by one
+# without decoding or holding the whole document; uses ijson's C parser when installed
+def iter_json_array(file, chunk_size=ARRAY_CHUNK_SIZE):
+    try:
+        import ijson
+    except ImportError:
+        yield from _iter_json_array_chunked(io.TextIOWrapper(file, encoding="utf-8"), chunk_size)
+        return
+    yield from ijson.items(file, "item", use_float=True)
+
+# Pure-stdlib fallback: raw_decode one element at a time from a sliding text buffer. As strict as json.loads:
+# a missing or trailing comma, or anything but whitespace after the closing bracket, raises JSONDecodeError
+# (positions are relative to the buffer at the time).
+def _iter_json_array_chunked(file, chunk_size, max_element_chars=MAX_ARRAY_ELEMENT_CHARS):
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    at_eof = False
+    expect = "["  # "[", then "first" (an element or "]"), "," (after an element), "element" (after a comma), "end"
+
+    while True:
+        while position < len(buffer) and buffer[position].isspace():
+            position += 1
+
+        if position < len(buffer):
+            char = buffer[position]
+            if expect == "[":
+                if char != "[":
+                    raise json.JSONDecodeError("Expected a JSON array", buffer, position)
+                expect = "first"
+                position += 1
+                continue
+            if expect == "end":
+                raise json.JSONDecodeError("Extra data", buffer, position)
+            if char == "]":
+                if expect == "element":
+                    raise json.JSONDecodeError("Illegal trailing comma before end of array", buffer, position)
+                expect = "end"
+                position += 1
+                continue
+            if expect == ",":
+                if char != ",":
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buffer, position)
+                expect = "element"
+                position += 1
+                continue
+
+            try:
+                element, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if at_eof:
+                    raise
+                end = None
+
+            # A scalar (e.g. 4.5 read as "4.") is only complete once a delimiter follows it or the file ended;
+            # objects, arrays and strings end on their own closing character
+            if end is not None and buffer[end - 1] not in '}]"' and not at_eof:
+                if _OPEN_TOKEN_TAIL.match(buffer, end) or not buffer[end:end + 64].lstrip():
+                    end = None  # The token may continue, or its delimiter is still to come
+            if end is not None:
+                yield element
+                expect = ","
+                position = end
+                continue
+        elif at_eof:
+            if expect == "end":
+                return
+            raise json.JSONDecodeError("Unterminated JSON array" if expect != "[" else "Expected a JSON array",
+                                       buffer, position)
+
+        if len(buffer) - position > max_element_chars:
+            raise DecodeError(f"JSON array element larger than {max_element_chars} characters; "
+                              f"install ijson to stream it")
+        chunk = file.read(chunk_size)
+        at_eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
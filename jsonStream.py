@@ -0,0 +1,64 @@
+from jsonDecoder import DecodeError, iter_json_array, loads
+from loadDiagnostics import DIAGNOSTICS
+
+# Default number of records handed to the database writer at a time
+DEFAULT_BATCH_SIZE = 5000
+
+# Function to stream JSON records one at a time (Handles NDJSON & standard JSON)
+def iter_json_records(file_path):
+    with open(file_path, 'rb') as file:
+        first_char = file.read(1)  # Check first character to detect format
+        file.seek(0)  # Reset file read position
+
+        if first_char == b"[":  # Standard JSON array, decoded element by element
+            yield from iter_json_array(file)
+        else:  # NDJSON (one JSON object per line, never held in memory all at once)
+            position = 0
+            for line in file:
+                position += len(line)
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield loads(line)
+                except DecodeError as e:
+                    DIAGNOSTICS.rejected(file_path, position, line, e)
+
+# Function to check whether a file holds one JSON array rather than NDJSON
+def is_json_array(file_path):
+    with open(file_path, 'r') as file:
+        return file.read(1) == "["
+
+# Function to stream (position, record) pairs starting from a saved position.
+# Position is the byte offset after the record's line for NDJSON and the
+# number of records read so far for JSON arrays.
+def iter_positioned_records(file_path, start_position=0):
+    if is_json_array(file_path):
+        for count, record in enumerate(iter_json_records(file_path), start=1):
+            if count > start_position:
+                yield count, record
+        return
+
+    with open(file_path, 'rb') as file:
+        file.seek(start_position)
+        position = start_position
+        for line in file:
+            position += len(line)
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield position, loads(line)
+            except DecodeError as e:
+                DIAGNOSTICS.rejected(file_path, position, line, e)
+
+# Function to group a stream of records into bounded lists
+def iter_batches(records, batch_size=DEFAULT_BATCH_SIZE):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
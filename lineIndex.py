@@ -0,0 +1,207 @@
+import argparse
+import mmap
+import os
+from array import array
+
+import numpy as np
+
+from checkpointStore import HASH_BYTES, prefix_hash
+from dimensionCache import uuid_to_bytes
+from idNormalizer import normalize_id
+from jsonDecoder import DecodeError, loads
+from loadDiagnostics import DIAGNOSTICS
+from receiptIds import RECEIPT_NAMESPACE, stable_receipt_id
+
+# Sidecar line index of an NDJSON receipts file, so one receipt (or one line) can be read without a rescan:
+#   <file>.lines.npy  int64 byte offset where every line starts, plus the end of the last indexed line
+#                     (memory-mapped on open; line n spans offsets[n - 1]:offsets[n])
+#   <file>.lines.npz  the receipt ids (16 bytes, as loaded into fact_receipts, sorted) with their line,
+#                     and the hash of the file head the index was built from
+# Like the load checkpoints, only the head of the file is hashed: an appended file keeps its index and
+# only the new tail is scanned.
+
+def offsets_path(file_path):
+    return f"{file_path}.lines.npy"
+
+def keys_path(file_path):
+    return f"{file_path}.lines.npz"
+
+# Function to walk the lines of `file_path` from byte `start` (the start of 0-based line `first_line`) through
+# an mmap, appending every line end to `ends` and yielding (0-based line, record) for each JSON line
+def _scan(file_path, start, first_line, ends, report_rejected=False):
+    with open(file_path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if size <= start:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            line_number = first_line
+            while start < size:
+                end = mapped.find(b"\n", start)
+                end = size if end < 0 else end + 1
+                ends.append(end)
+                line = mapped[start:end].strip()
+                if line:
+                    try:
+                        yield line_number, loads(line)
+                    except DecodeError as e:
+                        if report_rejected:
+                            DIAGNOSTICS.rejected(file_path, end, line, e)
+                start = end
+                line_number += 1
+
+class LineIndex:
+    def __init__(self, file_path, offsets, keys=None, key_lines=None):
+        self.file_path = file_path
+        self.offsets = offsets  # int64, len = lines + 1
+        self._keys = keys  # S16 sorted, loaded on first lookup
+        self._key_lines = key_lines  # int64 0-based line of each key
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def indexed_bytes(self):
+        return int(self.offsets[-1])
+
+    # The saved index of `file_path`, or None when there is none or the file's head changed since
+    @classmethod
+    def load(cls, file_path):
+        if not (os.path.exists(offsets_path(file_path)) and os.path.exists(keys_path(file_path))):
+            return None
+        offsets = np.load(offsets_path(file_path), mmap_mode="r")
+        with np.load(keys_path(file_path)) as sidecar:  # Members are read lazily; only the hash here
+            hashed_bytes = int(sidecar["hashed_bytes"])
+            content_hash = str(sidecar["content_hash"])
+        if os.path.getsize(file_path) < int(offsets[-1]) or prefix_hash(file_path, hashed_bytes) != content_hash:
+            return None
+        return cls(file_path, offsets)
+
+    # The index of `file_path`, built (or extended over an appended tail) and saved when needed
+    @classmethod
+    def open(cls, file_path):
+        index = cls.load(file_path)
+        if index is not None and index.indexed_bytes >= os.path.getsize(file_path):
+            return index
+        if index is None:
+            print(f"🔹 Building the line index of {file_path}.")
+        return build_line_index(file_path, index)
+
+    def receipt_count(self):
+        return len(self._load_keys()[0])
+
+    def _load_keys(self):
+        if self._keys is None:
+            with np.load(keys_path(self.file_path)) as sidecar:
+                self._keys = sidecar["keys"]
+                self._key_lines = sidecar["key_lines"]
+        return self._keys, self._key_lines
+
+    def save(self):
+        keys, key_lines = self._load_keys()
+        hashed_bytes = min(HASH_BYTES, self.indexed_bytes)
+        try:
+            np.save(offsets_path(self.file_path) + ".tmp.npy", np.asarray(self.offsets, dtype=np.int64))
+            np.savez(keys_path(self.file_path) + ".tmp.npz", keys=keys, key_lines=key_lines,
+                     hashed_bytes=np.int64(hashed_bytes),
+                     content_hash=np.str_(prefix_hash(self.file_path, hashed_bytes)))
+            os.replace(offsets_path(self.file_path) + ".tmp.npy", offsets_path(self.file_path))
+            os.replace(keys_path(self.file_path) + ".tmp.npz", keys_path(self.file_path))
+        except OSError as e:
+            print(f"⚠️ Could not save the line index of {self.file_path}: {e}")
+
+    # 1-based lines holding a receipt, by `_id` ($oid or UUID) or by its receipt_id in fact_receipts
+    def lines_of(self, receipt_id):
+        receipt_id = normalize_id(receipt_id, RECEIPT_NAMESPACE)
+        if receipt_id is None:
+            return []
+        keys, key_lines = self._load_keys()
+        key = np.array([uuid_to_bytes(receipt_id)], dtype="S16")
+        first, last = np.searchsorted(keys, key, side="left")[0], np.searchsorted(keys, key, side="right")[0]
+        return sorted(int(line) + 1 for line in key_lines[first:last])
+
+    # 1-based line containing byte `position` (a position right after a line counts as that line)
+    def line_of_position(self, position):
+        return int(np.searchsorted(self.offsets, position, side="left"))
+
+    # Function to read (line, raw line) for 1-based line numbers, in file order
+    def iter_lines(self, line_numbers):
+        with open(self.file_path, 'rb') as file:
+            for line_number in sorted(line_numbers):
+                if not 1 <= line_number <= len(self):
+                    continue
+                start, end = int(self.offsets[line_number - 1]), int(self.offsets[line_number])
+                file.seek(start)
+                yield line_number, file.read(end - start).strip()
+
+    # Function to parse the records on the given 1-based lines, as (line, record)
+    def iter_records(self, line_numbers):
+        for line_number, line in self.iter_lines(line_numbers):
+            if not line:
+                continue
+            try:
+                yield line_number, loads(line)
+            except DecodeError as e:
+                DIAGNOSTICS.rejected(self.file_path, int(self.offsets[line_number]), line, e)
+
+    # Newline-aligned (start, end) byte ranges of about `chunk_bytes` over the indexed part of the file,
+    # read from the offsets alone
+    def byte_ranges(self, chunk_bytes, start_position=0):
+        end = self.indexed_bytes
+        targets = np.arange(start_position + chunk_bytes, end, chunk_bytes, dtype=np.int64)
+        cuts = np.asarray(self.offsets)[np.searchsorted(self.offsets, targets, side="left")]
+        boundaries = np.unique(np.concatenate(([start_position], cuts, [end])))
+        return [(int(start), int(stop)) for start, stop in zip(boundaries[:-1], boundaries[1:]) if start < stop]
+
+# Function to build the index of `file_path` (or extend `base` over the lines appended since) and save it
+def build_line_index(file_path, base=None):
+    ends = array('q', base.offsets.tolist() if base is not None else [0])
+    keys, key_lines = [], array('q')
+    for line_number, record in _scan(file_path, ends[-1], len(ends) - 1, ends):
+        if isinstance(record, dict):
+            keys.append(uuid_to_bytes(stable_receipt_id(record)))
+            key_lines.append(line_number)
+    return _save_index(file_path, ends, keys, key_lines, base)
+
+def _save_index(file_path, ends, keys, key_lines, base=None):
+    keys = np.array(keys, dtype="S16")
+    key_lines = np.array(key_lines, dtype=np.int64)
+    if base is not None:
+        base_keys, base_lines = base._load_keys()
+        keys, key_lines = np.concatenate((base_keys, keys)), np.concatenate((base_lines, key_lines))
+    order = np.argsort(keys, kind="stable")
+    index = LineIndex(file_path, np.array(ends, dtype=np.int64), keys[order], key_lines[order])
+    index.save()
+    return index
+
+# Function to stream (1-based line, record) over a whole NDJSON file while rebuilding its index on the way
+# (saved once the file was read to the end), so a validation pass leaves an up-to-date index behind
+def iter_indexed_records(file_path):
+    ends = array('q', [0])
+    keys, key_lines = [], array('q')
+    for line_number, record in _scan(file_path, 0, 0, ends, report_rejected=True):
+        if isinstance(record, dict):
+            keys.append(uuid_to_bytes(stable_receipt_id(record)))
+            key_lines.append(line_number)
+        yield line_number + 1, record
+    _save_index(file_path, ends, keys, key_lines)
+
+if __name__ == "__main__":
+    from fetchEtl.config import paths
+
+    parser = argparse.ArgumentParser(description="Build the line index of an NDJSON receipts file and look receipts up.")
+    parser.add_argument("file_path", nargs="?", default=paths["receipts"])
+    parser.add_argument("--id", dest="receipt_ids", action="append", default=[],
+                        help="Print the line(s) of this receipt (`_id` or receipt_id); repeatable")
+    parser.add_argument("--line", dest="line_numbers", type=int, action="append", default=[],
+                        help="Print this 1-based line; repeatable")
+    args = parser.parse_args()
+
+    index = LineIndex.open(args.file_path)
+    print(f"📊 {args.file_path}: {len(index)} lines, {index.receipt_count()} receipts indexed.")
+    line_numbers = set(args.line_numbers)
+    for receipt_id in args.receipt_ids:
+        lines = index.lines_of(receipt_id)
+        print(f"🔹 {receipt_id}: line {', '.join(map(str, lines))}" if lines else f"⚠️ {receipt_id}: not found")
+        line_numbers.update(lines)
+    for line_number, line in index.iter_lines(line_numbers):
+        print(f"{line_number}: {line.decode('utf-8', errors='replace')}")
@@ -0,0 +1,138 @@
+import json
+import threading
+
+from loadMetrics import METRICS
+
+# Offending ids kept per (source, reason); everything past them is only counted
+DEFAULT_EXEMPLARS = 5
+# Size cap of the dead-letter file; rejected lines past it are counted, not written
+DEFAULT_DEAD_LETTER_BYTES = 64 * 1024 * 1024
+
+# Metric counted for each kind of diagnostic
+_METRIC_NAMES = {"defaulted": "rows_defaulted_total", "skipped": "rows_skipped_total",
+                 "rejected": "lines_rejected_total"}
+
+# Data problems found while loading, kept as counters plus the first few exemplars per reason, so the load
+# loops never print per row. Rejected raw lines go to an optional, size-capped NDJSON dead-letter file.
+class Diagnostics:
+    def __init__(self, exemplars=DEFAULT_EXEMPLARS, dead_letter_path=None, dead_letter_bytes=DEFAULT_DEAD_LETTER_BYTES):
+        self.exemplar_limit = exemplars
+        self.dead_letter_path = dead_letter_path
+        self.dead_letter_bytes = dead_letter_bytes
+        self.counts = {}     # (kind, source, reason) -> rows
+        self.exemplars = {}  # (kind, source, reason) -> first exemplars
+        self.dead_letter_written = 0
+        self.dead_letter_dropped = 0
+        self._dead_letter = None
+        self._held_lines = None  # Worker processes only (see for_worker)
+        self._lock = threading.Lock()
+
+    def configure(self, exemplars=None, dead_letter_path=None, dead_letter_bytes=None):
+        self.close()
+        if exemplars is not None:
+            self.exemplar_limit = exemplars
+        if dead_letter_path is not None:
+            self.dead_letter_path = dead_letter_path
+        if dead_letter_bytes is not None:
+            self.dead_letter_bytes = dead_letter_bytes
+
+    # Settings a worker process needs to collect diagnostics for this one (see for_worker)
+    def worker_settings(self):
+        return {"exemplars": self.exemplar_limit, "keep_rejected_lines": bool(self.dead_letter_path),
+                "dead_letter_bytes": self.dead_letter_bytes}
+
+    # In a worker process: start from empty counters and hold rejected lines instead of writing them, so the
+    # parent merges everything (drain -> merge) and the dead-letter cap applies to the whole run
+    def for_worker(self, exemplars=DEFAULT_EXEMPLARS, keep_rejected_lines=False,
+                   dead_letter_bytes=DEFAULT_DEAD_LETTER_BYTES):
+        self._dead_letter = None  # A handle inherited through fork belongs to the parent
+        self.exemplar_limit = exemplars
+        self.dead_letter_bytes = dead_letter_bytes  # Bounds what one task holds; merge() applies the run's cap
+        self.dead_letter_path = None
+        self.counts, self.exemplars = {}, {}
+        self.dead_letter_written = self.dead_letter_dropped = 0
+        self._held_lines = [] if keep_rejected_lines else None
+
+    # Hand over (and reset) what was collected since the last drain, as a picklable dict for merge()
+    def drain(self):
+        with self._lock:
+            drained = {"counts": self.counts, "exemplars": self.exemplars, "lines": self._held_lines or [],
+                       "dropped": self.dead_letter_dropped}
+            self.counts, self.exemplars = {}, {}
+            self.dead_letter_written = self.dead_letter_dropped = 0
+            if self._held_lines is not None:
+                self._held_lines = []
+        return drained
+
+    # Add what a worker drained to these diagnostics (its rejected lines go to this dead-letter file)
+    def merge(self, drained):
+        for (kind, source, reason), count in drained["counts"].items():
+            self._note(kind, source, reason, drained["exemplars"].get((kind, source, reason), []), count)
+        for entry in drained["lines"]:
+            self._write_dead_letter(entry)
+        with self._lock:
+            self.dead_letter_dropped += drained["dropped"]
+
+    def _note(self, kind, source, reason, exemplars, count):
+        METRICS.inc(_METRIC_NAMES[kind], count, source=source, reason=reason)
+        key = (kind, source, reason)
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + count
+            kept = self.exemplars.setdefault(key, [])
+            if len(kept) < self.exemplar_limit:
+                kept.extend(exemplars[:self.exemplar_limit - len(kept)])
+
+    # Rows loaded with a default in place of a bad value (e.g. unknown user -> default user).
+    # `exemplars` identify the rows (count defaults to one row per exemplar, or 1).
+    def defaulted(self, source, reason, *exemplars, count=None):
+        self._note("defaulted", source, reason, exemplars, count if count is not None else len(exemplars) or 1)
+
+    # Rows left out of the load
+    def skipped(self, source, reason, *exemplars, count=None):
+        self._note("skipped", source, reason, exemplars, count if count is not None else len(exemplars) or 1)
+
+    # A raw input line that could not be decoded: counted, and copied to the dead-letter file while it has room
+    def rejected(self, file_path, position, line, error):
+        self._note("rejected", file_path, "json_decode_error", (f"{position}: {error}",), 1)
+        if not self.dead_letter_path and self._held_lines is None:
+            return
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        self._write_dead_letter(json.dumps({"file": file_path, "position": position, "error": str(error),
+                                            "line": line}) + "\n")
+
+    def _write_dead_letter(self, entry):
+        with self._lock:
+            if self.dead_letter_written + len(entry) > self.dead_letter_bytes:
+                self.dead_letter_dropped += 1
+                return
+            self.dead_letter_written += len(entry)
+            if self._held_lines is not None:
+                self._held_lines.append(entry)  # Worker: written by the parent after merge()
+                return
+            if self._dead_letter is None:
+                self._dead_letter = open(self.dead_letter_path, 'a', encoding="utf-8")
+            self._dead_letter.write(entry)
+
+    def close(self):
+        with self._lock:
+            if self._dead_letter is not None:
+                self._dead_letter.close()
+                self._dead_letter = None
+
+    def report(self):
+        self.close()
+        if not self.counts:
+            return
+        print("🩺 Load diagnostics:")
+        for (kind, source, reason), count in sorted(self.counts.items()):
+            exemplars = ", ".join(str(exemplar) for exemplar in self.exemplars.get((kind, source, reason), []))
+            print(f"  ⚠️ {kind} {source} [{reason}]: {count} rows (first: {exemplars})")
+        if self.dead_letter_written:
+            print(f"  📄 Rejected lines written to {self.dead_letter_path} ({self.dead_letter_written} bytes).")
+        if self.dead_letter_dropped:
+            print(f"  ⚠️ {self.dead_letter_dropped} rejected lines not written: dead-letter file reached "
+                  f"{self.dead_letter_bytes} bytes.")
+
+# Process-wide diagnostics used by the loaders (worker processes drain theirs into the parent's)
+DIAGNOSTICS = Diagnostics()
@@ -0,0 +1,209 @@
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in seconds (batch latencies range from milliseconds to minutes)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                self.bucket_counts[index] += 1
+                break
+
+# Counters and histograms keyed by (name, labels); cheap enough to update from the load loops
+class MetricsRegistry:
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    # Time a block into the `<name>_seconds` histogram
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - start, **labels)
+
+    def to_dict(self):
+        return {
+            "counters": [{"name": name, "labels": dict(labels), "value": value}
+                         for (name, labels), value in self.counters.items()],
+            "histograms": [{"name": name, "labels": dict(labels), "count": histogram.count, "sum": histogram.sum,
+                            "buckets": dict(zip(map(str, histogram.buckets), histogram.bucket_counts))}
+                           for (name, labels), histogram in self.histograms.items()],
+        }
+
+    # Prometheus text exposition format (for the node_exporter textfile collector)
+    def to_prometheus(self, prefix="fetch_etl_"):
+        lines = []
+        typed = set()
+        for (name, labels), value in sorted(self.counters.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {prefix}{name} counter")
+            lines.append(f"{prefix}{name}{_format_labels(labels)} {value}")
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {prefix}{name} histogram")
+            cumulative = 0
+            for upper_bound, count in zip(histogram.buckets, histogram.bucket_counts):
+                cumulative += count
+                lines.append(f"{prefix}{name}_bucket{_format_labels(labels + (('le', str(upper_bound)),))} {cumulative}")
+            lines.append(f"{prefix}{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+            lines.append(f"{prefix}{name}_sum{_format_labels(labels)} {histogram.sum}")
+            lines.append(f"{prefix}{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    # Write to `path`: Prometheus text for *.prom, JSON otherwise
+    def write(self, path):
+        with open(path, 'w') as file:
+            if path.endswith(".prom"):
+                file.write(self.to_prometheus())
+            else:
+                json.dump(self.to_dict(), file, indent=2)
+        print(f"📊 Metrics written to {path}.")
+
+    # One line per stage: total time and batch count
+    def report(self):
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            label_text = ", ".join(f"{key}={value}" for key, value in labels)
+            print(f"⏱️ {name} [{label_text}]: {histogram.sum:.2f}s over {histogram.count} batches")
+        for (name, labels), value in sorted(self.counters.items()):
+            label_text = ", ".join(f"{key}={value}" for key, value in labels)
+            print(f"🔢 {name} [{label_text}]: {value}")
+
+_EXHAUSTED = object()
+
+# Yield from `iterable`, timing each step into the `<name>_seconds` histogram (e.g. parse time per batch)
+def timed_iter(iterable, name, registry=None, **labels):
+    registry = registry or METRICS
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        item = next(iterator, _EXHAUSTED)
+        if item is _EXHAUSTED:
+            return
+        registry.observe(f"{name}_seconds", time.perf_counter() - start, **labels)
+        yield item
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+# Process-wide registry used by the loaders
+METRICS = MetricsRegistry()
+
+# Samples the main thread's stack every `interval` seconds; output is in collapsed-stack
+# format ("a;b;c count") that flamegraph tools read directly
+class SamplingProfiler:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._target_thread_id = threading.main_thread().ident
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target_thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(f"{frame.f_code.co_name} ({frame.f_code.co_filename.rsplit('/', 1)[-1]}:{frame.f_code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, output_path):
+        self._stop.set()
+        self._thread.join()
+        with open(output_path, 'w') as file:
+            for stack, count in self.samples.most_common():
+                file.write(f"{stack} {count}\n")
+
+# Run a block under the chosen profiler ("cprofile" or "sample"); no-op when mode is None
+@contextmanager
+def profiling(mode=None, output_path=None):
+    if mode is None:
+        yield
+        return
+
+    if mode == "cprofile":
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            output_path = output_path or "load.prof"
+            profiler.dump_stats(output_path)
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+            print(f"🔍 cProfile stats written to {output_path}.")
+    elif mode == "sample":
+        profiler = SamplingProfiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            output_path = output_path or "load.stacks"
+            profiler.stop(output_path)
+            print(f"🔍 {sum(profiler.samples.values())} stack samples written to {output_path}.")
+    else:
+        raise ValueError(f"Unknown profiler: {mode}")
+
+# Shared command-line switches for the loaders
+def add_metrics_arguments(parser):
+    parser.add_argument("--metrics-out", help="Write metrics to this file (.prom for Prometheus text, else JSON)")
+    parser.add_argument("--profile", choices=["cprofile", "sample"], help="Profile the run")
+    parser.add_argument("--profile-out", help="Where to write the profile (default load.prof / load.stacks)")
+    parser.add_argument("--dead-letter", help="Append undecodable input lines to this NDJSON file")
+    parser.add_argument("--dead-letter-bytes", type=int, help="Stop writing the dead-letter file past this size (default 64 MiB)")
+    parser.add_argument("--exemplars", type=int, help="Offending ids kept per reason for the end-of-run summary (default 5)")
+
+# Run a loader's main() with the requested profiler, then summarize its diagnostics and write its metrics
+def run_instrumented(main, args, **kwargs):
+    from loadDiagnostics import DIAGNOSTICS  # loadDiagnostics records into METRICS, so it imports this module
+
+    DIAGNOSTICS.configure(args.exemplars, args.dead_letter, args.dead_letter_bytes)
+    try:
+        with profiling(args.profile, args.profile_out):
+            main(**kwargs)
+    finally:
+        DIAGNOSTICS.report()
+    METRICS.report()
+    if args.metrics_out:
+        METRICS.write(args.metrics_out)
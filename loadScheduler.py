@@ -0,0 +1,175 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from bulkLoader import DEFAULT_COMMIT_ROWS
+from checkpointStore import CheckpointStore
+from columnarExtract import is_extract_dir
+from dimensionCache import uuid_to_bytes
+from loadDiagnostics import DIAGNOSTICS
+from loadMetrics import METRICS
+
+# Dependency-aware load of users, brands and receipts in one process:
+#
+#   dim_users  ──┐
+#                ├──> fact_receipts / fact_receipt_items writes
+#   dim_brands ──┘
+#   receipts parse + transform (runs from the start)
+#
+# The two dimension loads run concurrently on pooled connections, and receipts are parsed and transformed
+# meanwhile with their user/brand references left unresolved. Only the fact writes wait for both dimensions
+# to commit; each batch's references are then checked against the committed keys (unknown ones get the
+# default ids, as in a sequential load): wall time is roughly max(dimension loads) + the fact writes.
+
+# Transformed receipt batches held while the dimensions are still loading (bounds the memory of the overlap)
+DEFAULT_PREFETCH_BATCHES = 20
+
+# Stand-in key set for the receipts transform while the dimensions are loading: every well-formed reference is
+# kept as is (None is still defaulted) and resolved once the dimension loads have committed (resolve_references)
+class DeferredKeys:
+    def __contains__(self, value):
+        return isinstance(value, str)
+
+    def contains_many(self, values):
+        return np.array([isinstance(value, str) for value in values], dtype=bool)
+
+    def report(self):
+        pass
+
+# Function to replace the references of a batch column that are not in `cache` with `default_id`, reporting
+# them as the transform does for keys missing from its key set (references already defaulted are kept)
+def _default_unknown(batch, column, cache, default_id, table, reason):
+    if not len(batch):
+        return
+    keys = np.frombuffer(batch.uuid_bytes(column), dtype="S16").copy()
+    default_key = np.array([uuid_to_bytes(default_id)], dtype="S16")
+    unknown = ~cache.contains_keys(keys) & (keys != default_key)
+    if unknown.any():
+        keys[unknown] = default_key
+        batch.set_uuid_bytes(column, keys.tobytes())
+        exemplars = [batch.row(index)[0] for index in np.flatnonzero(unknown)[:DIAGNOSTICS.exemplar_limit]]
+        DIAGNOSTICS.defaulted(table, reason, *exemplars, count=int(unknown.sum()))
+
+# Function to resolve the user and brand references of a (position, receipts, items) batch transformed
+# against DeferredKeys, using the dimension keys as committed
+def resolve_references(batch, user_keys, brand_keys):
+    from addingReceipts import DEFAULT_BRAND_ID, DEFAULT_USER_ID
+
+    position, receipts_data, receipt_items_data = batch
+    _default_unknown(receipts_data, "receipt_user_id", user_keys, DEFAULT_USER_ID, "receipts", "unknown_user")
+    _default_unknown(receipt_items_data, "item_brand_id", brand_keys, DEFAULT_BRAND_ID, "receipt_items",
+                     "unknown_brand")
+    return batch
+
+# Iterate over batches produced by a background thread that starts right away, holding at most `max_batches`.
+# The first batch is only handed out once `wait` (the dimension gate) returns; when it returns a function,
+# every batch goes through it on the way out.
+class GatedReadAhead:
+    def __init__(self, batches, wait, max_batches=DEFAULT_PREFETCH_BATCHES):
+        self.wait = wait
+        self._queue = queue.Queue(max(1, max_batches))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._produce, args=(batches,), name="receipts-read-ahead", daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, batches):
+        try:
+            for batch in batches:
+                if not self._put(("batch", batch)):
+                    return
+            self._put(("done", None))
+        except BaseException as e:
+            self._put(("error", e))  # Re-raised in the writer's thread
+
+    def __iter__(self):
+        try:
+            start = time.perf_counter()
+            resolve = self.wait()
+            METRICS.observe("dimension_wait_seconds", time.perf_counter() - start, source="receipts")
+            print(f"🔹 Dimensions loaded; writing facts ({self._queue.qsize()} transformed batches waiting).")
+
+            while True:
+                kind, value = self._queue.get()
+                if kind == "done":
+                    return
+                if kind == "error":
+                    raise value
+                yield value if resolve is None else resolve(value)
+        finally:
+            self.close()  # Also when the gate or a write failed: the producer must not stay blocked
+
+    # Stop the producer and wait for it to finish its current batch
+    def close(self):
+        self._stop.set()
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._thread.join()
+
+# Gate of the fact writes: both dimension loads committed without a failed write (their mains return
+# writer.errors == 0). With `get_dimension_keys`, the gate then refreshes both key caches (only the rows just
+# loaded are read) and returns resolve_references bound to them.
+def dimension_gate(loads_by_table, get_dimension_keys=None):
+    def wait():
+        for table_name, future in loads_by_table.items():
+            if future.result() is not True:
+                raise SystemExit(f"❌ Loading {table_name} failed or had failed writes; fact writes were not started.")
+        if get_dimension_keys is None:
+            return None
+        user_keys, brand_keys = get_dimension_keys("dim_users"), get_dimension_keys("dim_brands")
+        return lambda batch: resolve_references(batch, user_keys, brand_keys)
+    return wait
+
+# Load users and brands concurrently and receipts alongside them, gating only the fact writes. Returns once
+# all three are done: True when no write failed. `receipts_options` are passed to addingReceipts.main
+# (workers, vectorized, ...).
+def load_all(paths, batch_size, restart=False, validate=False, commit_rows=DEFAULT_COMMIT_ROWS, delta=False,
+             receipts_options=None, prefetch_batches=None):
+    import addingBrandsData
+    import addingReceipts
+    import addingUsers
+
+    receipts_options = dict(receipts_options or {})
+    common = {"batch_size": batch_size, "restart": restart, "validate": validate, "commit_rows": commit_rows}
+    checkpoints = CheckpointStore()  # Shared, so concurrent loads never overwrite each other's progress
+
+    # Only the JSON receipts loader reads ahead; extracts and the async pipeline write as they read
+    overlap = (not receipts_options.get("async_pipeline")
+               and not any(is_extract_dir(paths[table]) for table in ("users", "brands", "receipts")))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="dimension") as pool:
+        dimension_loads = {
+            "dim_users": pool.submit(addingUsers.main, paths["users"], delta=delta, checkpoints=checkpoints, **common),
+            "dim_brands": pool.submit(addingBrandsData.main, paths["brands"], delta=delta, checkpoints=checkpoints,
+                                      **common),
+        }
+
+        def get_dimension_keys(table_name):
+            key_column = "user_id" if table_name == "dim_users" else "brand_id"
+            return addingReceipts.get_dimension_keys(table_name, key_column,
+                                                     receipts_options.get("full_key_refresh", False))
+
+        if overlap:
+            # Nothing to read before the receipts start: their references are resolved at the gate
+            succeeded = addingReceipts.main(paths["receipts"], checkpoints=checkpoints,
+                                            valid_keys=(DeferredKeys(), DeferredKeys()),
+                                            wait_for_dimensions=dimension_gate(dimension_loads, get_dimension_keys),
+                                            prefetch_batches=prefetch_batches, **receipts_options, **common)
+        else:
+            dimension_gate(dimension_loads)()
+            succeeded = addingReceipts.main(paths["receipts"], checkpoints=checkpoints, **receipts_options, **common)
+
+    print(f"⏱️ users, brands and receipts loaded in {time.perf_counter() - start:.1f}s.")
+    return succeeded
@@ -0,0 +1,12 @@
+-- Row hashes for the delta (upsert) mode of addingUsers.py / addingBrandsData.py.
+-- md5 of the row's data columns, written by the loader; NULL until a row is first loaded in delta mode,
+-- so the first delta run rewrites every existing row once.
+BEGIN;
+
+ALTER TABLE IF EXISTS public.dim_users
+    ADD COLUMN IF NOT EXISTS row_hash bytea;
+
+ALTER TABLE IF EXISTS public.dim_brands
+    ADD COLUMN IF NOT EXISTS row_hash bytea;
+
+END;
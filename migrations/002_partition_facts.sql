@@ -0,0 +1,119 @@
+-- Range-partition fact_receipts and fact_receipt_items by scanned_date month.
+--
+-- A partitioned table's keys must contain the partition column, so fact_receipts is keyed by
+-- (receipt_id, scanned_date) and every item carries its receipt's scanned date (item_scanned_date).
+-- Items are partitioned on that copy, which keeps a receipt and its items in partitions of the same
+-- month and lets the analysis joins run partition by partition.
+--
+-- The old tables are kept as *_unpartitioned; drop them once the row counts have been checked.
+BEGIN;
+
+-- Creates the partitions of both fact tables for the month containing `month` (no-op if they exist)
+CREATE OR REPLACE FUNCTION public.ensure_fact_partitions(month date) RETURNS void
+LANGUAGE plpgsql AS $$
+DECLARE
+    month_start date := date_trunc('month', month)::date;
+    month_end date := (date_trunc('month', month) + INTERVAL '1 month')::date;
+    suffix text := to_char(month_start, '"y"YYYY"m"MM');
+BEGIN
+    IF to_regclass('public.fact_receipts_' || suffix) IS NULL THEN
+        EXECUTE format('CREATE TABLE public.%I PARTITION OF public.fact_receipts FOR VALUES FROM (%L) TO (%L)',
+                       'fact_receipts_' || suffix, month_start, month_end);
+    END IF;
+    IF to_regclass('public.fact_receipt_items_' || suffix) IS NULL THEN
+        EXECUTE format('CREATE TABLE public.%I PARTITION OF public.fact_receipt_items FOR VALUES FROM (%L) TO (%L)',
+                       'fact_receipt_items_' || suffix, month_start, month_end);
+    END IF;
+END;
+$$;
+
+ALTER TABLE public.fact_receipt_items RENAME TO fact_receipt_items_unpartitioned;
+ALTER TABLE public.fact_receipts RENAME TO fact_receipts_unpartitioned;
+ALTER TABLE public.fact_receipt_items_unpartitioned
+    DROP CONSTRAINT IF EXISTS fact_receipt_items_item_receipt_id_fkey,
+    DROP CONSTRAINT IF EXISTS fact_receipt_items_item_brand_id_fkey;
+ALTER TABLE public.fact_receipts_unpartitioned
+    DROP CONSTRAINT IF EXISTS fact_receipts_receipt_user_id_fkey;
+ALTER TABLE public.fact_receipt_items_unpartitioned RENAME CONSTRAINT fact_receipt_items_pkey TO fact_receipt_items_unpartitioned_pkey;
+ALTER TABLE public.fact_receipts_unpartitioned RENAME CONSTRAINT fact_receipts_pkey TO fact_receipts_unpartitioned_pkey;
+
+CREATE TABLE public.fact_receipts
+(
+    receipt_id uuid NOT NULL,
+    receipt_user_id uuid,
+    purchase_timestamp timestamp without time zone NOT NULL,
+    scanned_date timestamp without time zone NOT NULL,
+    processing_finished_date timestamp without time zone,
+    receipt_status character varying(50) COLLATE pg_catalog."default" NOT NULL,
+    total_amount_spent numeric(10, 2) DEFAULT 0.00,
+    items_purchased_count integer DEFAULT 0,
+    reward_points_earned integer DEFAULT 0,
+    extra_bonus_points integer DEFAULT 0,
+    points_awarded_timestamp timestamp without time zone,
+    CONSTRAINT fact_receipts_pkey PRIMARY KEY (receipt_id, scanned_date),
+    CONSTRAINT fact_receipts_receipt_user_id_fkey FOREIGN KEY (receipt_user_id)
+        REFERENCES public.dim_users (user_id) MATCH SIMPLE
+        ON UPDATE NO ACTION
+        ON DELETE CASCADE
+) PARTITION BY RANGE (scanned_date);
+
+CREATE TABLE public.fact_receipt_items
+(
+    receipt_item_id uuid NOT NULL,
+    item_receipt_id uuid,
+    item_brand_id uuid,
+    item_barcode character varying(50) COLLATE pg_catalog."default",
+    item_quantity integer DEFAULT 1,
+    item_price numeric(10, 2) DEFAULT 0.00,
+    item_scanned_date timestamp without time zone NOT NULL,
+    CONSTRAINT fact_receipt_items_pkey PRIMARY KEY (receipt_item_id, item_scanned_date),
+    CONSTRAINT fact_receipt_items_item_receipt_id_fkey FOREIGN KEY (item_receipt_id, item_scanned_date)
+        REFERENCES public.fact_receipts (receipt_id, scanned_date) MATCH SIMPLE
+        ON UPDATE NO ACTION
+        ON DELETE CASCADE,
+    CONSTRAINT fact_receipt_items_item_brand_id_fkey FOREIGN KEY (item_brand_id)
+        REFERENCES public.dim_brands (brand_id) MATCH SIMPLE
+        ON UPDATE NO ACTION
+        ON DELETE SET NULL
+) PARTITION BY RANGE (item_scanned_date);
+
+-- Partitions for every month already loaded, plus the next twelve so routine loads never create one
+DO $$
+DECLARE
+    month date;
+BEGIN
+    FOR month IN
+        SELECT generate_series(first_month, last_month, INTERVAL '1 month')::date
+        FROM (
+            SELECT date_trunc('month', COALESCE(MIN(scanned_date), now())) AS first_month,
+                   date_trunc('month', GREATEST(MAX(scanned_date), now())) + INTERVAL '12 months' AS last_month
+            FROM public.fact_receipts_unpartitioned
+        ) AS bounds
+    LOOP
+        PERFORM public.ensure_fact_partitions(month);
+    END LOOP;
+END;
+$$;
+
+INSERT INTO public.fact_receipts
+SELECT * FROM public.fact_receipts_unpartitioned;
+
+INSERT INTO public.fact_receipt_items
+    (receipt_item_id, item_receipt_id, item_brand_id, item_barcode, item_quantity, item_price, item_scanned_date)
+SELECT i.receipt_item_id, i.item_receipt_id, i.item_brand_id, i.item_barcode, i.item_quantity, i.item_price,
+       r.scanned_date
+FROM public.fact_receipt_items_unpartitioned AS i
+JOIN public.fact_receipts_unpartitioned AS r ON r.receipt_id = i.item_receipt_id;
+
+-- Indexes for the Analysis-ReadMe.md queries (created on every partition, current and future)
+CREATE INDEX IF NOT EXISTS fact_receipts_scanned_date_idx ON public.fact_receipts (scanned_date);
+CREATE INDEX IF NOT EXISTS fact_receipts_user_idx ON public.fact_receipts (receipt_user_id);
+CREATE INDEX IF NOT EXISTS fact_receipts_status_idx ON public.fact_receipts (receipt_status) INCLUDE (total_amount_spent);
+CREATE INDEX IF NOT EXISTS fact_receipt_items_receipt_idx ON public.fact_receipt_items (item_receipt_id, item_scanned_date);
+CREATE INDEX IF NOT EXISTS fact_receipt_items_brand_idx ON public.fact_receipt_items (item_brand_id);
+CREATE INDEX IF NOT EXISTS dim_users_created_date_idx ON public.dim_users (account_created_date);
+
+END;
+
+ANALYZE public.fact_receipts;
+ANALYZE public.fact_receipt_items;
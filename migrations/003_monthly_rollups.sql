@@ -0,0 +1,52 @@
+-- Monthly rollups of the fact tables, kept up to date by `python addingReceipts.py --rollups`
+-- (each batch adds the rows it inserted, in the same transaction) and rebuilt from scratch with
+-- `python rollups.py --rebuild`. Months are the first day of the scanned_date month.
+BEGIN;
+
+-- Brand x month: receipts with at least one item of the brand, item rows, quantity and spend
+CREATE TABLE IF NOT EXISTS public.rollup_brand_month
+(
+    month date NOT NULL,
+    brand_id uuid NOT NULL,
+    receipt_count bigint NOT NULL DEFAULT 0,
+    item_rows bigint NOT NULL DEFAULT 0,
+    item_quantity bigint NOT NULL DEFAULT 0,
+    item_spend numeric(14, 2) NOT NULL DEFAULT 0,
+    receipt_spend numeric(14, 2) NOT NULL DEFAULT 0,  -- Receipt totals summed per item row, as in Analysis-ReadMe.md
+    CONSTRAINT rollup_brand_month_pkey PRIMARY KEY (month, brand_id)
+);
+
+-- Receipt status x month: receipt count and spend, plus the quantity of their items
+CREATE TABLE IF NOT EXISTS public.rollup_status_month
+(
+    month date NOT NULL,
+    receipt_status character varying(50) NOT NULL,
+    receipt_count bigint NOT NULL DEFAULT 0,
+    total_spend numeric(14, 2) NOT NULL DEFAULT 0,
+    item_quantity bigint NOT NULL DEFAULT 0,
+    CONSTRAINT rollup_status_month_pkey PRIMARY KEY (month, receipt_status)
+);
+
+-- User x month: receipts, spend and points
+CREATE TABLE IF NOT EXISTS public.rollup_user_month
+(
+    month date NOT NULL,
+    user_id uuid NOT NULL,
+    receipt_count bigint NOT NULL DEFAULT 0,
+    total_spend numeric(14, 2) NOT NULL DEFAULT 0,
+    points_earned bigint NOT NULL DEFAULT 0,
+    CONSTRAINT rollup_user_month_pkey PRIMARY KEY (month, user_id)
+);
+
+-- User x brand (all months): what the "users created in the past 6 months" questions aggregate
+CREATE TABLE IF NOT EXISTS public.rollup_user_brand
+(
+    user_id uuid NOT NULL,
+    brand_id uuid NOT NULL,
+    receipt_count bigint NOT NULL DEFAULT 0,
+    item_rows bigint NOT NULL DEFAULT 0,
+    receipt_spend numeric(14, 2) NOT NULL DEFAULT 0,
+    CONSTRAINT rollup_user_brand_pkey PRIMARY KEY (user_id, brand_id)
+);
+
+END;
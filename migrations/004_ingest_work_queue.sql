@@ -0,0 +1,38 @@
+-- Work queue of the distributed receipts ingest (`python distributedIngest.py enqueue|work|status`).
+-- A unit is a byte range of an NDJSON file (or a whole JSON-array file) on storage every worker can read.
+-- Workers claim units with SELECT ... FOR UPDATE SKIP LOCKED, and mark them done in the same transaction
+-- as the rows they wrote, so a unit's rows are committed exactly once.
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS public.ingest_work_units
+(
+    unit_id text NOT NULL,
+    file_path text NOT NULL,
+    start_offset bigint NOT NULL,
+    end_offset bigint NOT NULL,
+    status character varying(10) NOT NULL DEFAULT 'pending',  -- pending, running, done, failed
+    attempts integer NOT NULL DEFAULT 0,
+    claimed_by text,
+    claimed_at timestamp with time zone,
+    finished_at timestamp with time zone,
+    receipt_rows bigint,
+    item_rows bigint,
+    last_error text,
+    CONSTRAINT ingest_work_units_pkey PRIMARY KEY (unit_id)
+);
+
+-- Claims only look at the units still to do
+CREATE INDEX IF NOT EXISTS ingest_work_units_open_idx
+    ON public.ingest_work_units (status, claimed_at) WHERE status IN ('pending', 'running');
+
+-- Commit ledger of the units claimed from the local file queue (the Postgres queue records commits in
+-- ingest_work_units itself): inserted in the transaction of the unit's writes
+CREATE TABLE IF NOT EXISTS public.ingest_unit_commits
+(
+    unit_id text NOT NULL,
+    committed_by text NOT NULL,
+    committed_at timestamp with time zone NOT NULL DEFAULT now(),
+    CONSTRAINT ingest_unit_commits_pkey PRIMARY KEY (unit_id)
+);
+
+END;
@@ -0,0 +1,102 @@
+import os
+from collections import deque
+from multiprocessing import Pool
+
+from addingReceipts import process_receipts_data
+from jsonDecoder import DecodeError, loads
+from loadDiagnostics import DIAGNOSTICS
+
+# Size of the byte range each worker transforms per task (~a few thousand receipts)
+DEFAULT_CHUNK_BYTES = 8 * 1024 * 1024
+
+# Function to split an NDJSON file into byte ranges that start and end on newline boundaries
+def split_byte_ranges(file_path, chunk_bytes=DEFAULT_CHUNK_BYTES, start_position=0):
+    from lineIndex import LineIndex
+
+    file_size = os.path.getsize(file_path)
+    ranges = []
+    index = LineIndex.load(file_path)
+    if index is not None and start_position <= index.indexed_bytes:
+        # Cut at indexed line starts without touching the file; only an appended tail is cut by reading
+        ranges = index.byte_ranges(chunk_bytes, start_position)
+        start_position = index.indexed_bytes
+    with open(file_path, 'rb') as file:
+        start = start_position
+        while start < file_size:
+            file.seek(min(start + chunk_bytes, file_size))
+            file.readline()  # Move to the end of the line the cut landed in
+            end = min(file.tell(), file_size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+# Function to parse the NDJSON records inside one byte range
+def iter_range_records(file_path, start, end):
+    with open(file_path, 'rb') as file:
+        file.seek(start)
+        position = start
+        while position < end:
+            line = file.readline()
+            if not line:
+                break
+            position += len(line)
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield loads(line)
+            except DecodeError as e:
+                DIAGNOSTICS.rejected(file_path, position, line, e)
+
+# Lookup sets are shipped to each worker once, not with every task
+_worker_state = {}
+
+def _init_worker(file_path, valid_user_ids, valid_brand_ids, transform, diagnostics_settings):
+    DIAGNOSTICS.for_worker(**diagnostics_settings)
+    _worker_state["file_path"] = file_path
+    _worker_state["transform"] = transform
+    _worker_state["valid_user_ids"] = valid_user_ids
+    _worker_state["valid_brand_ids"] = valid_brand_ids
+
+# Transform one byte range; the range's diagnostics travel back with its rows and are merged by the parent
+def _transform_range(byte_range):
+    start, end = byte_range
+    records = iter_range_records(_worker_state["file_path"], start, end)
+    receipts_data, receipt_items_data = _worker_state["transform"](records, _worker_state["valid_user_ids"],
+                                                                   _worker_state["valid_brand_ids"])
+    return receipts_data, receipt_items_data, DIAGNOSTICS.drain()
+
+# Stream (end offset, receipts, receipt items) batches transformed in a process pool, in file order
+def stream_receipts_parallel(file_path, valid_user_ids, valid_brand_ids, workers, chunk_bytes=DEFAULT_CHUNK_BYTES,
+                             transform=process_receipts_data, start_position=0):
+    with open(file_path, 'r') as file:
+        if file.read(1) == "[":
+            raise ValueError("Parallel mode needs NDJSON input; JSON arrays cannot be split by byte range.")
+
+    byte_ranges = iter(split_byte_ranges(file_path, chunk_bytes, start_position))
+    max_in_flight = workers * 2  # Bounds memory when the writer is slower than the workers
+
+    pool = Pool(workers, initializer=_init_worker,
+                initargs=(file_path, valid_user_ids, valid_brand_ids, transform, DIAGNOSTICS.worker_settings()))
+    try:
+        pending = deque()
+        for byte_range in byte_ranges:
+            pending.append((byte_range[1], pool.apply_async(_transform_range, (byte_range,))))
+            if len(pending) >= max_in_flight:
+                break
+
+        while pending:
+            end, result = pending.popleft()
+            receipts_data, receipt_items_data, diagnostics = result.get()
+            DIAGNOSTICS.merge(diagnostics)
+            # Keep the pool busy while the caller writes this batch
+            next_range = next(byte_ranges, None)
+            if next_range is not None:
+                pending.append((next_range[1], pool.apply_async(_transform_range, (next_range,))))
+            yield end, receipts_data, receipt_items_data
+        pool.close()  # Let the workers exit on their own
+    except BaseException:
+        pool.terminate()  # Stopped early (error or generator closed): the pending results are not needed
+        raise
+    finally:
+        pool.join()
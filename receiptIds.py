@@ -0,0 +1,17 @@
+import uuid
+
+from idNormalizer import stable_record_id
+
+# Namespaces of the content-derived ids. Changing either one re-keys every row on the next load.
+RECEIPT_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "fetchRewards/fact_receipts")
+RECEIPT_ITEM_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "fetchRewards/fact_receipt_items")
+
+# Function to derive a receipt id that is the same on every run:
+# the `_id` itself when it is a UUID, else a UUIDv5 of the raw `_id`, else of the whole record
+def stable_receipt_id(record):
+    return stable_record_id(record, RECEIPT_NAMESPACE)
+
+# Function to derive a receipt item id from its receipt, its position in rewardsReceiptItemList and its barcode
+def stable_item_id(receipt_id, position, barcode=None):
+    barcode = "" if barcode is None else str(barcode)
+    return str(uuid.uuid5(RECEIPT_ITEM_NAMESPACE, f"{receipt_id}:{position}:{barcode}"))
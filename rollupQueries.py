@@ -0,0 +1,108 @@
+import argparse
+
+# The Analysis-ReadMe.md questions answered from the rollup tables (migrations/003_monthly_rollups.sql).
+# Each query reads a few hundred rollup rows instead of joining fact_receipts, fact_receipt_items and dim_brands.
+
+# Latest scanned month, as in the README's MAX(scanned_date) subqueries
+LATEST_MONTH_SQL = "(SELECT MAX(month) FROM rollup_status_month)"
+
+# 1. Top 5 brands by receipts scanned for the most recent month (item rows, matching COUNT(r.receipt_id) over the join)
+TOP_BRANDS_SQL = f"""
+    SELECT b.brand_title AS brand_name, SUM(rb.item_rows) AS receipt_count
+    FROM rollup_brand_month rb
+    JOIN dim_brands b ON b.brand_id = rb.brand_id
+    WHERE rb.month = {LATEST_MONTH_SQL}
+    GROUP BY b.brand_title
+    ORDER BY receipt_count DESC
+    LIMIT 5;
+"""
+
+# 2. Ranking of the top 5 brands for the recent and previous month
+BRAND_RANKING_SQL = f"""
+    WITH ranked AS (
+        SELECT rb.month, b.brand_title AS brand_name,
+               RANK() OVER (PARTITION BY rb.month ORDER BY SUM(rb.item_rows) DESC) AS brand_rank
+        FROM rollup_brand_month rb
+        JOIN dim_brands b ON b.brand_id = rb.brand_id
+        WHERE rb.month >= {LATEST_MONTH_SQL} - INTERVAL '1 month'
+        GROUP BY rb.month, b.brand_title
+    ),
+    recent_month AS (
+        SELECT brand_name, brand_rank FROM ranked WHERE month = {LATEST_MONTH_SQL} AND brand_rank <= 5
+    ),
+    previous_month AS (
+        SELECT brand_name, brand_rank FROM ranked WHERE month < {LATEST_MONTH_SQL} AND brand_rank <= 5
+    )
+    SELECT rm.brand_name, rm.brand_rank AS recent_rank, pm.brand_rank AS previous_rank
+    FROM recent_month rm
+    LEFT JOIN previous_month pm ON rm.brand_name = pm.brand_name
+    ORDER BY recent_rank;
+"""
+
+# 3. Average spend for 'Accepted' vs. 'Rejected' receipts
+AVERAGE_SPEND_SQL = """
+    SELECT receipt_status, SUM(total_spend) / NULLIF(SUM(receipt_count), 0) AS avg_spend
+    FROM rollup_status_month
+    WHERE receipt_status IN ('Accepted', 'Rejected')
+    GROUP BY receipt_status;
+"""
+
+# 4. Total number of items purchased for 'Accepted' vs. 'Rejected' receipts
+ITEMS_BY_STATUS_SQL = """
+    SELECT receipt_status, SUM(item_quantity) AS total_items_purchased
+    FROM rollup_status_month
+    WHERE receipt_status IN ('Accepted', 'Rejected')
+    GROUP BY receipt_status;
+"""
+
+# 5. and 6. Brand with the most spend / transactions among users created in the past 6 months
+def recent_users_brand_sql(measure):
+    return f"""
+        SELECT b.brand_title AS brand_name, SUM(ub.{measure}) AS total
+        FROM rollup_user_brand ub
+        JOIN dim_users u ON u.user_id = ub.user_id
+        JOIN dim_brands b ON b.brand_id = ub.brand_id
+        WHERE u.account_created_date >= NOW() - INTERVAL '6 months'
+        GROUP BY b.brand_title
+        ORDER BY total DESC
+        LIMIT 1;
+    """
+
+QUERIES = [
+    ("Top 5 brands by receipts scanned, most recent month", TOP_BRANDS_SQL),
+    ("Top 5 brand ranking, recent vs. previous month", BRAND_RANKING_SQL),
+    ("Average spend, Accepted vs. Rejected", AVERAGE_SPEND_SQL),
+    ("Items purchased, Accepted vs. Rejected", ITEMS_BY_STATUS_SQL),
+    ("Brand with the most spend, users created in the past 6 months", recent_users_brand_sql("receipt_spend")),
+    ("Brand with the most transactions, users created in the past 6 months", recent_users_brand_sql("item_rows")),
+]
+
+# Function to run every query and return [(title, column names, rows)]
+def run_queries(conn):
+    results = []
+    cursor = conn.cursor()
+    try:
+        for title, sql in QUERIES:
+            cursor.execute(sql)
+            results.append((title, [column[0] for column in cursor.description], cursor.fetchall()))
+    finally:
+        cursor.close()
+    return results
+
+if __name__ == "__main__":
+    import time
+
+    from dbPool import pooled_connection
+    from fetchEtl.config import db_params
+
+    parser = argparse.ArgumentParser(description="Answer the Analysis-ReadMe.md questions from the rollup tables.")
+    parser.parse_args()
+    start = time.perf_counter()
+    with pooled_connection(db_params) as conn:
+        results = run_queries(conn)
+    for title, columns, rows in results:
+        print(f"\n📊 {title}")
+        print("  " + " | ".join(columns))
+        for row in rows:
+            print("  " + " | ".join(str(value) for value in row))
+    print(f"\n⏱️ {len(QUERIES)} queries in {(time.perf_counter() - start) * 1000:.1f} ms.")
@@ -0,0 +1,149 @@
+import argparse
+
+from bulkLoader import inserted_table_name
+
+# Monthly rollups of the fact tables (see migrations/003_monthly_rollups.sql).
+# Every statement adds the aggregates of a source table to the rollups, so the same SQL serves the
+# per-batch update (source = rows the batch inserted) and the full rebuild (source = the fact table).
+
+ROLLUP_TABLES = ["rollup_brand_month", "rollup_status_month", "rollup_user_month", "rollup_user_brand"]
+
+# Key and measure columns of each rollup table
+ROLLUP_COLUMNS = {
+    "rollup_brand_month": (["month", "brand_id"],
+                           ["receipt_count", "item_rows", "item_quantity", "item_spend", "receipt_spend"]),
+    "rollup_status_month": (["month", "receipt_status"], ["receipt_count", "total_spend", "item_quantity"]),
+    "rollup_user_month": (["month", "user_id"], ["receipt_count", "total_spend", "points_earned"]),
+    "rollup_user_brand": (["user_id", "brand_id"], ["receipt_count", "item_rows", "receipt_spend"]),
+}
+
+# Rows are upserted in key order, so concurrent writers lock the rollup rows they share in the same order
+def _add_sql(table, key_columns, measure_columns, select_sql):
+    columns = ", ".join(key_columns + measure_columns)
+    keys = ", ".join(key_columns)
+    updates = ", ".join(f"{column} = {table}.{column} + EXCLUDED.{column}" for column in measure_columns)
+    order = ", ".join(str(position + 1) for position in range(len(key_columns)))
+    return (f"INSERT INTO {table} ({columns}) {select_sql}\n            ORDER BY {order} "
+            f"ON CONFLICT ({keys}) DO UPDATE SET {updates};")
+
+def delta_table_name(table):
+    return f"delta_{table}"
+
+# Same aggregates as _add_sql, appended to the session's delta table instead (see delta_rollup_sql)
+def _add_delta_sql(table, key_columns, measure_columns, select_sql):
+    return f"INSERT INTO {delta_table_name(table)} ({', '.join(key_columns + measure_columns)}) {select_sql};"
+
+# Statements folding receipts from `source` into the status and user rollups
+def receipt_rollup_sql(source, add=_add_sql):
+    return [
+        add("rollup_status_month", ["month", "receipt_status"], ["receipt_count", "total_spend"], f"""
+            SELECT date_trunc('month', scanned_date)::date, receipt_status,
+                   COUNT(*), COALESCE(SUM(total_amount_spent), 0)
+            FROM {source}
+            GROUP BY 1, 2"""),
+        add("rollup_user_month", ["month", "user_id"], ["receipt_count", "total_spend", "points_earned"], f"""
+            SELECT date_trunc('month', scanned_date)::date, receipt_user_id,
+                   COUNT(*), COALESCE(SUM(total_amount_spent), 0), COALESCE(SUM(reward_points_earned), 0)
+            FROM {source}
+            WHERE receipt_user_id IS NOT NULL
+            GROUP BY 1, 2"""),
+    ]
+
+# Statements folding receipt items from `source` (joined to their receipts) into the brand, status and
+# user x brand rollups. With `new_rows_only` (source = the rows one write inserted), a receipt's items can
+# arrive over several writes (e.g. a receipt re-processed with more items), so a receipt only counts for a
+# brand when none of its items of that brand were in fact_receipt_items before this write.
+def item_rollup_sql(source, new_rows_only=False, add=_add_sql):
+    joined = f"""
+            FROM {source} AS i
+            JOIN fact_receipts AS r ON r.receipt_id = i.item_receipt_id AND r.scanned_date = i.item_scanned_date"""
+    new_receipts = "COUNT(DISTINCT i.item_receipt_id)"
+    if new_rows_only:
+        new_receipts += f""" FILTER (WHERE NOT EXISTS (
+                       SELECT 1 FROM fact_receipt_items AS earlier
+                       WHERE earlier.item_receipt_id = i.item_receipt_id
+                         AND earlier.item_scanned_date = i.item_scanned_date
+                         AND earlier.item_brand_id = i.item_brand_id
+                         AND NOT EXISTS (SELECT 1 FROM {source} AS s
+                                         WHERE s.receipt_item_id = earlier.receipt_item_id)))"""
+    return [
+        add("rollup_brand_month", ["month", "brand_id"],
+            ["receipt_count", "item_rows", "item_quantity", "item_spend", "receipt_spend"], f"""
+            SELECT date_trunc('month', i.item_scanned_date)::date, i.item_brand_id,
+                   {new_receipts}, COUNT(*), COALESCE(SUM(i.item_quantity), 0),
+                   COALESCE(SUM(i.item_price), 0), COALESCE(SUM(r.total_amount_spent), 0){joined}
+            WHERE i.item_brand_id IS NOT NULL
+            GROUP BY 1, 2"""),
+        add("rollup_status_month", ["month", "receipt_status"], ["item_quantity"], f"""
+            SELECT date_trunc('month', i.item_scanned_date)::date, r.receipt_status,
+                   COALESCE(SUM(i.item_quantity), 0){joined}
+            GROUP BY 1, 2"""),
+        add("rollup_user_brand", ["user_id", "brand_id"], ["receipt_count", "item_rows", "receipt_spend"], f"""
+            SELECT r.receipt_user_id, i.item_brand_id,
+                   {new_receipts}, COUNT(*), COALESCE(SUM(r.total_amount_spent), 0){joined}
+            WHERE r.receipt_user_id IS NOT NULL AND i.item_brand_id IS NOT NULL
+            GROUP BY 1, 2"""),
+    ]
+
+# Per-write statements for BulkWriter(after_merge=...): each reads the rows that write just inserted
+def incremental_rollup_sql():
+    return {
+        "fact_receipts": receipt_rollup_sql(inserted_table_name("fact_receipts")),
+        "fact_receipt_items": item_rollup_sql(inserted_table_name("fact_receipt_items"), new_rows_only=True),
+    }
+
+# Deferred variant for long transactions (distributedIngest.py commits a whole work unit at once): each write
+# only appends its aggregates to session-private delta tables, and apply_deltas_sql() folds them into the
+# rollups once, right before the commit. The rollup rows are then locked for moments instead of for the whole
+# unit, always in ROLLUP_TABLES order and key order, so concurrent workers neither serialize nor deadlock.
+def delta_rollup_sql():
+    return {
+        "fact_receipts": receipt_rollup_sql(inserted_table_name("fact_receipts"), add=_add_delta_sql),
+        "fact_receipt_items": item_rollup_sql(inserted_table_name("fact_receipt_items"), new_rows_only=True,
+                                              add=_add_delta_sql),
+    }
+
+# Statements creating the delta tables (once per session; measures default to 0, no keys)
+def create_delta_tables_sql():
+    return [f"CREATE TEMP TABLE IF NOT EXISTS {delta_table_name(table)} (LIKE {table} INCLUDING DEFAULTS);"
+            for table in ROLLUP_TABLES]
+
+# Statements adding the summed deltas to the rollups in key order, then emptying the delta tables
+def apply_deltas_sql():
+    statements = []
+    for table in ROLLUP_TABLES:
+        key_columns, measure_columns = ROLLUP_COLUMNS[table]
+        keys = ", ".join(key_columns)
+        sums = ", ".join(f"SUM({column})" for column in measure_columns)
+        statements.append(_add_sql(table, key_columns, measure_columns,
+                                   f"SELECT {keys}, {sums} FROM {delta_table_name(table)} GROUP BY {keys}"))
+        statements.append(f"TRUNCATE {delta_table_name(table)};")
+    return statements
+
+# Recompute every rollup from the fact tables (after bulk deletes, or when the rollups are first added)
+def rebuild_rollups(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"TRUNCATE {', '.join(ROLLUP_TABLES)};")
+        for sql in receipt_rollup_sql("fact_receipts") + item_rollup_sql("fact_receipt_items"):
+            cursor.execute(sql)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+if __name__ == "__main__":
+    from dbPool import pooled_connection
+    from fetchEtl.config import db_params
+
+    parser = argparse.ArgumentParser(description="Maintain the monthly rollup tables.")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute all rollups from the fact tables")
+    args = parser.parse_args()
+    if args.rebuild:
+        with pooled_connection(db_params) as conn:
+            rebuild_rollups(conn)
+        print(f"✅ Rebuilt {', '.join(ROLLUP_TABLES)}.")
+    else:
+        parser.print_help()
@@ -0,0 +1,273 @@
+import argparse
+import sys
+import uuid
+from array import array
+from datetime import datetime, timedelta
+
+from bulkLoader import TABLE_SPECS
+
+# Compact batch containers for transformed rows. Each column is one flat buffer (struct of arrays):
+# UUIDs as 16 bytes, timestamps as int64 milliseconds, numbers in typed arrays, repeated labels interned.
+# A batch iterates as the row tuples BulkWriter / rows_to_csv expect, materialized one row at a time.
+
+NULL_MS = -(2 ** 63)  # int64 marker for a missing timestamp (also numpy's NaT)
+EPOCH = datetime(1970, 1, 1)
+ONE_MS = timedelta(milliseconds=1)
+
+# Column kinds
+UUID = "uuid"    # 16 bytes in a bytearray, never NULL
+MS = "ms"        # array('q'), NULL_MS when missing
+INT = "int"      # array('q'), never NULL
+FLOAT = "float"  # array('d'), NaN when missing (written as NULL)
+BOOL = "bool"    # array('b'), -1 when missing
+LABEL = "label"  # list of interned str (few distinct values: statuses, roles, states)
+TEXT = "text"    # list of str / None
+
+# Function to read a timestamp (int ms, datetime / pd.Timestamp, numpy datetime64 or None) as int ms
+def to_ms(value):
+    if value is None or value != value:  # None, NaT
+        return NULL_MS
+    if isinstance(value, int):
+        return value
+    if isinstance(value, datetime):
+        return (value - EPOCH) // ONE_MS
+    return int(value.astype("datetime64[ms]").astype("int64"))
+
+def from_ms(value):
+    return None if value == NULL_MS else EPOCH + value * ONE_MS
+
+def _new_column(kind):
+    if kind == UUID:
+        return bytearray()
+    if kind in (MS, INT):
+        return array("q")
+    if kind == FLOAT:
+        return array("d")
+    if kind == BOOL:
+        return array("b")
+    return []
+
+def _encode(kind, value):
+    if kind == UUID:  # Canonical strings from the transforms; no uuid.UUID round trip
+        raw = bytes.fromhex(value.replace("-", ""))
+        if len(raw) != 16:
+            raise ValueError(f"badly formed UUID: {value!r}")
+        return raw
+    if kind == MS:
+        return to_ms(value)
+    if kind == INT:
+        return int(value)
+    if kind == FLOAT:
+        return float("nan") if value is None else float(value)
+    if kind == BOOL:
+        return -1 if value is None else int(bool(value))
+    if kind == LABEL and isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+# Function to encode a whole column at once (see ColumnBatch.from_columns)
+def _encode_column(kind, values):
+    if kind == UUID:
+        if getattr(values, "ndim", 1) == 2:  # (rows, 16) uint8 array of raw UUIDs
+            return bytearray(values.tobytes())
+        column = bytearray.fromhex("".join(values).replace("-", ""))
+        if len(column) != 16 * len(values):
+            raise ValueError("badly formed UUID in column")
+        return column
+    if kind in (MS, INT, FLOAT):
+        import numpy as np
+        dtype, typecode = (np.float64, "d") if kind == FLOAT else (np.int64, "q")
+        return array(typecode, np.ascontiguousarray(values, dtype=dtype).tobytes())
+    return [_encode(kind, value) for value in values]
+
+def _decode(kind, column, index):
+    if kind == UUID:
+        digits = column[index * 16:index * 16 + 16].hex()
+        return f"{digits[:8]}-{digits[8:12]}-{digits[12:16]}-{digits[16:20]}-{digits[20:]}"
+    if kind == MS:
+        return from_ms(column[index])
+    if kind == BOOL:
+        value = column[index]
+        return None if value < 0 else bool(value)
+    return column[index]
+
+# Base class: subclasses set TABLE (a TABLE_SPECS key) and KINDS (one kind per column of that table)
+class ColumnBatch:
+    __slots__ = ("columns", "length")
+    TABLE = None
+    KINDS = ()
+
+    def __init__(self):
+        self.columns = [_new_column(kind) for kind in self.KINDS]
+        self.length = 0
+
+    @classmethod
+    def column_names(cls):
+        return TABLE_SPECS[cls.TABLE]["columns"]
+
+    @classmethod
+    def from_rows(cls, rows):
+        batch = cls()
+        for row in rows:
+            batch.append(*row)
+        return batch
+
+    # New batch from whole columns, one per column of the table: UUID strings or a (rows, 16) uint8 array,
+    # int64 ms (NULL_MS when missing) for timestamps, numbers for INT/FLOAT, values for the other kinds
+    @classmethod
+    def from_columns(cls, columns):
+        lengths = {len(values) for values in columns}
+        if len(columns) != len(cls.KINDS) or len(lengths) > 1:
+            raise ValueError(f"{cls.__name__} needs {len(cls.KINDS)} columns of the same length")
+        batch = cls()
+        batch.columns = [_encode_column(kind, values) for kind, values in zip(cls.KINDS, columns)]
+        batch.length = lengths.pop() if lengths else 0
+        return batch
+
+    # Append one row; every value is encoded before any column grows, so a bad value leaves the batch intact
+    def append(self, *values):
+        encoded = [_encode(kind, value) for kind, value in zip(self.KINDS, values)]
+        for column, value in zip(self.columns, encoded):
+            if isinstance(column, bytearray):
+                column += value
+            else:
+                column.append(value)
+        self.length += 1
+
+    def __len__(self):
+        return self.length
+
+    def row(self, index):
+        return tuple(_decode(kind, column, index) for kind, column in zip(self.KINDS, self.columns))
+
+    def __iter__(self):
+        for index in range(self.length):
+            yield self.row(index)
+
+    # All values of one column, decoded
+    def column(self, name):
+        position = self.column_names().index(name)
+        kind, column = self.KINDS[position], self.columns[position]
+        return [_decode(kind, column, index) for index in range(self.length)]
+
+    # Raw 16-byte values of a UUID column (a copy), and their replacement for the same rows
+    def uuid_bytes(self, name):
+        return bytes(self.columns[self.column_names().index(name)])
+
+    def set_uuid_bytes(self, name, raw):
+        if len(raw) != 16 * self.length:
+            raise ValueError(f"{name} needs 16 bytes for each of the {self.length} rows")
+        self.columns[self.column_names().index(name)] = bytearray(raw)
+
+    # New batch of the same type holding the given rows (in that order), copied without decoding
+    def take(self, indices):
+        batch = type(self)()
+        for kind, source, target in zip(self.KINDS, self.columns, batch.columns):
+            if kind == UUID:
+                for index in indices:
+                    target += source[index * 16:index * 16 + 16]
+            else:
+                target.extend(source[index] for index in indices)
+        batch.length = len(indices)
+        return batch
+
+    # Split into {(year, month) or None: batch} on a timestamp column (see factPartitions.group_by_month)
+    def group_by_month(self, name):
+        ms_values = self.columns[self.column_names().index(name)]
+        groups = {}
+        for index, value in enumerate(ms_values):
+            moment = from_ms(value)
+            month = (moment.year, moment.month) if moment is not None else None
+            groups.setdefault(month, []).append(index)
+        return {month: self.take(indices) for month, indices in groups.items()}
+
+    # Bytes held by the batch: column buffers, plus each distinct object a label/text list points to
+    def nbytes(self):
+        total = 0
+        for column in self.columns:
+            if isinstance(column, array):
+                total += column.itemsize * len(column)
+            elif isinstance(column, bytearray):
+                total += len(column)
+            else:
+                distinct = {id(value): value for value in column if value is not None}
+                total += 8 * len(column) + sum(sys.getsizeof(value) for value in distinct.values())
+        return total
+
+class UserBatch(ColumnBatch):
+    __slots__ = ()
+    TABLE = "dim_users"
+    KINDS = (UUID, LABEL, MS, MS, LABEL, BOOL)
+
+class BrandBatch(ColumnBatch):
+    __slots__ = ()
+    TABLE = "dim_brands"
+    KINDS = (UUID, TEXT, LABEL, LABEL, TEXT, BOOL)
+
+class ReceiptBatch(ColumnBatch):
+    __slots__ = ()
+    TABLE = "fact_receipts"
+    KINDS = (UUID, UUID, MS, MS, MS, LABEL, FLOAT, INT, INT, INT, MS)
+
+class ReceiptItemBatch(ColumnBatch):
+    __slots__ = ()
+    TABLE = "fact_receipt_items"
+    KINDS = (UUID, UUID, UUID, TEXT, INT, FLOAT, MS)
+
+# Memory of `rows` transformed receipts held as lists of tuples vs. as ReceiptBatch/ReceiptItemBatch.
+# The tuples hold datetime objects; the loaders' pd.Timestamp values are larger, so the saving is understated.
+def measure_receipt_memory(rows=1000000, items_per_receipt=2):
+    import random
+    import tracemalloc
+
+    rng = random.Random(0)
+    statuses = ["FINISHED", "REJECTED", "PENDING", "SUBMITTED"]
+    user_ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(1000)]
+    brand_ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(1000)]
+
+    # Fresh objects per field, as process_receipts_data creates them (a UUID string and a timestamp per value)
+    def receipt_rows():
+        for _ in range(rows):
+            receipt_id = str(uuid.UUID(int=rng.getrandbits(128)))
+            scanned_ms = rng.randrange(1_600_000_000_000, 1_620_000_000_000)
+            receipt = (receipt_id, str(uuid.UUID(rng.choice(user_ids))), from_ms(scanned_ms), from_ms(scanned_ms),
+                       from_ms(scanned_ms + 1000), rng.choice(statuses), rng.random() * 100, rng.randrange(10),
+                       rng.randrange(1000), rng.randrange(100), from_ms(scanned_ms + 2000))
+            items = [(str(uuid.UUID(int=rng.getrandbits(128))), receipt_id, str(uuid.UUID(rng.choice(brand_ids))),
+                      str(rng.randrange(10 ** 11)), 1 + rng.randrange(3), rng.random() * 10, from_ms(scanned_ms))
+                     for _ in range(items_per_receipt)]
+            yield receipt, items
+
+    results = {}
+    for label in ("tuples", "batches"):
+        rng.seed(1)
+        tracemalloc.start()
+        if label == "tuples":
+            receipts, items = [], []
+        else:
+            receipts, items = ReceiptBatch(), ReceiptItemBatch()
+        for receipt, receipt_items in receipt_rows():
+            if label == "tuples":
+                receipts.append(receipt)
+                items.extend(receipt_items)
+            else:
+                receipts.append(*receipt)
+                for item in receipt_items:
+                    items.append(*item)
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[label] = current
+        del receipts, items
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure transformed receipt memory: tuple lists vs. column batches.")
+    parser.add_argument("--rows", type=int, default=1000000, help="Receipts to build (each with --items items)")
+    parser.add_argument("--items", type=int, default=2)
+    args = parser.parse_args()
+    results = measure_receipt_memory(args.rows, args.items)
+    per_million = 1000000 / args.rows
+    for label, size in results.items():
+        print(f"📊 {label}: {size / 2 ** 20 * per_million:,.0f} MB per million receipts "
+              f"({size / (args.rows * (1 + args.items)):.0f} bytes per row)")
+    print(f"✅ Batches use {results['batches'] / results['tuples']:.0%} of the tuple lists' memory.")
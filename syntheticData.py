@@ -0,0 +1,158 @@
+import argparse
+import json
+import os
+import random
+import uuid
+
+# Shape of the Mongo exports the loaders read
+STATES = ["AL", "AK", "AZ", "AR", "CA", "WI", "NY", "TX"]
+ROLES = ["consumer", "consumer", "consumer", "fetch-staff"]
+SIGN_UP_SOURCES = ["Email", "Google", None]
+CATEGORIES = [("Baking", "BAKING"), ("Beverages", "BEVERAGES"), ("Snacks", "SNACKS"), ("Health & Wellness", "HEALTHY_AND_WELLNESS"), (None, None)]
+RECEIPT_STATUSES = ["FINISHED", "REJECTED", "PENDING", "SUBMITTED", "FLAGGED"]
+
+# Dates fall between 2020-01-01 and 2021-03-01 (epoch milliseconds)
+START_MS = 1577836800000
+END_MS = 1614556800000
+
+# Generation knobs, overridable from the command line
+DEFAULT_CONFIG = {
+    "users": 10000,
+    "brands": 2000,
+    "receipts": 100000,
+    "items_mean": 4.0,  # Items per receipt follow a geometric distribution with this mean
+    "items_max": 100,
+    "object_id_share": 1.0,  # Share of well-formed ids written as 24-hex Mongo ObjectIds (the rest are UUIDs)
+    "malformed_id_share": 0.001,  # Share of ids that are neither (truncated ObjectIds)
+    "missing_date_share": 0.1,  # Share of optional dates left out
+    "seed": 42,
+}
+
+# Function to make an id: like the real feed, an ObjectId (mapped to a UUIDv5 by the loaders), a UUID or
+# now and then a malformed id
+def make_id(rng, config):
+    draw = rng.random()
+    if draw < config["malformed_id_share"]:
+        return "%023x" % rng.getrandbits(92)
+    if draw < config["malformed_id_share"] + (1 - config["malformed_id_share"]) * config["object_id_share"]:
+        return "%024x" % rng.getrandbits(96)
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+# Function to make a Mongo $date value (None when the date is "missing")
+def make_date(rng, config, required=False):
+    if not required and rng.random() < config["missing_date_share"]:
+        return None
+    return {"$date": rng.randint(START_MS, END_MS)}
+
+def _without_none(record):
+    return {key: value for key, value in record.items() if value is not None}
+
+def generate_users(rng, config):
+    for _ in range(config["users"]):
+        yield _without_none({
+            "_id": {"$oid": make_id(rng, config)},
+            "active": rng.random() < 0.95,
+            "createdDate": make_date(rng, config, required=True),
+            "lastLogin": make_date(rng, config),
+            "role": rng.choice(ROLES),
+            "signUpSource": rng.choice(SIGN_UP_SOURCES),
+            "state": rng.choice(STATES) if rng.random() > 0.05 else None,
+        })
+
+def generate_brands(rng, config):
+    for index in range(config["brands"]):
+        category, category_code = rng.choice(CATEGORIES)
+        yield _without_none({
+            "_id": {"$oid": make_id(rng, config)},
+            "barcode": str(511111000000 + index),
+            "brandCode": f"BRAND{index}" if rng.random() > 0.2 else None,
+            "category": category,
+            "categoryCode": category_code,
+            "cpg": {"$id": {"$oid": "%024x" % rng.getrandbits(96)}, "$ref": "Cogs"},
+            "name": f"Brand {index}",
+            "topBrand": rng.random() < 0.1 if rng.random() > 0.5 else None,
+        })
+
+# Function to draw an item count from a geometric distribution with the configured mean
+def item_count(rng, config):
+    success = 1.0 / (config["items_mean"] + 1.0)
+    count = 0
+    while rng.random() > success and count < config["items_max"]:
+        count += 1
+    return count
+
+def generate_receipts(rng, config, user_ids, brand_ids):
+    for _ in range(config["receipts"]):
+        items = []
+        for _ in range(item_count(rng, config)):
+            price = round(rng.uniform(0.5, 30.0), 2)
+            items.append(_without_none({
+                "barcode": str(rng.randint(10 ** 11, 10 ** 12 - 1)) if rng.random() > 0.3 else None,
+                "finalPrice": f"{price:.2f}",
+                "itemPrice": f"{price:.2f}",
+                "partnerItemId": rng.choice(brand_ids),
+                "quantityPurchased": rng.randint(1, 5) if rng.random() > 0.1 else None,
+            }))
+        total = sum(float(item["finalPrice"]) for item in items)
+        scanned = make_date(rng, config, required=True)
+        yield _without_none({
+            "_id": {"$oid": make_id(rng, config)},
+            "bonusPointsEarned": rng.choice([5, 25, 250, 500]) if rng.random() > 0.5 else None,
+            "createDate": scanned,
+            "dateScanned": scanned,
+            "finishedDate": make_date(rng, config),
+            "modifyDate": scanned,
+            "pointsAwardedDate": make_date(rng, config),
+            "pointsEarned": f"{rng.randint(0, 1000)}.0" if rng.random() > 0.4 else None,
+            "purchaseDate": make_date(rng, config),
+            "purchasedItemCount": len(items) if rng.random() > 0.4 else None,
+            "rewardsReceiptItemList": items or None,
+            "rewardsReceiptStatus": rng.choice(RECEIPT_STATUSES),
+            "totalSpent": f"{total:.2f}",
+            "userId": rng.choice(user_ids),
+        })
+
+def _collect_ids(records, ids):
+    for record in records:
+        ids.append(record["_id"]["$oid"])
+        yield record
+
+def _write_ndjson(path, records):
+    count = 0
+    with open(path, 'w') as file:
+        for record in records:
+            file.write(json.dumps(record))
+            file.write("\n")
+            count += 1
+    return count
+
+# Write users.json, brands.json and receipts.json (NDJSON) into out_dir; returns their paths
+def generate_dataset(out_dir, config=None):
+    config = {**DEFAULT_CONFIG, **(config or {})}
+    rng = random.Random(config["seed"])
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Only the ids are kept in memory; receipts reference them as userId / partnerItemId
+    user_ids = []
+    brand_ids = []
+    paths = {name: os.path.join(out_dir, f"{name}.json") for name in ("users", "brands", "receipts")}
+    _write_ndjson(paths["users"], _collect_ids(generate_users(rng, config), user_ids))
+    _write_ndjson(paths["brands"], _collect_ids(generate_brands(rng, config), brand_ids))
+    receipt_count = _write_ndjson(paths["receipts"], generate_receipts(rng, config, user_ids, brand_ids))
+
+    print(f"✅ Generated {len(user_ids)} users, {len(brand_ids)} brands and {receipt_count} receipts in {out_dir}.")
+    return paths
+
+def add_config_arguments(parser):
+    for key, default in DEFAULT_CONFIG.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(default), default=default)
+
+def config_from_args(args):
+    return {key: getattr(args, key) for key in DEFAULT_CONFIG}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic users/brands/receipts NDJSON files.")
+    parser.add_argument("out_dir", nargs="?", default="bench_data")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    generate_dataset(args.out_dir, config_from_args(args))
@@ -0,0 +1,25 @@
+import io
+
+import pytest
+
+from jsonDecoder import DecodeError, _iter_json_array_chunked
+
+# Small chunks split tokens and delimiters across reads; large ones hold the whole document
+CHUNK_SIZES = [1, 2, 1024]
+
+def walk(text, chunk_size):
+    return list(_iter_json_array_chunked(io.StringIO(text), chunk_size))
+
+# The chunked walker yields the same elements as json.loads for a valid array
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_valid_array(chunk_size):
+    assert walk(' [1, {"a": [2, "]"]}, 4.5 ,-7e2, true, null, "x"] \n', chunk_size) == \
+        [1, {"a": [2, "]"]}, 4.5, -700.0, True, None, "x"]
+    assert walk("[]", chunk_size) == []
+
+# Malformed arrays raise the ValueError the strict decoder raises, whatever the chunk boundaries
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+@pytest.mark.parametrize("text", ["[1,]", "[1]x", "[1] [2]", "[1 2]", "[,1]", "[1,,2]", "[1", "{}", ""])
+def test_malformed_array(text, chunk_size):
+    with pytest.raises(DecodeError):
+        walk(text, chunk_size)
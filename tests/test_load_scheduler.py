@@ -0,0 +1,34 @@
+import numpy as np
+
+from addingReceipts import DEFAULT_BRAND_ID, DEFAULT_USER_ID, process_receipts_data
+from dimensionCache import DimensionKeyCache, uuid_to_bytes
+from loadScheduler import DeferredKeys, resolve_references
+
+LOADED_USER = "5ff1e194-b6a2-4b4c-a1f3-c4b0f1a2d3e4"
+LOADED_BRAND = "9a1b2c3d-4e5f-4a6b-8c7d-0e1f2a3b4c5d"
+MISSING_ID = "11111111-2222-4333-8444-555555555555"
+
+RECEIPTS = [
+    {"_id": {"$oid": "5ff1e1eacfcf6c399c274ae6"}, "userId": LOADED_USER, "dateScanned": {"$date": 1609687530000},
+     "rewardsReceiptItemList": [{"barcode": "4011", "partnerItemId": LOADED_BRAND},
+                                {"barcode": "4012", "partnerItemId": MISSING_ID}]},
+    {"_id": {"$oid": "5ff1e1eacfcf6c399c274ae7"}, "userId": MISSING_ID, "dateScanned": {"$date": 1609687530000},
+     "rewardsReceiptItemList": [{"barcode": "4013"}]},
+    {"_id": {"$oid": "5ff1e1eacfcf6c399c274ae8"}, "dateScanned": {"$date": 1609687530000}},
+]
+
+def key_cache(*ids):
+    cache = DimensionKeyCache("dim_test", "test_id")
+    cache.keys = np.unique(np.array([uuid_to_bytes(value) for value in ids], dtype="S16"))
+    return cache
+
+# Receipts transformed while the dimensions load, then resolved at the gate, match a sequential load
+def test_resolved_references_match_a_sequential_load():
+    expected_receipts, expected_items = process_receipts_data(RECEIPTS, {LOADED_USER}, {LOADED_BRAND})
+    receipts, items = process_receipts_data(RECEIPTS, DeferredKeys(), DeferredKeys())
+    _, receipts, items = resolve_references((0, receipts, items), key_cache(LOADED_USER), key_cache(LOADED_BRAND))
+
+    assert list(receipts) == list(expected_receipts)
+    assert list(items) == list(expected_items)
+    assert receipts.column("receipt_user_id") == [LOADED_USER, DEFAULT_USER_ID, DEFAULT_USER_ID]
+    assert items.column("item_brand_id") == [LOADED_BRAND, DEFAULT_BRAND_ID, DEFAULT_BRAND_ID]
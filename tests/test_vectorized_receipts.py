@@ -0,0 +1,53 @@
+import pytest
+
+pytest.importorskip("pandas")
+
+from addingReceipts import DEFAULT_USER_ID, process_receipts_data
+from vectorizedReceipts import transform_receipts_frame
+
+USER_ID = "5ff1e194-b6a2-4b4c-a1f3-c4b0f1a2d3e4"
+BRAND_ID = "9a1b2c3d-4e5f-4a6b-8c7d-0e1f2a3b4c5d"
+
+# Receipts exercising every conversion the two transforms must agree on
+MESSY_RECEIPTS = [
+    {"_id": {"$oid": "5ff1e1eacfcf6c399c274ae6"}, "userId": USER_ID, "rewardsReceiptStatus": "FINISHED",
+     "dateScanned": {"$date": 1609687530000}, "purchaseDate": {"$date": 1609687530554.9},
+     "totalSpent": "26.00", "purchasedItemCount": "5", "pointsEarned": 750.0, "bonusPointsEarned": 500,
+     "rewardsReceiptItemList": [
+         {"barcode": "4011", "partnerItemId": BRAND_ID, "quantityPurchased": 2, "finalPrice": "1.25"},
+         {"barcode": "4012", "partnerItemId": "unknown", "quantityPurchased": "3.7", "finalPrice": None},
+         {"barcode": "4013", "quantityPurchased": "two", "finalPrice": "1"},  # Skipped item
+         None,  # Skipped item; the next item keeps its position
+         {"partnerItemId": BRAND_ID, "quantityPurchased": float("inf"), "finalPrice": 1},  # Skipped item
+         {"barcode": "4014", "quantityPurchased": 0, "finalPrice": float("inf")},
+     ]},
+    {"_id": {"$oid": "not-an-id"}, "userId": "someone-else", "rewardsReceiptStatus": None,
+     "dateScanned": {"$date": "2021-01-03"}, "finishedDate": "1609687530000", "pointsAwardedDate": {"$date": True},
+     "totalSpent": float("inf"), "rewardsReceiptItemList": []},
+    {"userId": {"$oid": "5ff1e194b6a2fe4b4c0f1a2d"}, "dateScanned": {"$date": 1609687530000},
+     "purchasedItemCount": None, "bonusPointsEarned": "", "rewardsReceiptItemList": "not a list"},
+    {"_id": {"$oid": "5ff1e1eacfcf6c399c274ae7"}, "pointsEarned": "abc"},  # Skipped receipt
+    {"_id": {"$oid": "5ff1e1eacfcf6c399c274ae8"}, "bonusPointsEarned": float("inf"),  # Skipped receipt
+     "rewardsReceiptItemList": [{"barcode": "4015"}]},
+    {"_id": {"$oid": "5ff1e1eacfcf6c399c274ae9"}, "purchaseDate": {"$date": float("nan")}},  # Skipped receipt
+    {"_id": {"$oid": "5ff1e1eacfcf6c399c274aea"}, "purchaseDate": {"$date": [1, 2]},  # Nested lists
+     "rewardsReceiptItemList": [[1, 2], [3, 4], {"barcode": [5, 6], "finalPrice": "0.5"}]},
+    {"_id": {"$oid": "5ff1e1eacfcf6c399c274aeb"}, "totalSpent": [1, 2]},  # Skipped receipt
+    "not a receipt",
+]
+
+def test_vectorized_transform_matches_row_wise():
+    valid_user_ids, valid_brand_ids = {USER_ID}, {BRAND_ID}
+    expected_receipts, expected_items = process_receipts_data(MESSY_RECEIPTS, valid_user_ids, valid_brand_ids)
+    receipts, items = transform_receipts_frame(MESSY_RECEIPTS, valid_user_ids, valid_brand_ids)
+
+    assert list(receipts) == list(expected_receipts)
+    assert list(items) == list(expected_items)
+    assert len(receipts) == 4 and len(items) == 4
+
+def test_null_status_and_unparsed_dates_stay_null():
+    receipts, _ = transform_receipts_frame(MESSY_RECEIPTS[1:3], {USER_ID}, {BRAND_ID})
+    (first, second) = list(receipts)
+    assert first[1] == second[1] == DEFAULT_USER_ID
+    assert first[5] is None and second[5] == "UNKNOWN"  # Explicit null vs missing status
+    assert first[3] is None  # A string $date is not parsed
@@ -0,0 +1,284 @@
+import hashlib
+import math
+
+from idNormalizer import BRAND_IDS, USER_IDS, format_uuid
+
+# Function to read a nested field, e.g. get_path(record, "_id", "$oid") (None if any level is missing)
+def get_path(record, *keys):
+    value = record
+    for key in keys:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+# Function to check a raw value has the expected type (None counts as fine).
+# Decimal strings such as "26.00" pass as float, but counts stored as strings do not.
+def has_type(value, expected_type):
+    if value is None:
+        return True
+    if expected_type is float and isinstance(value, str):
+        try:
+            float(value)
+            return True
+        except ValueError:
+            return False
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+    return expected_type is float or float(value).is_integer()
+
+# Function to format a value as a UUID (None when it is not one)
+def validate_uuid(value):
+    return format_uuid(value)
+
+# Sizing of the duplicate filter: distinct keys it is built for and the false-positive rate at that count
+DEFAULT_EXPECTED_KEYS = 10_000_000
+DEFAULT_FALSE_POSITIVE_RATE = 1e-4
+# Keys counted exactly (in a set) before switching to the filter
+EXACT_KEY_LIMIT = 100_000
+
+# Duplicate counter with bounded memory: exact (a set of keys) up to `exact_limit` keys, then a Bloom filter
+# sized for `expected_count` keys at `false_positive_rate` (m = -n ln p / ln²2 bits, k = m/n ln 2 hashes;
+# about 24 MB for the defaults). Once the filter is in use a new key can be mistaken for a duplicate, so the
+# count may be too high by up to false_positive_bound().
+class DuplicateCounter:
+    def __init__(self, expected_count=DEFAULT_EXPECTED_KEYS, false_positive_rate=DEFAULT_FALSE_POSITIVE_RATE,
+                 exact_limit=EXACT_KEY_LIMIT):
+        expected_count = max(1, expected_count)
+        self.size_bits = max(64, math.ceil(-expected_count * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size_bits / expected_count * math.log(2)))
+        self.exact_limit = exact_limit
+        self.exact_keys = set()
+        self.bits = None  # Allocated once the exact set is full
+        self.filtered_keys = 0  # Keys set in the filter (each new one makes the next lookup less reliable)
+        self.filtered_lookups = 0
+        self.expected_false_positives = 0.0  # Sum of the false-positive rate at each lookup of a new key
+        self.duplicates = 0
+
+    def add(self, key):
+        key = str(key)
+        if self.bits is None:
+            if key in self.exact_keys:
+                self.duplicates += 1
+                return
+            self.exact_keys.add(key)
+            if len(self.exact_keys) > self.exact_limit:
+                self.bits = bytearray((self.size_bits + 7) // 8)
+                for exact_key in self.exact_keys:
+                    self._set(exact_key)
+                self.exact_keys = set()
+            return
+
+        self.filtered_lookups += 1
+        self.expected_false_positives += self.false_positive_rate()
+        if self._set(key):
+            self.duplicates += 1  # Possibly a false positive
+
+    # Set the key's bits (double hashing: bit i = h1 + i * h2); True when they were all set already
+    def _set(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, step = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        seen = True
+        for i in range(self.hash_count):
+            bit = (first + i * step) % self.size_bits
+            byte_index, mask = bit >> 3, 1 << (bit & 7)
+            if not self.bits[byte_index] & mask:
+                seen = False
+                self.bits[byte_index] |= mask
+        if not seen:
+            self.filtered_keys += 1
+        return seen
+
+    # Chance that a new key looks like a duplicate at the filter's current fill (0 while counting exactly)
+    def false_positive_rate(self):
+        if self.bits is None:
+            return 0.0
+        return (1 - math.exp(-self.hash_count * self.filtered_keys / self.size_bits)) ** self.hash_count
+
+    # Expected number of duplicates counted that were new keys (0 while counting exactly)
+    def false_positive_bound(self):
+        return self.expected_false_positives
+
+# Source lines kept per issue when records are observed with their line number
+EXEMPLAR_LINES = 5
+
+# Runs a list of (group, issue, check) rules over parsed records, keeping only a counter per rule
+# (and the first few source lines of each issue, when known)
+class RecordValidator:
+    def __init__(self, title, rules, duplicate_key=None, expected_keys=DEFAULT_EXPECTED_KEYS):
+        self.title = title
+        self.rules = rules
+        self.duplicate_key = duplicate_key
+        self.duplicates = DuplicateCounter(expected_keys) if duplicate_key else None
+        self.counts = {(group, issue): 0 for group, issue, _ in rules}
+        self.lines = {}  # (group, issue) -> first source lines that failed it
+        self.records = 0
+
+    def observe(self, record, line=None):
+        self.records += 1
+        for group, issue, check in self.rules:
+            try:
+                failed = check(record)
+            except Exception:
+                failed = True  # A rule that cannot even read the record counts the record as bad
+            if failed:
+                self.counts[(group, issue)] += 1
+                if line is not None:
+                    lines = self.lines.setdefault((group, issue), [])
+                    if len(lines) < EXEMPLAR_LINES and line not in lines:
+                        lines.append(line)
+        if self.duplicates is not None:
+            key = self.duplicate_key(record)
+            if key is not None:
+                self.duplicates.add(key)
+
+    def observe_many(self, records):
+        for record in records:
+            self.observe(record)
+
+    # Bitmask of the rules a record fails (bit i = self.rules[i]), for storing alongside extracted data
+    def failure_mask(self, record):
+        mask = 0
+        for index, (_, _, check) in enumerate(self.rules):
+            try:
+                failed = check(record)
+            except Exception:
+                failed = True
+            if failed:
+                mask |= 1 << index
+        return mask
+
+    # Add counts computed elsewhere (e.g. from stored failure masks); counts maps (group, issue) -> failures
+    def add_counts(self, record_count, counts):
+        self.records += record_count
+        for key, count in counts.items():
+            self.counts[key] += count
+
+    # Issues grouped the way validateReceipts.py reports them
+    def issues(self):
+        issues = {}
+        for (group, issue), count in self.counts.items():
+            issues.setdefault(group, {})[issue] = count
+        if self.duplicates is not None:
+            issues["duplicate_records"] = self.duplicates.duplicates
+            if self.duplicates.bits is not None:
+                issues["duplicate_records_false_positives"] = round(self.duplicates.false_positive_bound(), 1)
+        return issues
+
+    def report(self):
+        if all(group is None for group, _, _ in self.rules):
+            # Same layout as validating-users.py / validating-Brands.py
+            print(f"{self.title}:")
+            for key, count in self.counts.items():
+                if count:
+                    print(f"{key[1]}: {count} occurrences" + self._lines_note(key))
+            if self.duplicates is not None and self.duplicates.duplicates:
+                print(f"duplicate_records: {self.duplicates.duplicates} occurrences" + self._duplicates_note())
+        else:
+            print(f"{self.title}:", self.issues())
+            for (group, issue), lines in self.lines.items():
+                print(f"  {group}.{issue}: first at lines {', '.join(map(str, lines))}")
+
+    def _duplicates_note(self):
+        if self.duplicates.bits is None:
+            return ""  # Counted exactly
+        return f" (about {self.duplicates.false_positive_bound():.1f} of them may be false positives)"
+
+    def _lines_note(self, key):
+        lines = self.lines.get(key)
+        return f" (first at lines {', '.join(map(str, lines))})" if lines else ""
+
+# Rules for users.json records
+VALID_STATES = ["AL", "AK", "AZ", "AR", "CA", "WI", None]  # Example state validation
+
+def user_validator():
+    return RecordValidator("Users Data Quality Issues", [
+        (None, "missing_user_id", lambda r: not get_path(r, "_id", "$oid")),
+        (None, "missing_created_date", lambda r: get_path(r, "createdDate", "$date") is None),
+        (None, "missing_last_login", lambda r: get_path(r, "lastLogin", "$date") is None),
+        (None, "invalid_state", lambda r: r.get("state") not in VALID_STATES),
+        (None, "invalid_role", lambda r: bool(r.get("role")) and r["role"].lower() != "consumer"),
+    ], duplicate_key=lambda r: get_path(r, "_id", "$oid"))
+
+# Rules for brands.json records
+def brand_validator():
+    return RecordValidator("Brands Data Quality Issues", [
+        (None, "missing_brand_id", lambda r: not get_path(r, "_id", "$oid")),
+        (None, "missing_brand_name", lambda r: not r.get("name")),
+        (None, "missing_category", lambda r: not r.get("category")),
+        (None, "missing_category_code", lambda r: not r.get("categoryCode")),
+        (None, "missing_barcode", lambda r: not r.get("barcode")),
+        (None, "missing_brand_code", lambda r: not r.get("brandCode")),
+        (None, "missing_cpg_id", lambda r: not get_path(r, "cpg", "$id", "$oid")),
+    ], duplicate_key=lambda r: get_path(r, "_id", "$oid"))
+
+# Report column -> path of the raw field it comes from
+RECEIPT_FIELDS = {
+    "receipt_id": ("_id", "$oid"),
+    "user_id": ("userId",),
+    "purchase_date": ("purchaseDate", "$date"),
+    "date_scanned": ("dateScanned", "$date"),
+    "finished_date": ("finishedDate", "$date"),
+    "rewards_receipt_status": ("rewardsReceiptStatus",),
+    "total_spent": ("totalSpent",),
+    "purchased_item_count": ("purchasedItemCount",),
+    "points_earned": ("pointsEarned",),
+    "bonus_points_earned": ("bonusPointsEarned",),
+    "points_awarded_date": ("pointsAwardedDate", "$date"),
+}
+RECEIPT_TYPES = {
+    "total_spent": float,
+    "purchased_item_count": int,
+    "points_earned": int,
+    "bonus_points_earned": int,
+}
+RECEIPT_ITEM_FIELDS = {
+    "brand_id": ("partnerItemId",),
+    "barcode": ("barcode",),
+    "quantity": ("quantityPurchased",),
+    "price": ("itemPrice",),
+}
+RECEIPT_ITEM_TYPES = {
+    "quantity": int,
+    "price": float,
+}
+
+def _field_rules(fields, types):
+    rules = [("missing_values", column, lambda r, path=path: get_path(r, *path) is None)
+             for column, path in fields.items()]
+    rules += [("incorrect_types", column, lambda r, path=fields[column], t=expected: not has_type(get_path(r, *path), t))
+              for column, expected in types.items()]
+    return rules
+
+# Validates receipts and their items in one pass over the parsed receipt records
+class ReceiptValidation:
+    def __init__(self, valid_user_ids=None, valid_brand_ids=None):
+        receipt_rules = _field_rules(RECEIPT_FIELDS, RECEIPT_TYPES)
+        item_rules = _field_rules(RECEIPT_ITEM_FIELDS, RECEIPT_ITEM_TYPES)
+        if valid_user_ids is not None:
+            receipt_rules.append(("unknown_foreign_keys", "user_id",
+                                  lambda r: USER_IDS(r.get("userId")) not in valid_user_ids))
+        if valid_brand_ids is not None:
+            item_rules.append(("unknown_foreign_keys", "brand_id",
+                               lambda item: BRAND_IDS(item.get("partnerItemId")) not in valid_brand_ids))
+
+        self.receipts = RecordValidator("Receipts Data Quality Issues", receipt_rules,
+                                        duplicate_key=lambda r: get_path(r, "_id", "$oid"))
+        self.receipt_items = RecordValidator("Receipt Items Data Quality Issues", item_rules)
+
+    # `line`: the receipt's source line, also reported for its items' issues
+    def observe(self, record, line=None):
+        self.receipts.observe(record, line)
+        items = record.get("rewardsReceiptItemList")
+        if isinstance(items, list):
+            for item in items:
+                if isinstance(item, dict):
+                    self.receipt_items.observe(item, line)
+
+    def observe_many(self, records):
+        for record in records:
+            self.observe(record)
+
+    def report(self):
+        self.receipts.report()
+        self.receipt_items.report()
@@ -0,0 +1,222 @@
+import hashlib
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from addingReceipts import DEFAULT_BRAND_ID, DEFAULT_USER_ID
+from idNormalizer import BRAND_IDS, USER_IDS
+from loadDiagnostics import DIAGNOSTICS
+from receiptIds import RECEIPT_ITEM_NAMESPACE, RECEIPT_NAMESPACE, stable_receipt_id
+from rowBatches import NULL_MS, ReceiptBatch, ReceiptItemBatch
+
+# What uuid.UUID() accepts once braces, "urn:uuid:" and hyphens are removed
+_UUID_HEX_PATTERN = r"[0-9a-fA-F]{32}"
+_OBJECT_ID_PATTERN = r"[0-9a-fA-F]{24}"
+
+# Range of the int64 columns; values outside it make the row-wise append raise
+_INT64_MIN = -2.0 ** 63
+_INT64_END = 2.0 ** 63
+
+# Function to validate and format a whole column of UUIDs (None where invalid, like validate_uuid)
+def normalize_uuid_series(values):
+    is_text = values.map(lambda value: isinstance(value, str)).astype(bool)
+    text = values.where(is_text).astype("string")
+    cleaned = (text.str.replace("urn:", "", regex=False)
+                   .str.replace("uuid:", "", regex=False)
+                   .str.strip("{}")
+                   .str.replace("-", "", regex=False)
+                   .str.lower())
+    valid = cleaned.str.fullmatch(_UUID_HEX_PATTERN).fillna(False).astype(bool)
+    formatted = (cleaned.str[0:8] + "-" + cleaned.str[8:12] + "-" + cleaned.str[12:16] + "-"
+                 + cleaned.str[16:20] + "-" + cleaned.str[20:32])
+    return formatted.astype(object).where(valid, None)
+
+# Function to compute uuid.uuid5(namespace, name) for a whole column of names, as a (rows, 16) uint8 array:
+# one sha1 per name, the version and variant bits set on the whole array
+def uuid5_array(namespace, names):
+    prefix = namespace.bytes
+    digests = b"".join([hashlib.sha1(prefix + name.encode()).digest() for name in names])
+    raw = np.frombuffer(digests, dtype=np.uint8).reshape(-1, 20)[:, :16].copy()
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x50
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    return raw
+
+# Function to format a (rows, 16) uint8 array of UUIDs as canonical strings
+def uuid_strings(raw):
+    if not len(raw):
+        return []
+    digits = np.frombuffer(raw.tobytes().hex().encode(), dtype="S1").reshape(-1, 32)
+    dashed = np.insert(digits, [8, 12, 16, 20], b"-", axis=1)
+    return np.ascontiguousarray(dashed).view("S36").ravel().astype(str).tolist()
+
+# Function to make a 1-D object array (np.array would turn a list of lists into a 2-D one)
+def _objects(values):
+    return pd.Series(values, dtype=object).to_numpy()
+
+# Function to convert Mongo {"$date": ms} values like date_ms: (int64 ms, NULL_MS where None;
+# mask of the values the row-wise path fails on: inf / nan, or beyond int64)
+def to_ms_array(values):
+    dates = _objects([value.get("$date") if isinstance(value, dict) else None for value in values])
+    kinds = pd.Series(dates, dtype=object).map(type).to_numpy()
+    is_int, is_float = kinds == int, kinds == float  # bool is neither, as in date_ms
+    milliseconds = np.full(len(dates), NULL_MS, dtype=np.int64)
+    invalid = np.zeros(len(dates), dtype=bool)
+
+    floats = dates[is_float].astype(np.float64)
+    fits = (floats >= _INT64_MIN) & (floats < _INT64_END)  # NaN fails both
+    positions = np.flatnonzero(is_float)
+    milliseconds[positions[fits]] = floats[fits].astype(np.int64)  # Truncates toward zero, like int()
+    invalid[positions[~fits]] = True
+
+    positions = np.flatnonzero(is_int)
+    try:
+        milliseconds[positions] = dates[positions].astype(np.int64)
+    except OverflowError:
+        for position in positions:
+            if -2 ** 63 <= dates[position] < 2 ** 63:
+                milliseconds[position] = dates[position]
+            else:
+                invalid[position] = True
+    return milliseconds, invalid
+
+# Function to mimic `float(value or default)` (or `int(float(...))`) on a column: falsy values take the default,
+# the rest go through one object -> float64 cast (float() per value, so strings round exactly as float() does).
+# Returns (numbers, mask of the values that would have raised); those hold the default, and the caller drops them.
+def to_number_array(values, default, integer=False):
+    raw = _objects(values)
+    taken = np.where(raw.astype(bool), raw, default)  # `value or default`
+    invalid = np.zeros(len(raw), dtype=bool)
+    try:
+        numbers = taken.astype(np.float64)
+    except (TypeError, ValueError, OverflowError):  # Rare: find the culprits one by one
+        numbers = np.empty(len(raw), dtype=np.float64)
+        for position, value in enumerate(taken):
+            try:
+                numbers[position] = float(value)
+            except (TypeError, ValueError, OverflowError):
+                numbers[position] = default
+                invalid[position] = True
+    if integer:
+        fits = (numbers >= _INT64_MIN) & (numbers < _INT64_END)  # int() of inf / nan raises
+        invalid |= ~fits
+        numbers = np.where(fits, numbers, default).astype(np.int64)
+    return numbers, invalid
+
+# Function to check a column of UUID strings against a set of valid keys (or a DimensionKeyCache)
+def is_known_key(ids, valid_ids):
+    if hasattr(valid_ids, "contains_many"):
+        return pd.Series(valid_ids.contains_many(ids.tolist()), index=ids.index)
+    return ids.notna() & ids.isin(valid_ids)
+
+# Function to pull one field out of every record as a column (None where absent). The raw values are taken,
+# not json_normalize's flattening, so nested or mistyped values convert (or fail) exactly as row by row.
+def _field(records, name, default=None):
+    return pd.Series([record.get(name, default) for record in records], dtype=object)
+
+# Function to pick the diagnostics exemplars: the first values where mask is set
+def _first(values, mask):
+    return list(np.asarray(values, dtype=object)[np.asarray(mask, dtype=bool)][:DIAGNOSTICS.exemplar_limit])
+
+# Column-wise equivalent of process_receipts_data: same rows (in the same batch types), same defaults.
+# Conversions, item ids and the batch encoding run a column at a time; only the memoized id lookups and the
+# field extraction stay per value.
+def transform_receipts_frame(records, valid_user_ids, valid_brand_ids):
+    records = [record for record in records if isinstance(record, dict)]
+    if not records:
+        return ReceiptBatch(), ReceiptItemBatch()
+
+    # 🔹 Ensure `receipt_id` is never NULL: UUIDs formatted, ObjectIds mapped, anything else derived
+    source_ids = pd.Series([record["_id"].get("$oid") if isinstance(record.get("_id"), dict) else None
+                            for record in records], dtype=object)
+    receipt_ids = normalize_uuid_series(source_ids)
+    object_ids = (receipt_ids.isna() & source_ids.map(lambda value: isinstance(value, str)).astype(bool)
+                  & source_ids.astype("string").str.fullmatch(_OBJECT_ID_PATTERN).fillna(False).astype(bool))
+    if object_ids.any():
+        receipt_ids[object_ids] = uuid_strings(uuid5_array(RECEIPT_NAMESPACE,
+                                                           ("oid:" + source_ids[object_ids]).tolist()))
+    generated = receipt_ids.isna()
+    if generated.any():
+        receipt_ids[generated] = [stable_receipt_id(records[index]) for index in np.flatnonzero(generated)]
+        DIAGNOSTICS.defaulted("receipts", "invalid_receipt_id", *_first(receipt_ids, generated),
+                              count=int(generated.sum()))
+
+    # References repeat across receipts, so the memoized scalar normalizers beat the string column ops here
+    user_ids = _field(records, "userId").map(USER_IDS).astype(object)
+    unknown_users = ~is_known_key(user_ids, valid_user_ids)
+    if unknown_users.any():
+        DIAGNOSTICS.defaulted("receipts", "unknown_user", *_first(receipt_ids, unknown_users),
+                              count=int(unknown_users.sum()))
+    user_ids = user_ids.where(~unknown_users, DEFAULT_USER_ID)
+
+    purchase_timestamps, bad_purchase = to_ms_array(_field(records, "purchaseDate"))
+    scanned_dates, bad_scanned = to_ms_array(_field(records, "dateScanned"))
+    finished_dates, bad_finished = to_ms_array(_field(records, "finishedDate"))
+    awarded_timestamps, bad_awarded = to_ms_array(_field(records, "pointsAwardedDate"))
+    total_spent, bad_total = to_number_array(_field(records, "totalSpent"), 0.0)
+    item_count, bad_count = to_number_array(_field(records, "purchasedItemCount"), 0, integer=True)
+    points, bad_points = to_number_array(_field(records, "pointsEarned"), 0, integer=True)
+    bonus_points, bad_bonus = to_number_array(_field(records, "bonusPointsEarned"), 0, integer=True)
+    status = _field(records, "rewardsReceiptStatus", "UNKNOWN")  # An explicit null stays NULL
+
+    # Receipts the row-wise path would have skipped (float()/int() raising) are dropped here too
+    bad_receipts = (bad_purchase | bad_scanned | bad_finished | bad_awarded
+                    | bad_total | bad_count | bad_points | bad_bonus)
+    if bad_receipts.any():
+        DIAGNOSTICS.skipped("receipts", "transform_error", *_first(receipt_ids, bad_receipts),
+                            count=int(bad_receipts.sum()))  # Non-numeric values
+    keep = ~bad_receipts
+    receipt_ids = receipt_ids.to_numpy()[keep]
+
+    receipts = ReceiptBatch.from_columns([
+        receipt_ids, user_ids.to_numpy()[keep], purchase_timestamps[keep], scanned_dates[keep],
+        finished_dates[keep], status.to_numpy()[keep], total_spent[keep], item_count[keep], points[keep],
+        bonus_points[keep], awarded_timestamps[keep],
+    ])
+    receipt_items = transform_receipt_items_frame(
+        receipt_ids, _field(records, "rewardsReceiptItemList").to_numpy()[keep], valid_brand_ids,
+        scanned_dates[keep]
+    )
+    return receipts, receipt_items
+
+# Flatten every rewardsReceiptItemList (keeping each item's receipt and position) and transform the items
+# column-wise
+def transform_receipt_items_frame(receipt_ids, item_lists, valid_brand_ids, scanned_dates):
+    lengths = np.array([len(items) if isinstance(items, list) else 0 for items in item_lists], dtype=np.int64)
+    receipts = np.repeat(np.arange(len(item_lists)), lengths)  # Receipt of every item
+    positions = np.arange(len(receipts)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    items = _objects(list(chain.from_iterable(items for items in item_lists if isinstance(items, list))))
+    is_item = np.array([isinstance(item, dict) for item in items], dtype=bool)
+    if not is_item.all():
+        DIAGNOSTICS.skipped("receipt_items", "transform_error", *_first(receipt_ids[receipts], ~is_item),
+                            count=int((~is_item).sum()))  # Not an object: item.get() raises row by row
+    receipts, positions, items = receipts[is_item], positions[is_item], items[is_item]
+    if not len(items):
+        return ReceiptItemBatch()
+
+    item_receipt_ids = receipt_ids[receipts]
+    barcodes = _objects([item.get("barcode") for item in items])
+    item_ids = uuid5_array(RECEIPT_ITEM_NAMESPACE, [
+        f"{receipt_id}:{position}:{'' if barcode is None else barcode}"
+        for receipt_id, position, barcode in zip(item_receipt_ids, positions.tolist(), barcodes)
+    ])  # stable_item_id, a column at a time
+
+    brand_ids = pd.Series([BRAND_IDS(item.get("partnerItemId")) for item in items], dtype=object)
+    unknown_brands = (~is_known_key(brand_ids, valid_brand_ids)).to_numpy()
+    if unknown_brands.any():
+        DIAGNOSTICS.defaulted("receipt_items", "unknown_brand", *uuid_strings(
+            item_ids[unknown_brands][:DIAGNOSTICS.exemplar_limit]), count=int(unknown_brands.sum()))
+
+    quantity, bad_quantity = to_number_array([item.get("quantityPurchased") for item in items], 1, integer=True)
+    price, bad_price = to_number_array([item.get("finalPrice") for item in items], 0.00)
+    bad_items = bad_quantity | bad_price
+    if bad_items.any():
+        DIAGNOSTICS.skipped("receipt_items", "transform_error", *uuid_strings(
+            item_ids[bad_items][:DIAGNOSTICS.exemplar_limit]), count=int(bad_items.sum()))  # Non-numeric values
+
+    keep = ~bad_items
+    return ReceiptItemBatch.from_columns([
+        item_ids[keep], item_receipt_ids[keep],
+        brand_ids.where(~unknown_brands, DEFAULT_BRAND_ID).to_numpy()[keep], barcodes[keep],
+        quantity[keep], price[keep], scanned_dates[receipts][keep],
+    ])